@@ -0,0 +1,98 @@
+# backend/async_db.py
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import DB_POOL_SIZE, DB_MAX_OVERFLOW
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# --- Async Database Path ---
+# pyodbc and sqlite3 are blocking, so async routes hand their database work to
+# a dedicated thread pool instead of FastAPI's shared one. The pool is sized
+# to what the SQLAlchemy pool can serve at once: requests beyond that wait in
+# the executor's queue rather than in a pool checkout (which would time out),
+# and the event loop stays free for requests answered from memory.
+DB_ASYNC_MAX_CONCURRENCY = int(os.getenv("DB_ASYNC_MAX_CONCURRENCY", 0))  # 0 = pool size + overflow
+
+_executor = None
+_executor_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {
+    "submitted": 0,
+    "completed": 0,
+    "failed": 0,
+    "in_flight": 0,
+    "max_queue_wait_ms": 0.0,
+    "total_queue_wait_ms": 0.0
+}
+
+
+def get_max_concurrency() -> int:
+    return DB_ASYNC_MAX_CONCURRENCY or (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=get_max_concurrency(), thread_name_prefix="db")
+            logger.info(f"Async database executor started with {get_max_concurrency()} workers.")
+        return _executor
+
+def _run_timed(submitted_at: float, call):
+    wait_ms = (time.perf_counter() - submitted_at) * 1000
+    with _stats_lock:
+        _stats["in_flight"] += 1
+        _stats["total_queue_wait_ms"] += wait_ms
+        _stats["max_queue_wait_ms"] = max(_stats["max_queue_wait_ms"], wait_ms)
+    try:
+        return call()
+    finally:
+        with _stats_lock:
+            _stats["in_flight"] -= 1
+
+async def run_db(func, *args, **kwargs):
+    """
+    Runs a blocking data-access function on the database executor and awaits
+    its result. Context variables of the calling task are carried over.
+    """
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    with _stats_lock:
+        _stats["submitted"] += 1
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(_get_executor(), _run_timed, time.perf_counter(), call)
+    except Exception:
+        with _stats_lock:
+            _stats["failed"] += 1
+        raise
+    with _stats_lock:
+        _stats["completed"] += 1
+    return result
+
+def get_async_db_stats() -> dict:
+    """Returns executor size, queue depth and queue wait times."""
+    with _stats_lock:
+        stats = dict(_stats)
+    total_wait_ms = stats.pop("total_queue_wait_ms")
+    started = stats["completed"] + stats["failed"] + stats["in_flight"]
+    stats["avg_queue_wait_ms"] = round(total_wait_ms / started, 3) if started else None
+    stats["max_queue_wait_ms"] = round(stats["max_queue_wait_ms"], 3)
+    stats["queued"] = stats["submitted"] - started
+    stats["max_concurrency"] = get_max_concurrency()
+    return stats
+
+def shutdown_db_executor() -> None:
+    """Waits for running calls to finish and stops the executor."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+            _executor = None
+            logger.info("Async database executor stopped.")
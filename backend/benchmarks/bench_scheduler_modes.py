@@ -0,0 +1,134 @@
+# backend/benchmarks/bench_scheduler_modes.py
+"""
+Compares scheduler tick latency across the 'batched', 'serial' and 'parallel'
+execution modes against a stub database.
+
+The stub replaces the MSSQL calls made by device_service with functions that
+sleep for a fixed latency per statement and return plausible results, so the
+numbers reflect round trips and concurrency rather than a real server.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_scheduler_modes --buildings 300 --latency-ms 3
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.getcwd())
+
+from services import (device_service, proevent_service, cache_service,
+                      proserver_service, ignore_index_service, snapshot_service, event_service,
+                      history_service)
+from services.schedule_table import MINUTES_PER_DAY, ScheduleTable
+
+
+def install_stub_database(building_count: int, latency_ms: float, rows_per_building: int) -> dict:
+    """Patches device_service and friends to use an in-process stub. Returns call counters."""
+    calls = {"fetch_all": 0, "execute_query": 0}
+    latency = latency_ms / 1000
+
+    def ids_from(params, key):
+        value = params.get(key, "")
+        return [int(v) for v in value.split(",") if v]
+
+    def stub_fetch_all(sql, params=None):
+        calls["fetch_all"] += 1
+        time.sleep(latency)
+        params = params or {}
+        if "GROUP BY" in sql:
+            return [
+                {"building_id": building_id, "total": rows_per_building, "pending": rows_per_building // 2}
+                for building_id in ids_from(params, "building_ids")
+            ]
+        return []
+
+    def stub_execute_query(sql, params=None):
+        calls["execute_query"] += 1
+        time.sleep(latency)
+        params = params or {}
+        if "building_ids" in params:
+            return len(ids_from(params, "building_ids")) * (rows_per_building // 2)
+        return rows_per_building // 2
+
+    now = datetime.now()
+    minute = now.hour * 60 + now.minute
+    in_window = ((minute - 60) % MINUTES_PER_DAY, (minute + 60) % MINUTES_PER_DAY)
+    out_of_window = ((minute + 120) % MINUTES_PER_DAY, (minute + 180) % MINUTES_PER_DAY)
+    buildings = [{"id": i, "name": f"Building {i:05d}"} for i in range(1, building_count + 1)]
+    schedules = ScheduleTable([(b["id"], None, *(in_window if b["id"] % 2 else out_of_window))
+                               for b in buildings])
+
+    # Measure the statements themselves rather than snapshot reads.
+    snapshot_service.SNAPSHOT_ENABLED = False
+    history_service.HISTORY_ENABLED = False
+    device_service.fetch_all = stub_fetch_all
+    device_service.execute_query = stub_execute_query
+    device_service.get_distinct_buildings = lambda: buildings
+    proevent_service.get_schedule_table = lambda: schedules
+    proevent_service.check_for_changes = lambda: []
+    cache_service.get_cache_value = lambda key: True
+    proserver_service.send_proserver_notification = lambda **kwargs: True
+    event_service.publish = lambda event_type, data: None
+    ignore_index_service.get_ignored_ids_by_building = lambda: {
+        b["id"]: frozenset({b["id"] * 1000}) for b in buildings[::3]
+    }
+    return calls
+
+
+def run_mode(mode: str, runs: int, calls: dict) -> dict:
+    proevent_service.SCHEDULER_EXECUTION_MODE = mode
+    latencies = []
+    statements = 0
+    for _ in range(runs):
+        # Start from a cold applied-state record so every run does the writes.
+        device_service.invalidate_applied_states()
+        before = calls["fetch_all"] + calls["execute_query"]
+        started = time.perf_counter()
+        proevent_service.check_and_manage_scheduled_states()
+        latencies.append((time.perf_counter() - started) * 1000)
+        statements = calls["fetch_all"] + calls["execute_query"] - before
+    return {
+        "mode": mode,
+        "runs": runs,
+        "statements_per_tick": statements,
+        "min_ms": round(min(latencies), 2),
+        "median_ms": round(statistics.median(latencies), 2),
+        "max_ms": round(max(latencies), 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buildings", type=int, default=300)
+    parser.add_argument("--latency-ms", type=float, default=3.0, help="Simulated latency per statement")
+    parser.add_argument("--rows-per-building", type=int, default=250)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=8, help="Pool size for parallel mode")
+    parser.add_argument("--modes", default="batched,serial,parallel")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    calls = install_stub_database(args.buildings, args.latency_ms, args.rows_per_building)
+    proevent_service.SCHEDULER_MAX_WORKERS = args.workers
+
+    results = [run_mode(mode.strip(), args.runs, calls) for mode in args.modes.split(",")]
+
+    if args.json:
+        print(json.dumps({"buildings": args.buildings, "latency_ms": args.latency_ms,
+                          "workers": args.workers, "results": results}, indent=2))
+        return
+
+    print(f"{args.buildings} buildings, {args.latency_ms} ms per statement, {args.workers} workers")
+    print(f"{'mode':<10}{'stmts':>8}{'min ms':>12}{'median ms':>12}{'max ms':>12}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['statements_per_tick']:>8}{r['min_ms']:>12}{r['median_ms']:>12}{r['max_ms']:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+# backend/benchmarks/bench_suite.py
+"""
+End-to-end benchmark suite for the hot paths, for tracking regressions
+between releases.
+
+Every scale (number of buildings) runs in its own process against a freshly
+seeded SQLite stand-in for MSSQL (see mssql_standin.py), with an optional
+delay per statement to model the network, and a fake TCP ProServer (see
+fake_proserver.py). The real config.fetch_all/execute_query, services and
+routes are used; only the database server is replaced. Measured:
+
+    scheduler_tick            full check_and_manage_scheduled_states() with
+                              half the buildings changing state every run
+    scheduler_tick_steady     the same tick when nothing has changed
+    scheduler_tick_disarmed   a tick with the panel disarmed ('notarmed' alerts)
+    api_buildings             GET /api/buildings, served from the caches
+    api_buildings_cold        GET /api/buildings after dropping the caches
+    api_devices_page          first GET /api/devices/page of a building
+    api_devices_page_walk     every page of one building, 100 per page
+    ignore_bulk_save          POST /api/proevents/ignore/bulk toggling --ignore-items
+    ignore_bulk_reevaluate    the same with reevaluate=true
+    reevaluate_building       proevent_service.reevaluate_building_state(), re-verified
+                              against the database each run
+
+Results are written as JSON (--output) with the commit, Python version and
+settings, and --compare checks them against an earlier file. Run from the
+backend directory:
+
+    python -m benchmarks.bench_suite --scales 50,500,5000 --proevents-per-building 200 \\
+        --output bench.json
+    python -m benchmarks.bench_suite --scales 50,500 --compare bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BENCHMARKS = (
+    "scheduler_tick", "scheduler_tick_steady", "scheduler_tick_disarmed",
+    "api_buildings", "api_buildings_cold", "api_devices_page", "api_devices_page_walk",
+    "ignore_bulk_save", "ignore_bulk_reevaluate", "reevaluate_building"
+)
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def _summarize(name: str, latencies: list[float], statements: list[int], **extra) -> dict:
+    return {
+        "benchmark": name,
+        "runs": len(latencies),
+        "min_ms": round(min(latencies), 3),
+        "median_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(_percentile(latencies, 95), 3),
+        "max_ms": round(max(latencies), 3),
+        "statements_per_run": round(statistics.mean(statements), 1),
+        **extra
+    }
+
+
+# --- One Scale (child process) ---
+
+def run_scale(args) -> dict:
+    """Seeds the stand-in, runs every selected benchmark and returns the results."""
+    from benchmarks import mssql_standin
+    from benchmarks.fake_proserver import FakeProServer
+
+    workdir = tempfile.mkdtemp(prefix=f"bench-{args.buildings}-")
+    db_path = os.path.join(workdir, "standin.db")
+    seed_started = time.perf_counter()
+    mssql_standin.seed(db_path, args.buildings, args.proevents_per_building)
+    seed_seconds = time.perf_counter() - seed_started
+
+    proserver = FakeProServer().start()
+    # Read at import time by config, logger and proserver_service.
+    os.environ.update({
+        "DB_URL": f"sqlite:///{db_path}",
+        "PROSERVER_IP": proserver.host,
+        "PROSERVER_PORT": str(proserver.port),
+        "LOG_LEVEL": "WARNING",
+        "LOG_CONSOLE": "false",
+        "LOG_FILE": os.path.join(workdir, "app.log")
+    })
+    sys.path.insert(0, os.getcwd())
+    # Keep the schedules database and app cache out of the source tree.
+    os.chdir(workdir)
+
+    import config
+    from sqlalchemy import event
+    from fastapi.testclient import TestClient
+    from database_setup import migrate_sqlite_db
+    from sqlite_config import get_sqlite_connection, set_building_windows
+    from services import (cache_service, device_service, ignore_index_service, proevent_service,
+                          proserver_service)
+    from services.schedule_table import MINUTES_PER_DAY, invalidate_schedule_table
+    import main
+
+    mssql_standin.attach(config.engine, latency_ms=args.latency_ms)
+    config.engine.dispose()
+    statements = [0]
+
+    @event.listens_for(config.engine, "before_cursor_execute")
+    def _count(*_):
+        statements[0] += 1
+
+    migrate_sqlite_db()
+    ignore_index_service.rebuild_index()
+    proserver_service.start_dispatcher()
+    cache_service.set_cache_value("panel_armed", True)
+    # The lifespan (scheduler, watcher, refresher threads) is not started,
+    # so nothing runs in the background while measuring.
+    client = TestClient(main.app)
+
+    building_ids = list(range(1, args.buildings + 1))
+    minute = datetime.now().hour * 60 + datetime.now().minute
+    in_window = ((minute - 60) % MINUTES_PER_DAY, (minute + 60) % MINUTES_PER_DAY)
+    out_of_window = ((minute + 120) % MINUTES_PER_DAY, (minute + 180) % MINUTES_PER_DAY)
+
+    def set_schedules(flip: bool) -> None:
+        """Puts odd buildings inside their window (even ones if flip), in one transaction."""
+        with get_sqlite_connection():
+            for building_id in building_ids:
+                active = (building_id % 2 == 1) != flip
+                set_building_windows(building_id, [(None, *(in_window if active else out_of_window))])
+        invalidate_schedule_table()
+        device_service.invalidate_buildings_cache()
+
+    def measure(name: str, run, before=None, setup=None) -> dict:
+        if setup:
+            setup()
+        errors_before = proevent_service._tick_errors.labels().value
+        run()  # warm-up, not measured
+        latencies, counts = [], []
+        for i in range(args.runs):
+            if before:
+                before(i)
+            statements[0] = 0
+            started = time.perf_counter()
+            run()
+            latencies.append((time.perf_counter() - started) * 1000)
+            counts.append(statements[0])
+        errors = proevent_service._tick_errors.labels().value - errors_before
+        return _summarize(name, latencies, counts, **({"errors": errors} if errors else {}))
+
+    def get(path: str, expected: int = 200):
+        response = client.get(path)
+        if response.status_code != expected:
+            raise RuntimeError(f"GET {path} returned {response.status_code}: {response.text[:200]}")
+        return response
+
+    def post(path: str, body: dict):
+        response = client.post(path, json=body)
+        if response.status_code != 200:
+            raise RuntimeError(f"POST {path} returned {response.status_code}: {response.text[:200]}")
+        return response
+
+    sample_building = building_ids[len(building_ids) // 2]
+    sample_ids = [sample_building * 100000 + k
+                  for k in range(min(args.ignore_items, args.proevents_per_building))]
+    ignore_toggle = [False]
+
+    def toggle_ignores(reevaluate: bool):
+        ignore_toggle[0] = not ignore_toggle[0]
+        post("/api/proevents/ignore/bulk", {
+            "items": [{"item_id": i, "building_frk": sample_building, "device_prk": sample_building,
+                       "ignore": ignore_toggle[0]} for i in sample_ids],
+            "reevaluate": reevaluate
+        })
+
+    def walk_pages():
+        cursor = None
+        while True:
+            page = get(f"/api/devices/page?building={sample_building}&limit=100"
+                       + (f"&cursor={cursor}" if cursor else "")).json()
+            cursor = page["next_cursor"]
+            if not cursor:
+                return
+
+    def drop_building_caches(_):
+        device_service.invalidate_buildings_cache()
+        cache_service.delete_cache_value(device_service.SHARED_BUILDINGS_CACHE_KEY)
+
+    def tick_disarmed() -> dict:
+        cache_service.set_cache_value("panel_armed", False)
+        try:
+            return measure("scheduler_tick_disarmed", proevent_service.check_and_manage_scheduled_states)
+        finally:
+            cache_service.set_cache_value("panel_armed", True)
+
+    set_schedules(flip=False)
+    flips = [False]
+
+    def flip_schedules(_):
+        flips[0] = not flips[0]
+        set_schedules(flips[0])
+        device_service.get_distinct_buildings()
+
+    def reset_schedules():
+        """
+        The same starting point for the ignore and re-evaluate benchmarks,
+        however many times scheduler_tick flipped the schedules: the sample
+        building out of its window, so re-evaluating it is a disarm that
+        depends on its ignore rules.
+        """
+        flips[0] = False
+        set_schedules(flip=False)
+        set_building_windows(sample_building, [(None, *out_of_window)])
+        invalidate_schedule_table()
+        device_service.invalidate_buildings_cache()
+        device_service.invalidate_applied_states([sample_building])
+
+    runners = {
+        "scheduler_tick": lambda: measure("scheduler_tick", proevent_service.check_and_manage_scheduled_states,
+                                          before=flip_schedules),
+        "scheduler_tick_steady": lambda: measure("scheduler_tick_steady",
+                                                 proevent_service.check_and_manage_scheduled_states),
+        "scheduler_tick_disarmed": tick_disarmed,
+        "api_buildings": lambda: measure("api_buildings", lambda: get("/api/buildings")),
+        "api_buildings_cold": lambda: measure("api_buildings_cold", lambda: get("/api/buildings"),
+                                              before=drop_building_caches),
+        "api_devices_page": lambda: measure(
+            "api_devices_page", lambda: get(f"/api/devices/page?building={sample_building}&limit=100")),
+        "api_devices_page_walk": lambda: measure("api_devices_page_walk", walk_pages),
+        "ignore_bulk_save": lambda: measure("ignore_bulk_save", lambda: toggle_ignores(False),
+                                            setup=reset_schedules),
+        "ignore_bulk_reevaluate": lambda: measure("ignore_bulk_reevaluate", lambda: toggle_ignores(True),
+                                                  setup=reset_schedules),
+        # Without forgetting the applied state, a repeat re-evaluation writes nothing.
+        "reevaluate_building": lambda: measure(
+            "reevaluate_building", lambda: proevent_service.reevaluate_building_state(sample_building),
+            before=lambda _: device_service.invalidate_applied_states([sample_building]),
+            setup=reset_schedules),
+    }
+
+    results = []
+    for name in args.benchmarks.split(","):
+        name = name.strip()
+        if name not in runners:
+            raise SystemExit(f"Unknown benchmark '{name}'; choose from {', '.join(BENCHMARKS)}")
+        results.append({"buildings": args.buildings, **runners[name]()})
+
+    proserver_messages = proserver_service.get_dispatcher_stats()["enqueued"]
+    delivered = proserver.wait_for(proserver_messages, timeout=10)
+    proserver_service.stop_dispatcher()
+    proserver.stop()
+    return {
+        "buildings": args.buildings,
+        "proevents": args.buildings * args.proevents_per_building,
+        "seed_seconds": round(seed_seconds, 2),
+        "proserver_messages": len(proserver.messages),
+        "proserver_all_delivered": delivered,
+        "results": results
+    }
+
+
+# --- Orchestration ---
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(args) -> dict:
+    scales = []
+    for buildings in (int(s) for s in args.scales.split(",")):
+        output = tempfile.NamedTemporaryFile(suffix=".json", delete=False).name
+        subprocess.run([
+            sys.executable, "-m", "benchmarks.bench_suite", "--run-scale",
+            "--buildings", str(buildings), "--output", output,
+            "--proevents-per-building", str(args.proevents_per_building),
+            "--latency-ms", str(args.latency_ms), "--runs", str(args.runs),
+            "--ignore-items", str(args.ignore_items), "--benchmarks", args.benchmarks
+        ], check=True)
+        with open(output) as f:
+            scales.append(json.load(f))
+        os.remove(output)
+    return {
+        "suite": "bench_suite",
+        "version": 1,
+        "commit": _git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "proevents_per_building": args.proevents_per_building,
+            "latency_ms": args.latency_ms,
+            "runs": args.runs,
+            "ignore_items": args.ignore_items
+        },
+        "scales": scales
+    }
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Returns a line per benchmark whose median got slower than baseline by more than tolerance."""
+    previous = {(r["buildings"], r["benchmark"]): r
+                for scale in baseline["scales"] for r in scale["results"]}
+    regressions = []
+    for scale in report["scales"]:
+        for r in scale["results"]:
+            old = previous.get((r["buildings"], r["benchmark"]))
+            if not old or not old["median_ms"]:
+                continue
+            ratio = r["median_ms"] / old["median_ms"]
+            line = (f"{r['benchmark']:<26}{r['buildings']:>8}{old['median_ms']:>12}"
+                    f"{r['median_ms']:>12}{ratio:>8.2f}x")
+            print(line)
+            if ratio > 1 + tolerance:
+                regressions.append(line)
+    return regressions
+
+def print_report(report: dict) -> None:
+    settings = report["settings"]
+    print(f"{settings['proevents_per_building']} proevents per building, "
+          f"{settings['latency_ms']} ms per statement, {settings['runs']} runs")
+    print(f"{'benchmark':<26}{'bldgs':>8}{'median ms':>12}{'p95 ms':>12}{'max ms':>12}{'stmts':>8}")
+    for scale in report["scales"]:
+        for r in scale["results"]:
+            print(f"{r['benchmark']:<26}{r['buildings']:>8}{r['median_ms']:>12}{r['p95_ms']:>12}"
+                  f"{r['max_ms']:>12}{r['statements_per_run']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="50,500", help="Comma-separated building counts")
+    parser.add_argument("--proevents-per-building", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=0.5, help="Simulated latency per MSSQL statement")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ignore-items", type=int, default=200, help="Proevents toggled per bulk ignore save")
+    parser.add_argument("--benchmarks", default=",".join(BENCHMARKS))
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--compare", help="A previous --output file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed median slowdown before --compare fails (0.2 = 20%%)")
+    # Internal: run one scale.
+    parser.add_argument("--run-scale", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--buildings", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scale:
+        result = run_scale(args)
+        with open(args.output, "w") as f:
+            json.dump(result, f)
+        return
+
+    report = run_suite(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nAgainst {args.compare} (commit {baseline.get('commit')}):")
+        print(f"{'benchmark':<26}{'bldgs':>8}{'before ms':>12}{'after ms':>12}{'ratio':>9}")
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} benchmarks slower by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# backend/benchmarks/fake_proserver.py
+"""
+A local stand-in for ProServer: a TCP server that accepts connections and
+records every '@'-terminated message it receives.
+
+Run from the backend directory to exercise the notification dispatcher
+against it:
+
+    python -m benchmarks.fake_proserver
+"""
+
+import socket
+import threading
+import time
+
+
+class FakeProServer:
+    """
+    Listens on 127.0.0.1 (an ephemeral port by default) and collects messages.
+    Set drop_connections=True to close every connection after its first read,
+    which forces the dispatcher to reconnect.
+    """
+
+    def __init__(self, port: int = 0, response_delay: float = 0.0, drop_connections: bool = False):
+        self.response_delay = response_delay
+        self.drop_connections = drop_connections
+        self.messages = []
+        self.connections = 0
+        self.reads = 0
+        self._lock = threading.Lock()
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(("127.0.0.1", port))
+        self._server.listen()
+        self.host, self.port = self._server.getsockname()
+        self._running = False
+
+    def start(self):
+        self._running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self._server.close()
+
+    def wait_for(self, count: int, timeout: float = 5.0) -> bool:
+        """Waits until at least count messages have arrived."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if len(self.messages) >= count:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            with self._lock:
+                self.connections += 1
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        buffer = b""
+        with conn:
+            while self._running:
+                try:
+                    data = conn.recv(65536)
+                except OSError:
+                    return
+                if not data:
+                    return
+                if self.response_delay:
+                    time.sleep(self.response_delay)
+                buffer += data
+                *complete, buffer = buffer.split(b"@")
+                with self._lock:
+                    self.reads += 1
+                    self.messages.extend(m.decode() + "@" for m in complete)
+                if self.drop_connections:
+                    return
+
+
+if __name__ == "__main__":
+    import sys
+    import os
+    sys.path.insert(0, os.getcwd())
+    from services.proserver_service import NotificationDispatcher
+
+    server = FakeProServer().start()
+    dispatcher = NotificationDispatcher(server.host, server.port, dedupe_window=1.0, backoff_initial=0.05)
+    dispatcher.start()
+
+    for i in range(200):
+        dispatcher.enqueue(f"Axe,Building{i}_None@")
+    dispatcher.enqueue("Axe,Building0_None@")  # duplicate within the window
+    delivered = server.wait_for(200)
+
+    print(f"delivered={delivered} messages={len(server.messages)} reads={server.reads} "
+          f"connections={server.connections}")
+    print(dispatcher.get_stats())
+
+    dispatcher.stop()
+    server.stop()
@@ -0,0 +1,222 @@
+# backend/benchmarks/load_test.py
+"""
+Load test for the hot read endpoints (/api/panel_status, /api/buildings and
+/api/devices), comparing the original sync handlers with the async routes.
+
+Each variant is served by uvicorn in its own process against the SQLite
+stand-in for MSSQL (see mssql_standin.py), with a fixed delay per statement
+to model the network round trip. The client keeps --concurrency requests in
+flight and reports requests/sec and latency percentiles.
+
+Run from the backend directory:
+
+    python -m benchmarks.load_test --requests 5000 --concurrency 100 --latency-ms 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ENDPOINTS = ("panel_status", "buildings", "devices")
+
+
+# --- Server Side ---
+
+def build_app(variant: str):
+    """Returns a FastAPI app serving the three endpoints as 'sync' or 'async' handlers."""
+    from fastapi import APIRouter, FastAPI, HTTPException, Query
+    import routes
+
+    app = FastAPI()
+    if variant == "async":
+        app.include_router(routes.router, prefix="/api")
+        return app
+
+    # The handlers as they were before the async path: plain defs, each
+    # holding a threadpool slot for the whole request.
+    from services import cache_service, device_service, ignore_index_service, proevent_service
+
+    router = APIRouter()
+
+    @router.get("/panel_status")
+    def get_panel_status():
+        status = cache_service.get_cache_value('panel_armed')
+        if status is None:
+            status = True
+            cache_service.set_cache_value('panel_armed', status)
+        return {"armed": status}
+
+    @router.get("/buildings")
+    def list_buildings():
+        return [
+            {"id": b["id"], "name": b["name"],
+             "start_time": b.get("start_time", "09:00"), "end_time": b.get("end_time", "17:00")}
+            for b in device_service.get_distinct_buildings()
+        ]
+
+    @router.get("/devices")
+    def list_proevents(building: int | None = Query(default=None), search: str | None = Query(default=None),
+                       limit: int = Query(default=100, ge=1, le=1000), offset: int = Query(default=0, ge=0)):
+        if building is None:
+            raise HTTPException(status_code=400, detail="A building ID is required.")
+        proevents = proevent_service.get_all_proevents_for_building(
+            building_id=building, search=search, limit=limit, offset=offset
+        )
+        ignored_ids = ignore_index_service.get_ignored_ids(building)
+        return [
+            {"id": p["id"], "name": p["name"], "state": "armed" if p["reactive_state"] == 1 else "disarmed",
+             "building_name": None, "is_ignored": p["id"] in ignored_ids}
+            for p in proevents
+        ]
+
+    app.include_router(router, prefix="/api")
+    return app
+
+def serve(args):
+    import uvicorn
+
+    sys.path.insert(0, os.getcwd())
+    os.environ["DB_URL"] = f"sqlite:///{args.db}"
+    # Keep app.log and the schedules database out of the source tree.
+    os.chdir(args.workdir)
+
+    import config
+    from benchmarks import mssql_standin
+    from database_setup import migrate_sqlite_db
+
+    mssql_standin.attach(config.engine, latency_ms=args.latency_ms)
+    migrate_sqlite_db()
+    uvicorn.run(build_app(args.variant), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+# --- Client Side ---
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+async def drive(base_url: str, total: int, concurrency: int, buildings: int) -> dict:
+    rng = random.Random(7)
+    paths = []
+    for i in range(total):
+        endpoint = ENDPOINTS[i % len(ENDPOINTS)]
+        if endpoint == "devices":
+            paths.append(f"/api/devices?building={rng.randint(1, buildings)}&limit=100")
+        else:
+            paths.append(f"/api/{endpoint}")
+
+    latencies = []
+    errors = 0
+    pending = iter(paths)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def worker():
+            nonlocal errors
+            for path in pending:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": total,
+        "errors": errors,
+        "requests_per_sec": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p99_ms": round(_percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2)
+    }
+
+async def wait_until_ready(base_url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=2) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/api/panel_status")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not start within {timeout}s")
+
+def run_variant(variant: str, args, db_path: str, port: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f"loadtest-{variant}-")
+    server = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.load_test", "--serve",
+        "--variant", variant, "--port", str(port), "--db", db_path,
+        "--workdir", workdir, "--latency-ms", str(args.latency_ms)
+    ])
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        asyncio.run(wait_until_ready(base_url))
+        # Warm the caches and the connection pool before measuring.
+        asyncio.run(drive(base_url, min(300, args.requests), args.concurrency, args.buildings))
+        result = asyncio.run(drive(base_url, args.requests, args.concurrency, args.buildings))
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    return {"variant": variant, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Simulated latency per MSSQL statement")
+    parser.add_argument("--buildings", type=int, default=200)
+    parser.add_argument("--proevents-per-building", type=int, default=50)
+    parser.add_argument("--variants", default="sync,async")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    # Internal: run one server process.
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--variant", help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    from benchmarks import mssql_standin
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="loadtest-db-"), "standin.db")
+    mssql_standin.seed(db_path, args.buildings, args.proevents_per_building)
+
+    results = [run_variant(variant.strip(), args, db_path, args.port + i)
+               for i, variant in enumerate(args.variants.split(","))]
+
+    if args.json:
+        print(json.dumps({"concurrency": args.concurrency, "latency_ms": args.latency_ms,
+                          "results": results}, indent=2))
+        return
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {args.latency_ms} ms per statement")
+    print(f"{'variant':<10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>8}")
+    for r in results:
+        print(f"{r['variant']:<10}{r['requests_per_sec']:>10}{r['p50_ms']:>10}{r['p99_ms']:>10}"
+              f"{r['max_ms']:>10}{r['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
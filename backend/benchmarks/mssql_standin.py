@@ -0,0 +1,120 @@
+# backend/benchmarks/mssql_standin.py
+"""
+A local SQLite stand-in for the MSSQL database, for benchmarks and load tests.
+
+seed() creates and fills the three tables the backend reads (Building_TBL,
+Device_TBL, ProEvent_TBL). attach() makes an engine created from a sqlite://
+DB_URL accept the T-SQL the services send, and can add a fixed delay per
+statement to model the network round trip to the real server.
+
+Seed a database from the backend directory:
+
+    python -m benchmarks.mssql_standin --path /tmp/standin.db --buildings 500
+"""
+
+import argparse
+import os
+import random
+import re
+import sqlite3
+import time
+import zlib
+from sqlalchemy import event
+
+# (pattern, replacement) pairs applied to every statement, in order.
+TSQL_REWRITES = [
+    # STRING_SPLIT(?, ',') -> rows of a JSON array built from the same list
+    (re.compile(r"STRING_SPLIT\((\?), ','\)"), r"json_each('[' || \1 || ']')"),
+    (re.compile(r"OFFSET (\d+) ROWS\s+FETCH NEXT (\d+) ROWS ONLY"), r"LIMIT \2 OFFSET \1"),
+    # SET NOCOUNT ON; DECLARE @t TABLE (...); UPDATE ... OUTPUT inserted.a, ... INTO @t (x, ...)
+    # WHERE ...; SELECT ... FROM @t; -> UPDATE ... WHERE ... RETURNING a AS x, ...
+    (re.compile(r"^\s*SET NOCOUNT ON;\s*DECLARE @\w+ TABLE \([^)]*\);\s*(UPDATE .*?)"
+                r"OUTPUT\s+(.*?)\s+INTO @\w+ \(([^)]*)\)(.*?);\s*SELECT [^;]*;\s*$", re.S),
+     lambda m: "{}{} RETURNING {}".format(m.group(1), m.group(4), ", ".join(
+         f"{column.strip().replace('inserted.', '')} AS {name.strip()}"
+         for column, name in zip(m.group(2).split(","), m.group(3).split(","))
+     ))),
+]
+
+PANEL_DEVICE_TYPE = 138
+
+
+def translate(statement: str) -> str:
+    for pattern, replacement in TSQL_REWRITES:
+        statement = pattern.sub(replacement, statement)
+    return statement
+
+def _binary_checksum(*values) -> int:
+    return zlib.crc32(repr(values).encode()) - 2**31
+
+class _ChecksumAgg:
+    """CHECKSUM_AGG: order-independent XOR of the group's checksums."""
+
+    def __init__(self):
+        self.value = 0
+
+    def step(self, value):
+        if value is not None:
+            self.value ^= value
+
+    def finalize(self):
+        return self.value
+
+def attach(engine, latency_ms: float = 0.0) -> None:
+    """
+    Registers the T-SQL translation, the BINARY_CHECKSUM and CHECKSUM_AGG
+    functions, and an optional per-statement latency on an engine.
+    """
+    latency = latency_ms / 1000
+
+    @event.listens_for(engine, "connect")
+    def _register_functions(dbapi_connection, connection_record):
+        dbapi_connection.create_function("BINARY_CHECKSUM", -1, _binary_checksum, deterministic=True)
+        dbapi_connection.create_aggregate("CHECKSUM_AGG", 1, _ChecksumAgg)
+
+    @event.listens_for(engine, "before_cursor_execute", retval=True)
+    def _translate(conn, cursor, statement, parameters, context, executemany):
+        if latency:
+            time.sleep(latency)
+        return translate(statement), parameters
+
+def seed(path: str, buildings: int = 200, proevents_per_building: int = 50, seed_value: int = 1) -> None:
+    """(Re)creates the stand-in tables at path with deterministic contents."""
+    rng = random.Random(seed_value)
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE Building_TBL (Building_PRK INTEGER PRIMARY KEY, bldBuildingName_TXT TEXT);
+        CREATE TABLE Device_TBL (Device_PRK INTEGER PRIMARY KEY, dvcBuilding_FRK INT, dvcDeviceType_FRK INT,
+                                 dvcName_TXT TEXT, dvcCurrentState_TXT TEXT);
+        CREATE TABLE ProEvent_TBL (ProEvent_PRK INTEGER PRIMARY KEY, pevAlias_TXT TEXT,
+                                   pevBuilding_FRK INT, pevReactive_FRK INT);
+        CREATE INDEX idx_device_building ON Device_TBL (dvcBuilding_FRK, dvcDeviceType_FRK);
+        CREATE INDEX idx_proevent_building ON ProEvent_TBL (pevBuilding_FRK);
+    """)
+    conn.executemany("INSERT INTO Building_TBL VALUES (?, ?)",
+                     [(b, f"Building {b:05d}") for b in range(1, buildings + 1)])
+    conn.executemany("INSERT INTO Device_TBL VALUES (?, ?, ?, ?, ?)",
+                     [(b, b, PANEL_DEVICE_TYPE, f"Panel {b}",
+                       rng.choice(["AreaArmingStates.4", "AreaArmingStates.2"]))
+                      for b in range(1, buildings + 1)])
+    conn.executemany("INSERT INTO ProEvent_TBL VALUES (?, ?, ?, ?)",
+                     [(b * 100000 + k, f"Event {b}-{k:04d}", b, rng.randint(0, 1))
+                      for b in range(1, buildings + 1) for k in range(proevents_per_building)])
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", required=True)
+    parser.add_argument("--buildings", type=int, default=200)
+    parser.add_argument("--proevents-per-building", type=int, default=50)
+    args = parser.parse_args()
+    seed(args.path, args.buildings, args.proevents_per_building)
+    print(f"Seeded {args.path}: {args.buildings} buildings x {args.proevents_per_building} proevents")
+
+
+if __name__ == "__main__":
+    main()
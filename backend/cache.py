@@ -1,55 +1,154 @@
 import json
 import os
-from logger import get_logger
 import threading
+import time
+from logger import get_logger
+from sqlite_config import get_sqlite_connection
+from shared_state import NAMESPACE_CACHE, bump_version, register_listener
 
 logger = get_logger(__name__)
 
+# Legacy JSON cache file. Its contents are imported into the SQLite store the
+# first time the store is found empty.
 CACHE_FILE = "app_cache.json"
+
+# key -> (value, expires_at or None). Reads are served from here; every write
+# goes to the app_cache table first, in one transaction, and then here. Other
+# processes learn about the write through the shared 'cache' version and
+# reload from the store.
 _cache = {}
+# Guards _cache only and is never held during I/O, so reads (some of them on
+# the event loop) don't wait behind a slow SQLite transaction.
 _cache_lock = threading.Lock()
+# Serializes store reads and writes, so _cache is updated in the same order
+# the store was.
+_store_lock = threading.Lock()
+_loaded = False
+
+
+def _is_expired(expires_at, now: float) -> bool:
+    return expires_at is not None and expires_at <= now
 
-def load_cache():
+def _import_legacy_file(conn) -> dict:
+    """Copies the old JSON cache file into the store. Returns the imported entries."""
+    if not os.path.exists(CACHE_FILE):
+        return {}
+    try:
+        with open(CACHE_FILE, 'r') as f:
+            legacy = json.load(f)
+    except (IOError, json.JSONDecodeError) as e:
+        logger.error(f"Error reading legacy cache file {CACHE_FILE}: {e}. Skipping import.")
+        return {}
+
+    now = time.time()
+    conn.executemany(
+        "INSERT OR IGNORE INTO app_cache (key, value, expires_at, updated_at) VALUES (?, ?, NULL, ?)",
+        [(key, json.dumps(value), now) for key, value in legacy.items()]
+    )
+    logger.info(f"Imported {len(legacy)} keys from legacy cache file {CACHE_FILE}.")
+    return {key: (value, None) for key, value in legacy.items()}
+
+def load_cache(force: bool = False) -> dict:
     """
-    Load the cache from a JSON file into memory.
+    Load the cache from the SQLite store into memory. The store is read only
+    once unless force is True. If reading fails, the previous contents are
+    kept. Returns a dict of the live (unexpired) values.
     """
-    global _cache
+    global _cache, _loaded
+    if not _loaded or force:
+        with _store_lock:
+            if not _loaded or force:
+                now = time.time()
+                entries = {}
+                try:
+                    with get_sqlite_connection() as conn:
+                        rows = conn.execute("SELECT key, value, expires_at FROM app_cache").fetchall()
+                        for row in rows:
+                            if not _is_expired(row["expires_at"], now):
+                                entries[row["key"]] = (json.loads(row["value"]), row["expires_at"])
+                        if not rows:
+                            entries = _import_legacy_file(conn)
+                except Exception as e:
+                    # Keep what we have (e.g. panel_armed) rather than an empty
+                    # cache; a failed first load is retried on the next read.
+                    logger.error(f"Error loading cache store: {e}. Keeping {len(_cache)} cached keys.")
+                else:
+                    with _cache_lock:
+                        _cache = entries
+                        _loaded = True
+                    logger.info(f"Cache loaded from store ({len(entries)} keys).")
+
+    now = time.time()
     with _cache_lock:
-        if _cache:
-            return _cache
-        
-        if not os.path.exists(CACHE_FILE):
-            logger.warning(f"Cache file not found at {CACHE_FILE}. Creating a new one.")
-            _cache = {}
-            # --- FIX: Write the empty cache file directly instead of calling save_cache() ---
-            try:
-                with open(CACHE_FILE, 'w') as f:
-                    json.dump(_cache, f, indent=4)
-                logger.info("Cache file created.")
-            except IOError as e:
-                logger.error(f"Failed to create cache file: {e}")
-            # --- END OF FIX ---
-            return _cache
-
-        try:
-            with open(CACHE_FILE, 'r') as f:
-                _cache = json.load(f)
-                logger.info("Cache loaded from file.")
-                return _cache
-        except (IOError, json.JSONDecodeError) as e:
-            logger.error(f"Error loading cache file: {e}. Using empty cache.")
-            _cache = {}
-            return _cache
-
-def save_cache(cache_data):
+        return {
+            key: value for key, (value, expires_at) in _cache.items()
+            if not _is_expired(expires_at, now)
+        }
+
+def _ensure_loaded():
+    if not _loaded:
+        load_cache()
+
+def get_many(keys) -> dict:
+    """Returns {key: value} for the given keys that are present and unexpired."""
+    _ensure_loaded()
+    now = time.time()
+    result = {}
+    with _cache_lock:
+        for key in keys:
+            entry = _cache.get(key)
+            if entry is not None and not _is_expired(entry[1], now):
+                result[key] = entry[0]
+    return result
+
+def get_value(key, default=None):
+    """Returns the value for a key, or default if it is missing or expired."""
+    return get_many([key]).get(key, default)
+
+def set_many(values: dict, ttl: float | None = None) -> None:
     """
-    Save the in-memory cache to the JSON file.
+    Atomically writes several keys. All keys are written in one transaction,
+    so either every key changes or none do. With ttl (seconds), the keys
+    expire after that long. Expired rows are purged in the same transaction.
     """
-    global _cache
-    with _cache_lock:
-        _cache = cache_data
-        try:
-            with open(CACHE_FILE, 'w') as f:
-                json.dump(_cache, f, indent=4)
-        except IOError as e:
-            logger.error(f"Failed to save cache to file: {e}")
\ No newline at end of file
+    if not values:
+        return
+    _ensure_loaded()
+    now = time.time()
+    expires_at = now + ttl if ttl is not None else None
+    rows = [(key, json.dumps(value), expires_at, now) for key, value in values.items()]
+
+    with _store_lock:
+        with get_sqlite_connection() as conn:
+            conn.executemany("""
+                INSERT INTO app_cache (key, value, expires_at, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    value = excluded.value,
+                    expires_at = excluded.expires_at,
+                    updated_at = excluded.updated_at
+            """, rows)
+            conn.execute("DELETE FROM app_cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+            bump_version(NAMESPACE_CACHE, conn)
+        with _cache_lock:
+            for key, value in values.items():
+                _cache[key] = (value, expires_at)
+
+def set_value(key, value, ttl: float | None = None) -> None:
+    """Writes a single key. See set_many()."""
+    set_many({key: value}, ttl=ttl)
+
+def delete_value(key) -> None:
+    """Removes a key from the store and from memory."""
+    _ensure_loaded()
+    with _store_lock:
+        with get_sqlite_connection() as conn:
+            conn.execute("DELETE FROM app_cache WHERE key = ?", (key,))
+            bump_version(NAMESPACE_CACHE, conn)
+        with _cache_lock:
+            _cache.pop(key, None)
+
+def _reload_from_store():
+    load_cache(force=True)
+
+register_listener(NAMESPACE_CACHE, _reload_from_store)
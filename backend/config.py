@@ -1,20 +1,20 @@
 import os
-import logging
-from sqlalchemy import create_engine, text
+import sys
+import threading
+import time
+from sqlalchemy import create_engine, event, exc, text
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
-from contextlib import contextmanager
+from contextlib import ExitStack, contextmanager
 from urllib.parse import quote_plus
+from logger import get_logger
+import metrics
+import profiling
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s"
-)
-logger = logging.getLogger("config")
+logger = get_logger("config")
 
 # Build DB connection string
 DB_DRIVER = os.getenv("DB_DRIVER", "ODBC Driver 17 for SQL Server")
@@ -36,23 +36,198 @@ CONNECTION_STRING = (
     f"mssql+pyodbc://{DB_USER}:{DB_PASSWORD}@{DB_SERVER}/{DB_NAME}"
     f"?driver={encoded_driver}"
 )
+# DB_URL replaces the whole connection string, e.g. to point at the SQLite
+# stand-in used by the benchmarks.
+CONNECTION_STRING = os.getenv("DB_URL") or CONNECTION_STRING
 logger.debug("Connection string created successfully")
 
-# Create SQLAlchemy engine
-try:
-    engine = create_engine(CONNECTION_STRING, echo=False, future=True)
-    logger.info("SQLAlchemy engine created successfully")
-except Exception as e:
-    logger.error(f"Error creating engine: {e}")
-    raise
+# --- Connection Pool Settings ---
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", 10))     # Wait for a free connection
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", 1800))     # Replace connections older than this
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_POOL_WARMUP_CONNECTIONS = int(os.getenv("DB_POOL_WARMUP_CONNECTIONS", 2))
+DB_LOGIN_TIMEOUT_SECONDS = int(os.getenv("DB_LOGIN_TIMEOUT_SECONDS", 5))
+DB_QUERY_TIMEOUT_SECONDS = int(os.getenv("DB_QUERY_TIMEOUT_SECONDS", 30))     # 0 disables the limit
+
+# --- Engine ---
+# Created on first use rather than at import, so importing the app (routes,
+# the benchmarks, a test) doesn't load the ODBC driver, and the server can
+# start and answer liveness checks while the database is unreachable.
+# config.engine and config.SessionLocal still work; they go through
+# get_engine() and get_session_factory().
+_engine = None
+_session_factory = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """Returns the SQLAlchemy engine, creating it (and loading the driver) on first call."""
+    global _engine
+    if _engine is not None:
+        return _engine
+    with _engine_lock:
+        if _engine is None:
+            started = time.perf_counter()
+            try:
+                engine = create_engine(
+                    CONNECTION_STRING,
+                    echo=False,
+                    future=True,
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_MAX_OVERFLOW,
+                    pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+                    pool_recycle=DB_POOL_RECYCLE_SECONDS,
+                    pool_pre_ping=DB_POOL_PRE_PING,
+                    # pyodbc passes this to the driver as the login timeout
+                    connect_args={"timeout": DB_LOGIN_TIMEOUT_SECONDS}
+                )
+            except Exception as e:
+                logger.error(f"Error creating engine: {e}")
+                raise
+            _install_pool_listeners(engine)
+            _engine = engine
+            logger.info(
+                f"SQLAlchemy engine created in {(time.perf_counter() - started) * 1000:.0f} ms "
+                f"(pool_size={DB_POOL_SIZE}, max_overflow={DB_MAX_OVERFLOW}, "
+                f"recycle={DB_POOL_RECYCLE_SECONDS}s, pre_ping={DB_POOL_PRE_PING})"
+            )
+    return _engine
+
+def engine_created() -> bool:
+    return _engine is not None
+
+def get_session_factory():
+    global _session_factory
+    if _session_factory is None:
+        _session_factory = sessionmaker(bind=get_engine(), autoflush=False, autocommit=False)
+    return _session_factory
+
+def __getattr__(name):
+    # Module-level attributes kept for existing callers (config.engine).
+    if name == "engine":
+        return get_engine()
+    if name == "SessionLocal":
+        return get_session_factory()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# --- Pool Statistics ---
+# Kept up to date by pool events. Checkout wait time is measured around
+# engine.connect() in _checkout(), since the pool has no event for it.
+_pool_stats_lock = threading.Lock()
+_pool_stats = {
+    "connections_created": 0,
+    "connections_closed": 0,
+    "checkouts": 0,
+    "invalidations": 0,
+    "checkout_timeouts": 0,
+    "total_wait_ms": 0.0,
+    "max_wait_ms": 0.0
+}
+_connection_created_at = {}  # id(connection record) -> time.monotonic() at connect
+
+def _on_connect(dbapi_connection, connection_record):
+    with _pool_stats_lock:
+        _pool_stats["connections_created"] += 1
+        _connection_created_at[id(connection_record)] = time.monotonic()
+    if DB_QUERY_TIMEOUT_SECONDS and hasattr(dbapi_connection, "timeout"):
+        # pyodbc applies this to every statement run on the connection
+        dbapi_connection.timeout = DB_QUERY_TIMEOUT_SECONDS
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    with _pool_stats_lock:
+        _pool_stats["checkouts"] += 1
 
-# Create session factory
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    with _pool_stats_lock:
+        _pool_stats["invalidations"] += 1
+    logger.warning(f"Database connection invalidated: {exception}")
+
+def _on_close(dbapi_connection, connection_record):
+    with _pool_stats_lock:
+        _pool_stats["connections_closed"] += 1
+        _connection_created_at.pop(id(connection_record), None)
+
+def _install_pool_listeners(engine) -> None:
+    event.listen(engine, "connect", _on_connect)
+    event.listen(engine, "checkout", _on_checkout)
+    event.listen(engine, "invalidate", _on_invalidate)
+    event.listen(engine, "close", _on_close)
+
+@contextmanager
+def _checkout(begin: bool = False):
+    """Checks out a pooled connection, recording how long the wait took."""
+    started = time.perf_counter()
+    try:
+        conn = get_engine().connect()
+    except exc.TimeoutError:
+        with _pool_stats_lock:
+            _pool_stats["checkout_timeouts"] += 1
+        raise
+    wait_ms = (time.perf_counter() - started) * 1000
+    with _pool_stats_lock:
+        _pool_stats["total_wait_ms"] += wait_ms
+        _pool_stats["max_wait_ms"] = max(_pool_stats["max_wait_ms"], wait_ms)
+    with conn:
+        if begin:
+            with conn.begin():
+                yield conn
+        else:
+            yield conn
+
+def get_pool_stats() -> dict:
+    """
+    Returns the pool's current occupancy plus cumulative checkout statistics.
+    Doesn't create the engine; before first use the occupancy fields are None.
+    """
+    pool = _engine.pool if _engine is not None else None
+    now = time.monotonic()
+    with _pool_stats_lock:
+        stats = dict(_pool_stats)
+        ages = [now - created for created in _connection_created_at.values()]
+    total_wait_ms = stats.pop("total_wait_ms")
+    stats["avg_wait_ms"] = round(total_wait_ms / stats["checkouts"], 3) if stats["checkouts"] else None
+    stats["max_wait_ms"] = round(stats["max_wait_ms"], 3)
+    stats.update({
+        "engine_created": pool is not None,
+        "pool_size": pool.size() if hasattr(pool, "size") else None,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+        "idle": pool.checkedin() if hasattr(pool, "checkedin") else None,
+        "open_connections": len(ages),
+        "oldest_connection_age_seconds": round(max(ages), 1) if ages else None,
+        "avg_connection_age_seconds": round(sum(ages) / len(ages), 1) if ages else None,
+        "recycle_seconds": DB_POOL_RECYCLE_SECONDS,
+        "pre_ping": DB_POOL_PRE_PING
+    })
+    return stats
+
+def warm_up_pool(connections: int = DB_POOL_WARMUP_CONNECTIONS) -> int:
+    """
+    Opens up to `connections` pooled connections and returns them to the pool,
+    so the first requests after startup don't pay the login cost. Failures are
+    logged rather than raised; the app can still start while the database is down.
+    """
+    connections = min(connections, DB_POOL_SIZE)
+    opened = 0
+    started = time.perf_counter()
+    # Hold every connection until the end so each one is a new login.
+    with ExitStack() as stack:
+        try:
+            for _ in range(connections):
+                conn = stack.enter_context(_checkout())
+                conn.execute(text("SELECT 1"))
+                opened += 1
+        except Exception as e:
+            logger.error(f"Database pool warm-up stopped after {opened} connections: {e}")
+    logger.info(f"Database pool warmed up with {opened} connections in "
+                f"{(time.perf_counter() - started) * 1000:.0f} ms")
+    return opened
 
 def health_check():
     """Verifies database connection by executing a simple query."""
     try:
-        with engine.connect() as conn:
+        with _checkout() as conn:
             conn.execute(text("SELECT 1"))
         logger.info("Database connection successful for health check")
         return True
@@ -65,15 +240,49 @@ def get_db_connection():
     """
     Provide a transactional scope around a series of operations.
     """
-    db = SessionLocal()
+    db = get_session_factory()()
     try:
         yield db
     finally:
         db.close()
 
+# --- Query Metrics ---
+# Every call is timed per operation and per call site (the service function
+# that issued it), so a slow query shows up under its own name in /metrics.
+_query_seconds = metrics.histogram(
+    "mssql_query_duration_seconds",
+    "MSSQL call latency, including the pool checkout.",
+    ("operation", "site")
+)
+_query_errors = metrics.counter(
+    "mssql_query_errors_total",
+    "MSSQL calls that raised.",
+    ("operation", "site")
+)
+
+def _call_site() -> str:
+    """
+    module.function of whoever called the fetch/execute helper calling this.
+    Helpers shared by several callers pass site= explicitly instead.
+    """
+    frame = sys._getframe(2)
+    return f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}"
+
+@contextmanager
+def _timed(operation: str, site: str):
+    started = time.perf_counter()
+    try:
+        with profiling.span(f"mssql.{operation}", site=site):
+            yield
+    except Exception:
+        _query_errors.labels(operation, site).inc()
+        raise
+    finally:
+        _query_seconds.labels(operation, site).observe(time.perf_counter() - started)
+
 def fetch_one(query: str, params: dict = None):
     """Fetch a single row."""
-    with engine.connect() as conn:
+    with _timed("fetch_one", _call_site()), _checkout() as conn:
         result = conn.execute(text(query), params or {})
         row = result.fetchone()
         return dict(row._mapping) if row else None
@@ -81,14 +290,21 @@ def fetch_one(query: str, params: dict = None):
 
 def fetch_all(query: str, params: dict = None):
     """Fetch all rows."""
-    with engine.connect() as conn:
+    with _timed("fetch_all", _call_site()), _checkout() as conn:
         result = conn.execute(text(query), params or {})
         rows = result.fetchall()
         return [dict(row._mapping) for row in rows]
 
 
-def execute_query(query: str, params: dict = None):
+def execute_query(query: str, params: dict = None, site: str = None):
     """Execute insert/update/delete query and return affected row count."""
-    with engine.begin() as conn:  # begin ensures commit/rollback
+    with _timed("execute_query", site or _call_site()), _checkout(begin=True) as conn:  # begin ensures commit/rollback
+        result = conn.execute(text(query), params or {})
+        return result.rowcount
+
+
+def execute_returning(query: str, params: dict = None, site: str = None):
+    """Execute a write with an OUTPUT clause in a transaction and return the output rows."""
+    with _timed("execute_returning", site or _call_site()), _checkout(begin=True) as conn:
         result = conn.execute(text(query), params or {})
-        return result.rowcount
\ No newline at end of file
+        return [dict(row._mapping) for row in result.fetchall()]
\ No newline at end of file
@@ -1,3 +1,4 @@
+import argparse
 import sqlite3
 import os
 from logger import get_logger
@@ -7,6 +8,175 @@ logger = get_logger(__name__)
 # The name of your database file
 SQLITE_DB_PATH = "building_schedules.db"
 
+# --- Schema Migrations ---
+# Each migration is (version, description, statements). Migrations only add
+# to the schema or drop indexes nothing uses, never data, so they are safe to
+# run against a live database. The
+# highest applied version is stored in SQLite's PRAGMA user_version.
+MIGRATIONS = [
+    (1, "Base tables", [
+        """
+        CREATE TABLE IF NOT EXISTS building_times (
+            building_id INTEGER PRIMARY KEY,
+            start_time TEXT NOT NULL,
+            end_time TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS update_building_times_timestamp
+        AFTER UPDATE ON building_times
+        BEGIN
+            UPDATE building_times SET updated_at = CURRENT_TIMESTAMP
+            WHERE building_id = NEW.building_id;
+        END
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ignored_proevents (
+            proevent_id INTEGER PRIMARY KEY,
+            building_frk INTEGER NOT NULL,
+            device_prk INTEGER NOT NULL,
+            ignore_on_arm BOOLEAN NOT NULL DEFAULT 0,
+            ignore_on_disarm BOOLEAN NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS proevent_state_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            proevent_id INTEGER NOT NULL,
+            building_frk INTEGER NOT NULL,
+            state TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (2, "Indexes for per-building lookups", [
+        """
+        CREATE INDEX IF NOT EXISTS idx_ignored_proevents_building
+        ON ignored_proevents (building_frk, ignore_on_disarm)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_proevent_state_history_building
+        ON proevent_state_history (building_frk, timestamp)
+        """,
+    ]),
+    (3, "Key-value table for the application cache", [
+        """
+        CREATE TABLE IF NOT EXISTS app_cache (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            expires_at REAL,
+            updated_at REAL NOT NULL
+        )
+        """,
+    ]),
+    (4, "Version counters for state shared between processes", [
+        """
+        CREATE TABLE IF NOT EXISTS state_versions (
+            namespace TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """,
+    ]),
+    (5, "Lease row for scheduler leader election", [
+        """
+        CREATE TABLE IF NOT EXISTS scheduler_lease (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            acquired_at REAL NOT NULL,
+            renewed_at REAL NOT NULL,
+            failovers INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+    ]),
+    (6, "Schedule windows as minute-of-day integers", [
+        """
+        CREATE TABLE IF NOT EXISTS building_schedule_windows (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            building_id INTEGER NOT NULL,
+            weekday INTEGER CHECK (weekday BETWEEN 0 AND 6),  -- 0 = Monday; NULL = every day
+            start_minute INTEGER NOT NULL CHECK (start_minute BETWEEN 0 AND 1439),
+            end_minute INTEGER NOT NULL CHECK (end_minute BETWEEN 0 AND 1439)
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_schedule_windows_building
+        ON building_schedule_windows (building_id)
+        """,
+        # Every existing "HH:MM" schedule becomes one everyday window.
+        """
+        INSERT INTO building_schedule_windows (building_id, weekday, start_minute, end_minute)
+        SELECT building_id, NULL,
+               CAST(substr(start_time, 1, instr(start_time, ':') - 1) AS INTEGER) * 60
+                   + CAST(substr(start_time, instr(start_time, ':') + 1) AS INTEGER),
+               CAST(substr(end_time, 1, instr(end_time, ':') - 1) AS INTEGER) * 60
+                   + CAST(substr(end_time, instr(end_time, ':') + 1) AS INTEGER)
+        FROM building_times
+        WHERE (start_time GLOB '[0-9]:[0-5][0-9]' OR start_time GLOB '[0-2][0-9]:[0-5][0-9]')
+          AND (end_time GLOB '[0-9]:[0-5][0-9]' OR end_time GLOB '[0-2][0-9]:[0-5][0-9]')
+          AND CAST(substr(start_time, 1, instr(start_time, ':') - 1) AS INTEGER) < 24
+          AND CAST(substr(end_time, 1, instr(end_time, ':') - 1) AS INTEGER) < 24
+        """,
+    ]),
+    (7, "Relay table for live events between processes", [
+        """
+        CREATE TABLE IF NOT EXISTS live_events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            origin TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """,
+    ]),
+    (8, "Scheduler watermark on the lease row", [
+        # The last schedule transition the leader acted on; a new leader
+        # catches up from here.
+        "ALTER TABLE scheduler_lease ADD COLUMN last_transition_at REAL",
+    ]),
+    (9, "Drop the per-building ignore index", [
+        # Ignore rules are read whole into ignore_index_service; nothing
+        # queries them by building, so the index only slowed writes.
+        "DROP INDEX IF EXISTS idx_ignored_proevents_building",
+    ]),
+]
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Returns the highest migration version applied to the database."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate_sqlite_db(db_path: str = SQLITE_DB_PATH) -> int:
+    """
+    Applies any pending migrations without touching existing data.
+    Each migration runs in its own transaction. Returns the schema version.
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        current_version = get_schema_version(conn)
+        for version, description, statements in MIGRATIONS:
+            if version <= current_version:
+                continue
+            logger.info(f"Applying SQLite migration {version}: {description}")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            current_version = version
+
+        logger.info(f"SQLite schema is at version {current_version}.")
+        return current_version
+    except Exception as e:
+        logger.error(f"Error migrating SQLite database: {e}")
+        raise
+    finally:
+        conn.close()
+
 def init_sqlite_db():
     """
     Completely rebuilds the SQLite database with the correct schema.
@@ -23,53 +193,8 @@ def init_sqlite_db():
         logger.info(f"Removed old database file: {SQLITE_DB_PATH}")
 
     try:
-        with sqlite3.connect(SQLITE_DB_PATH) as conn:
-            logger.info("Creating new database and tables...")
-
-            # Table for building schedules
-            conn.execute("""
-                CREATE TABLE building_times (
-                    building_id INTEGER PRIMARY KEY,
-                    start_time TEXT NOT NULL,
-                    end_time TEXT,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-
-            # Trigger to update the updated_at timestamp
-            conn.execute("""
-                CREATE TRIGGER update_building_times_timestamp
-                AFTER UPDATE ON building_times
-                BEGIN
-                    UPDATE building_times SET updated_at = CURRENT_TIMESTAMP
-                    WHERE building_id = NEW.building_id;
-                END
-            """)
-
-            # CORRECTED: Table for ignored proevents with new columns
-            conn.execute("""
-                CREATE TABLE ignored_proevents (
-                    proevent_id INTEGER PRIMARY KEY,
-                    building_frk INTEGER NOT NULL,
-                    device_prk INTEGER NOT NULL,
-                    ignore_on_arm BOOLEAN NOT NULL DEFAULT 0,
-                    ignore_on_disarm BOOLEAN NOT NULL DEFAULT 0
-                )
-            """)
-
-            # CORRECTED: Table for ProEvent state history with new column
-            conn.execute("""
-                CREATE TABLE proevent_state_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    proevent_id INTEGER NOT NULL,
-                    building_frk INTEGER NOT NULL,
-                    state TEXT NOT NULL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-
-            conn.commit()
+        logger.info("Creating new database and tables...")
+        migrate_sqlite_db(SQLITE_DB_PATH)
         logger.info("SQLite database initialized successfully with the correct schema.")
         print("\nDatabase setup complete")
 
@@ -79,4 +204,15 @@ def init_sqlite_db():
         raise
 
 if __name__ == "__main__":
-    init_sqlite_db()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Set up the SQLite database.")
+    parser.add_argument(
+        "--rebuild", action="store_true",
+        help="Delete the database and recreate it from scratch (destroys all data)."
+    )
+    args = parser.parse_args()
+
+    if args.rebuild:
+        init_sqlite_db()
+    else:
+        version = migrate_sqlite_db()
+        print(f"\nDatabase migrated to schema version {version}")
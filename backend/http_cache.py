@@ -0,0 +1,96 @@
+# backend/http_cache.py
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from fastapi import Request, Response
+from logger import get_logger
+
+try:
+    import orjson
+except ImportError:  # optional; the standard library encoder is the fallback
+    orjson = None
+
+logger = get_logger(__name__)
+
+# --- Encoded Responses With ETags ---
+# The dashboard re-requests the same building and proevent lists all day.
+# Each list is encoded to JSON once per version of its data and kept here
+# with a content-hash ETag, so a repeat request is answered either with a
+# 304 (the client already has it) or with the stored bytes, without
+# rebuilding or re-serializing the models. The version is whatever the
+# caller can cheaply tell has changed: the cached buildings list object, a
+# proevent snapshot's load time, the ignore set. ETags are weak so they
+# stay valid through the compression middleware.
+HTTP_CACHE_MAX_ENTRIES = int(os.getenv("HTTP_CACHE_MAX_ENTRIES", 512))
+
+# key -> (version, etag, body)
+_entries = OrderedDict()
+_entries_lock = threading.Lock()
+
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "not_modified": 0,
+    "encoder": "orjson" if orjson else "json"
+}
+
+
+def dumps(content) -> bytes:
+    """Encodes plain dicts/lists to JSON bytes, with orjson when it is installed."""
+    if orjson:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def _etag(body: bytes) -> str:
+    return f'W/"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+def lookup(key, version) -> tuple[str, bytes] | None:
+    """Returns the stored (etag, body) for key if it was encoded from this version."""
+    if version is None:
+        return None
+    with _entries_lock:
+        entry = _entries.get(key)
+        if entry is None or entry[0] != version:
+            _stats["misses"] += 1
+            return None
+        _entries.move_to_end(key)
+        _stats["hits"] += 1
+        return entry[1], entry[2]
+
+def encode(key, version, content) -> tuple[str, bytes]:
+    """Encodes content and, if a version is given, stores it under key. Returns (etag, body)."""
+    body = dumps(content)
+    etag = _etag(body)
+    if version is not None:
+        with _entries_lock:
+            _entries[key] = (version, etag, body)
+            _entries.move_to_end(key)
+            while len(_entries) > HTTP_CACHE_MAX_ENTRIES:
+                _entries.popitem(last=False)
+    return etag, body
+
+def _matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/"x" and "x" name the same representation.
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+def json_response(request: Request, etag: str, body: bytes) -> Response:
+    """A 200 with the body, or an empty 304 if the client's If-None-Match matches."""
+    # no-cache: the browser keeps the body but revalidates on every use.
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _matches(request.headers.get("if-none-match"), etag):
+        with _entries_lock:
+            _stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def get_http_cache_stats() -> dict:
+    with _entries_lock:
+        return {**_stats, "entries": len(_entries), "max_entries": HTTP_CACHE_MAX_ENTRIES}
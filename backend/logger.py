@@ -1,6 +1,15 @@
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
+import re
 import sys
-from logging.handlers import RotatingFileHandler
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from dotenv import load_dotenv
 
 class StreamToLogger:
     """
@@ -44,30 +53,201 @@ class StreamToLogger:
             self.logger.log(self.log_level, message)
         self.linebuf = ''
 
-def get_logger(name: str):
+# --- Logging Pipeline ---
+# Loggers only put records on a bounded queue; one listener thread writes
+# them to the shared sinks (a single rotating app.log and, optionally, the
+# console). A request or scheduler tick therefore never waits on disk, and
+# only one handler ever rotates the file. If the queue is full the record is
+# dropped and counted rather than blocking the caller.
+#
+# Settings (read once, on the first get_logger() call):
+#   LOG_LEVEL                   root level (default DEBUG)
+#   LOG_LEVELS                  per-logger levels, e.g. "services.scheduler_service=INFO,config=WARNING"
+#   LOG_FORMAT                  "text" (default) or "json", one object per line
+#   LOG_FILE                    file sink path (default app.log); empty disables it
+#   LOG_CONSOLE                 also write to stderr (default true)
+#   LOG_QUEUE_SIZE              records buffered before dropping (default 10000)
+#   LOG_RATE_LIMIT_BURST        similar messages let through per window (default 5; 0 disables)
+#   LOG_RATE_LIMIT_WINDOW_SECONDS
+#
+# "Similar" means same logger, level and text once numbers are masked, so
+# "Skipping building 12 ..." and "Skipping building 13 ..." count together.
+# Errors and above are never rate-limited.
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_configured = False
+_configure_lock = threading.Lock()
+_listener = None
+_queue_handler = None
+_rate_limiter = None
+
+_stats_lock = threading.Lock()
+_stats = {
+    "enqueued": 0,
+    "dropped": 0,
+    "suppressed": 0
+}
+
+
+def _count(key: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats[key] += amount
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+class RateLimitFilter(logging.Filter):
     """
-    Configures and returns a logger that writes to app.log.
+    Lets through at most `burst` similar messages per `window` seconds.
+    The first message after a suppressed stretch reports how many were held
+    back.
     """
-    logger = logging.getLogger(name)
-    
-    # This check prevents adding handlers multiple times
-    if not logger.handlers:
-        logger.setLevel(logging.DEBUG)
-        
-        # Create a file handler to log to a file
-        handler = RotatingFileHandler("app.log", maxBytes=1024 * 1024, backupCount=5)
-        handler.setLevel(logging.DEBUG)
-        
-        # Create a formatter to define the structure of the log messages
-        formatter = logging.Formatter(
-            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    _NUMBERS = re.compile(r"\d+")
+    MAX_KEYS = 10000
+
+    def __init__(self, burst: int, window: float):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._windows = {}  # key -> [window_start, passed, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.burst <= 0 or record.levelno >= logging.ERROR:
+            return True
+        key = (record.name, record.levelno, self._NUMBERS.sub("#", str(record.msg)))
+        now = time.monotonic()
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                if len(self._windows) >= self.MAX_KEYS:
+                    self._prune(now)
+                self._windows[key] = [now, 1, 0]
+            elif state[1] < self.burst:
+                state[1] += 1
+                return True
+            else:
+                state[2] += 1
+                _count("suppressed")
+                return False
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = None
+        return True
+
+    def _prune(self, now: float) -> None:
+        for key in [k for k, state in self._windows.items() if now - state[0] >= self.window]:
+            del self._windows[key]
+        if len(self._windows) >= self.MAX_KEYS:
+            self._windows.clear()
+
+class _DroppingQueueHandler(QueueHandler):
+    """A QueueHandler that drops (and counts) records instead of blocking when full."""
+
+    def prepare(self, record):
+        # Merge the arguments into the message and render any traceback now,
+        # while they are still valid, but keep the traceback separate so the
+        # sink's formatter decides where it goes.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            _count("enqueued")
+        except queue.Full:
+            _count("dropped")
+
+def _parse_levels(spec: str) -> dict:
+    levels = {}
+    for part in spec.split(","):
+        name, _, level = part.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def configure_logging() -> None:
+    """Sets up the queue and the listener thread. Safe to call more than once."""
+    global _configured, _listener, _queue_handler, _rate_limiter
+    with _configure_lock:
+        if _configured:
+            return
+        load_dotenv()
+
+        formatter = (JsonFormatter() if os.getenv("LOG_FORMAT", "text").lower() == "json"
+                     else logging.Formatter(TEXT_FORMAT))
+        sinks = []
+        log_file = os.getenv("LOG_FILE", "app.log")
+        if log_file:
+            sinks.append(RotatingFileHandler(log_file, maxBytes=1024 * 1024, backupCount=5))
+        if os.getenv("LOG_CONSOLE", "true").lower() in ("1", "true", "yes"):
+            sinks.append(logging.StreamHandler(sys.__stderr__))
+        for sink in sinks:
+            sink.setFormatter(formatter)
+
+        _rate_limiter = RateLimitFilter(
+            burst=int(os.getenv("LOG_RATE_LIMIT_BURST", 5)),
+            window=float(os.getenv("LOG_RATE_LIMIT_WINDOW_SECONDS", 60))
         )
-        handler.setFormatter(formatter)
-        
-        # Add the configured handler to the logger
-        logger.addHandler(handler)
-        
-    return logger
+        _queue_handler = _DroppingQueueHandler(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", 10000))))
+        _queue_handler.addFilter(_rate_limiter)
+
+        root = logging.getLogger()
+        root.setLevel(os.getenv("LOG_LEVEL", "DEBUG").upper())
+        root.addHandler(_queue_handler)
+        # SQLAlchemy would otherwise log every statement at the root's DEBUG level.
+        levels = {"sqlalchemy": "WARNING", **_parse_levels(os.getenv("LOG_LEVELS", ""))}
+        for name, level in levels.items():
+            logging.getLogger(name).setLevel(level)
+
+        _listener = QueueListener(_queue_handler.queue, *sinks, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        _configured = True
+
+def shutdown_logging() -> None:
+    """Writes out everything still queued and stops the listener thread."""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        for sink in listener.handlers:
+            sink.close()
+
+def get_logger(name: str):
+    """
+    Returns a logger whose records go through the shared queue to app.log.
+    """
+    configure_logging()
+    return logging.getLogger(name)
+
+def get_logging_stats() -> dict:
+    """Returns enqueued, dropped and rate-limited record counts and the queue depth."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["queue_depth"] = _queue_handler.queue.qsize() if _queue_handler else 0
+    stats["listener_running"] = _listener is not None
+    return stats
 
 def redirect_prints_to_logging(logger):
     """
@@ -1,35 +1,207 @@
+import time
+_import_started = time.perf_counter()  # before the imports below, which are most of the startup time
+
 import uvicorn
+import threading
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from routes import router as device_router
-from config import health_check
-from services.scheduler_service import start_scheduler
-from services.cache_service import set_cache_value  # Import cache service
-from logger import get_logger
+from config import health_check, warm_up_pool, get_pool_stats, DB_POOL_WARMUP_CONNECTIONS
+from services.scheduler_service import start_scheduler, stop_scheduler, get_scheduler_status
+from services.cache_service import get_cache_value, set_cache_value  # Import cache service
+from services.ignore_index_service import rebuild_index, get_index_stats
+from services.proserver_service import start_dispatcher, stop_dispatcher, get_dispatcher_stats
+from services.snapshot_service import start_refresher, stop_refresher, get_snapshot_stats
+from services.event_service import start_broadcaster, get_event_stats
+from services.history_service import start_recorder, stop_recorder, get_history_stats
+from sqlite_config import close_sqlite_connections
+from async_db import shutdown_db_executor, get_async_db_stats
+from database_setup import migrate_sqlite_db
+from shared_state import start_watcher, stop_watcher
+from http_cache import get_http_cache_stats
+from logger import get_logger, get_logging_stats
+import metrics
+import profiling
 from contextlib import asynccontextmanager # Import asynccontextmanager
+import os
+
+try:
+    from brotli_asgi import BrotliMiddleware  # optional; gzip is used without it
+except ImportError:
+    BrotliMiddleware = None
 
 # Create the logger instance at the top of the file
 logger = get_logger(__name__)
 
+_imports_done = time.perf_counter()
+
+
+# --- Startup ---
+# The server starts accepting requests as soon as the local state is ready:
+# the SQLite schema, the ignore index, the panel status and the live-event
+# broadcaster. Everything that talks to MSSQL or ProServer (loading the ODBC
+# driver, warming up the pool, the dispatcher, snapshot refresher, history
+# recorder and scheduler) then starts in a background thread, so a restart
+# answers /live at once even while the database is unreachable. /ready
+# reports 503 until the background steps are done and MSSQL answers.
+#
+# Every step is timed; the timings are logged, returned by /ready and
+# exported in /metrics as startup_*. STARTUP_IN_BACKGROUND=false runs all of
+# it before serving, as before.
+STARTUP_IN_BACKGROUND = os.getenv("STARTUP_IN_BACKGROUND", "true").lower() in ("1", "true", "yes")
+READY_DB_CHECK_TTL_SECONDS = float(os.getenv("READY_DB_CHECK_TTL_SECONDS", 5))
+
+_startup_lock = threading.Lock()
+_startup = {
+    # starting -> initializing (serving, background steps running) -> started,
+    # or degraded if a background step raised
+    "phase": "starting",
+    "import_ms": None,
+    "serving_after_ms": None,
+    "started_after_ms": None,
+    "steps": {}  # name -> {"ms": ..., "ok": ...}, in the order they ran
+}
+_startup_thread = None
+_startup_cancel = threading.Event()
+_ready_db_check = {"ok": None, "checked_at": float("-inf")}
+_ready_db_check_lock = threading.Lock()
+
+
+def _elapsed_ms() -> float:
+    return round((time.perf_counter() - _import_started) * 1000, 1)
+
+def _run_step(name: str, step, raise_errors: bool = True) -> bool:
+    """Runs one startup step and records how long it took."""
+    started = time.perf_counter()
+    ok = True
+    try:
+        step()
+    except Exception as e:
+        ok = False
+        logger.error(f"Startup step '{name}' failed: {e}")
+        if raise_errors:
+            raise
+    finally:
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        with _startup_lock:
+            _startup["steps"][name] = {"ms": elapsed_ms, "ok": ok}
+    return ok
+
+def _init_panel_status():
+    # Initialize the global panel status (default to Armed). It is shared by
+    # every worker, so a restarting worker must not re-arm a disarmed panel.
+    try:
+        if get_cache_value('panel_armed') is None:
+            set_cache_value('panel_armed', True)
+            logger.info("Global panel status initialized to 'Armed'.")
+    except Exception as e:
+        logger.error(f"Failed to initialize panel status in cache: {e}")
+
+def _warm_up_pool():
+    # warm_up_pool() logs and swallows connection errors; fail the step (and
+    # mark startup degraded) if not a single connection could be opened.
+    if DB_POOL_WARMUP_CONNECTIONS > 0 and warm_up_pool() == 0:
+        raise RuntimeError("no MSSQL connection could be opened")
+
+# Steps that talk to MSSQL or ProServer, or start long-lived threads. In order:
+# the scheduler starts last, once the services it relies on are running.
+_DEFERRED_STEPS = (
+    # Load the ODBC driver and open a few MSSQL connections before the first request needs them
+    ("warm_up_pool", _warm_up_pool),
+    # Deliver ProServer notifications from a background connection
+    ("start_dispatcher", start_dispatcher),
+    # Load proevent snapshots and keep them verified in the background
+    ("start_refresher", start_refresher),
+    # Write proevent state history in batches off the request path
+    ("start_recorder", start_recorder),
+    ("start_scheduler", start_scheduler)
+)
+
+def _run_deferred_steps():
+    ok = True
+    for name, step in _DEFERRED_STEPS:
+        if _startup_cancel.is_set():
+            logger.info(f"Startup cancelled before '{name}'.")
+            return
+        ok = _run_step(name, step, raise_errors=False) and ok
+    with _startup_lock:
+        _startup["phase"] = "started" if ok else "degraded"
+        _startup["started_after_ms"] = _elapsed_ms()
+    logger.info(f"Startup finished {_startup['started_after_ms']:.0f} ms after import"
+                f"{'' if ok else ' with failed steps'}.")
+
+def get_startup_status() -> dict:
+    """Startup phase and per-step timings, in ms from when main was first imported."""
+    with _startup_lock:
+        status = dict(_startup, steps=dict(_startup["steps"]))
+    status["complete"] = status["phase"] in ("started", "degraded")
+    status["in_background"] = STARTUP_IN_BACKGROUND
+    return status
+
+def _database_reachable() -> bool:
+    """health_check(), cached for READY_DB_CHECK_TTL_SECONDS so frequent probes don't queue logins."""
+    with _ready_db_check_lock:
+        if time.monotonic() - _ready_db_check["checked_at"] >= READY_DB_CHECK_TTL_SECONDS:
+            _ready_db_check["ok"] = health_check()
+            _ready_db_check["checked_at"] = time.monotonic()
+        return _ready_db_check["ok"]
+
 
 # NEW: Use lifespan event handler instead of on_event
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global _startup_thread
     # Code to run on startup
     logger.info("Application startup event triggered.")
-    
-    # Initialize the global panel status (default to Armed)
-    try:
-        set_cache_value('panel_armed', True)
-        logger.info("Global panel status initialized to 'Armed'.")
-    except Exception as e:
-        logger.error(f"Failed to initialize panel status in cache: {e}")
-        
-    start_scheduler()
-    
+    with _startup_lock:
+        _startup.update(phase="starting", serving_after_ms=None, started_after_ms=None, steps={})
+        _startup["import_ms"] = round((_imports_done - _import_started) * 1000, 1)
+
+    # Bring the SQLite schema up to date (non-destructive)
+    _run_step("migrate_sqlite_db", migrate_sqlite_db)
+
+    # Load ignore rules into memory once; later changes are written through
+    _run_step("rebuild_index", rebuild_index)
+
+    # Push state changes to connected dashboards, including other processes' changes
+    _run_step("start_broadcaster", start_broadcaster)
+
+    # Follow state changes made by other worker processes
+    _run_step("start_watcher", start_watcher)
+
+    # Before serving, so a change made right after startup isn't overwritten
+    _run_step("init_panel_status", _init_panel_status)
+
+    _startup_cancel.clear()
+    if STARTUP_IN_BACKGROUND:
+        _startup_thread = threading.Thread(target=_run_deferred_steps, name="startup", daemon=True)
+        _startup_thread.start()
+    else:
+        _run_deferred_steps()
+
+    with _startup_lock:
+        _startup["serving_after_ms"] = _elapsed_ms()
+        if _startup["phase"] == "starting":
+            _startup["phase"] = "initializing"
+    logger.info(f"Serving {_startup['serving_after_ms']:.0f} ms after import "
+                f"(imports took {_startup['import_ms']:.0f} ms).")
+
     yield
     # Code to run on shutdown (if any)
     logger.info("Application shutting down.")
+    _startup_cancel.set()
+    if _startup_thread:
+        # Let a step in progress finish, so nothing is started after it's stopped below.
+        _startup_thread.join(timeout=30)
+    stop_scheduler()
+    stop_dispatcher()
+    stop_refresher()
+    stop_recorder()  # After the scheduler, so its last changes are written
+    stop_watcher()
+    shutdown_db_executor()
+    close_sqlite_connections()
 
 
 app = FastAPI(title="Amazon Device Control API", lifespan=lifespan) # Add lifespan to app
@@ -51,6 +223,21 @@ app.add_middleware(
 )
 # --- END OF FIX ---
 
+# Compress JSON responses large enough to benefit (the building and proevent
+# lists). Brotli is preferred when brotli-asgi is installed; it falls back to
+# gzip for clients that don't accept br.
+COMPRESSION_MIN_SIZE_BYTES = int(os.getenv("COMPRESSION_MIN_SIZE_BYTES", 1024))
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE_BYTES, gzip_fallback=True)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE_BYTES)
+
+# Profiles sampled requests and those sent with "X-Profile: 1" (PROFILING_ENABLED only).
+app.add_middleware(profiling.ProfilingMiddleware)
+
+# Outermost, so the time spent compressing is included.
+app.add_middleware(metrics.HttpMetricsMiddleware)
+
 
 # Add the /api prefix to all routes from routes.py
 app.include_router(device_router, prefix="/api")
@@ -71,6 +258,54 @@ def health():
     return {"status": "ok" if is_healthy else "error",
             "datastore": "accessible" if is_healthy else "inaccessible"}
 
+@app.get("/live")
+def live():
+    """
+    Liveness: the process is up and serving. Touches neither database, so it
+    answers during startup and while MSSQL is down.
+    """
+    return {"status": "ok", "phase": get_startup_status()["phase"]}
+
+@app.get("/ready")
+def ready():
+    """
+    Readiness: 200 once the background startup steps have finished (even if
+    some failed, e.g. MSSQL was down) and MSSQL answers, 503 otherwise.
+    Includes the startup timings.
+    """
+    status = get_startup_status()
+    datastore_ok = _database_reachable() if status["complete"] else None
+    is_ready = status["complete"] and bool(datastore_ok)
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={
+            "status": "ready" if is_ready else "not_ready",
+            "datastore": {True: "accessible", False: "inaccessible", None: "not_checked"}[datastore_ok],
+            "startup": status
+        }
+    )
+
+# The status endpoints' numbers, exported alongside the latency histograms.
+metrics.register_stats("scheduler", get_scheduler_status)
+metrics.register_stats("db_pool", get_pool_stats)
+metrics.register_stats("db_async_executor", get_async_db_stats)
+metrics.register_stats("proserver_dispatcher", get_dispatcher_stats)
+metrics.register_stats("proevent_snapshot", get_snapshot_stats)
+metrics.register_stats("proevent_history", get_history_stats)
+metrics.register_stats("ignore_index", get_index_stats)
+metrics.register_stats("live_events", get_event_stats)
+metrics.register_stats("http_cache", get_http_cache_stats)
+metrics.register_stats("logging", get_logging_stats)
+metrics.register_stats("startup", get_startup_status)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Latency histograms and counters for the scheduler, MSSQL, SQLite,
+    ProServer and HTTP routes, in the Prometheus text format.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/")
 def root():
     """
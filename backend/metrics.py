@@ -0,0 +1,303 @@
+# backend/metrics.py
+
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# --- In-Process Metrics ---
+# Counters, gauges and latency histograms for the hot paths (scheduler
+# ticks, MSSQL and SQLite calls, ProServer sends, HTTP routes), served at
+# /metrics in the Prometheus text format. prometheus_client is not a
+# dependency, so this is the small subset of it the app needs: recording
+# is an increment under a per-series lock, and all formatting happens
+# when /metrics is scraped. The existing *_stats dicts are exported too,
+# as gauges, through register_stats().
+#
+# Values are per process. When uvicorn runs several workers, each one
+# answers /metrics with its own numbers.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Seconds; from sub-millisecond SQLite reads up to a slow scheduler tick.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = {}  # name -> metric, in registration order
+_registry_lock = threading.Lock()
+_collectors = []  # (prefix, function returning a stats dict)
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_text(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+# --- Metric Types ---
+
+class _CounterChild:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        if METRICS_ENABLED:
+            with self._lock:
+                self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value):
+        if METRICS_ENABLED:
+            with self._lock:
+                self.value = value
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class _HistogramChild:
+    __slots__ = ("_lock", "_bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self._lock = threading.Lock()
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # per bucket, not cumulative; last is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        if not METRICS_ENABLED:
+            return
+        index = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        """Observes the duration of the with block, in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._children_lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Returns the series for these label values, in labelnames order."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._children_lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _series(self):
+        with self._children_lock:
+            return sorted(self._children.items())
+
+    def _render(self, lines: list) -> None:
+        for values, child in self._series():
+            lines.append(f"{self.name}{_label_text(self.labelnames, values)} {_format_value(child.value)}")
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _render(self, lines: list) -> None:
+        for values, child in self._series():
+            with child._lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, values, le)} {cumulative}")
+            labels = _label_text(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+
+# --- Registry ---
+
+def _register(cls, name: str, documentation: str, labelnames=(), **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, documentation, labelnames, **kwargs)
+        elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+            raise ValueError(f"Metric {name} is already registered with a different type or labels")
+        return metric
+
+def counter(name: str, documentation: str, labelnames=()) -> Counter:
+    """Registers (or returns the already registered) counter. Names should end in _total."""
+    return _register(Counter, name, documentation, labelnames)
+
+def gauge(name: str, documentation: str, labelnames=()) -> Gauge:
+    return _register(Gauge, name, documentation, labelnames)
+
+def histogram(name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+def register_stats(prefix: str, get_stats) -> None:
+    """
+    Exports the numeric values of a stats dict (e.g. get_pool_stats) as
+    gauges named <prefix>_<key>, nested dicts included. get_stats is called
+    on every scrape.
+    """
+    _collectors.append((prefix, get_stats))
+
+def _render_stats(prefix: str, stats: dict, lines: list) -> None:
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            _render_stats(name, value, lines)
+            continue
+        if isinstance(value, bool):
+            value = int(value)
+        elif not isinstance(value, (int, float)):
+            continue  # None, names, modes
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {_format_value(value)}")
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format (0.0.4)."""
+    lines = []
+    with _registry_lock:
+        metrics = list(_registry.values())
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        metric._render(lines)
+
+    for prefix, get_stats in _collectors:
+        try:
+            stats = get_stats()
+        except Exception as e:
+            logger.error(f"Failed to collect '{prefix}' stats for /metrics: {e}")
+            continue
+        _render_stats(prefix, stats, lines)
+    return "\n".join(lines) + "\n"
+
+# --- HTTP Instrumentation ---
+
+_http_request_seconds = histogram(
+    "http_request_duration_seconds",
+    "Time from receiving an HTTP request to sending the response headers.",
+    ("method", "route", "status")
+)
+
+
+def route_template(scope) -> str:
+    path = getattr(scope.get("route"), "path", None)
+    if path is None:
+        return "unmatched"
+    # A route in an included router knows only its own path, not the router's
+    # prefix (/api), so take the prefix's segments from the request path.
+    extra = scope["path"].rstrip("/").count("/") - path.rstrip("/").count("/")
+    if extra > 0:
+        path = "/".join(scope["path"].split("/")[:extra + 1]) + path
+    return path
+
+
+class HttpMetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request by method, route template
+    (e.g. /api/buildings/{building_id}/schedule, so IDs don't create new
+    series) and status code. Time is measured up to the response headers,
+    so long-lived SSE streams don't skew the histogram.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        observed = False
+
+        def observe(status):
+            nonlocal observed
+            observed = True
+            _http_request_seconds.labels(
+                scope["method"], route_template(scope), str(status)
+            ).observe(time.perf_counter() - started)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and not observed:
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            if not observed:
+                observe(500)
+            raise
@@ -18,6 +18,11 @@ class DeviceOut(BaseModel):
     # "is_ignored_on_arm" removed
     is_ignored: bool = False
 
+class DevicePage(BaseModel):
+    items: List[DeviceOut]
+    # Pass back as ?cursor= to get the next page; None on the last page
+    next_cursor: Optional[str] = None
+
 class DeviceActionRequest(BaseModel):
     building_id: int
     action: Literal["arm", "disarm"]
@@ -38,6 +43,20 @@ class BuildingTimeResponse(BaseModel):
     end_time: Optional[str]
     updated: bool
 
+class ScheduleWindow(BaseModel):
+    # 0 = Monday ... 6 = Sunday; None applies every day
+    weekday: Optional[int] = Field(default=None, ge=0, le=6)
+    start_time: str = Field(..., pattern=r"^([01]?[0-9]|2[0-3]):[0-5][0-9]$")
+    # An end before the start runs past midnight
+    end_time: str = Field(..., pattern=r"^([01]?[0-9]|2[0-3]):[0-5][0-9]$")
+
+class BuildingScheduleRequest(BaseModel):
+    windows: List[ScheduleWindow]
+
+class BuildingScheduleResponse(BaseModel):
+    building_id: int
+    windows: List[ScheduleWindow]
+
 # --- UPDATED Models for Ignored ProEvents ---
 
 class IgnoredItemRequest(BaseModel):
@@ -53,7 +72,18 @@ class IgnoredItemResponse(BaseModel):
     success: bool
 
 class IgnoredItemBulkRequest(BaseModel):
+    # Only the items that changed need to be sent; unchanged ones are skipped
     items: List[IgnoredItemRequest]
+    # Re-evaluate the affected buildings in the same request
+    reevaluate: bool = False
+
+class IgnoredItemBulkResponse(BaseModel):
+    status: str
+    ignored: List[int]
+    unignored: List[int]
+    unchanged: int
+    reevaluated: List[int]
+    timing_ms: dict
 
 # --- ADDED Model for Panel Status ---
 # This model remains, but the frontend UI for it is gone.
@@ -0,0 +1,355 @@
+# backend/profiling.py
+
+import asyncio
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from logger import get_logger
+from metrics import route_template
+
+logger = get_logger(__name__)
+
+# --- Opt-In Profiling ---
+# A profile covers one HTTP request or one scheduler tick. While one is
+# active, span() records nested, timed spans (the tick, each building or
+# apply phase, every MSSQL, SQLite and ProServer call inside it) through a
+# context variable, so spans follow the work into run_db() and the
+# scheduler's worker pool. A sampler thread meanwhile reads the Python
+# stacks of the threads the profile is running on every
+# PROFILE_SAMPLE_INTERVAL_MS, giving a wall-clock profile of the time
+# between the spans.
+#
+# Each profile is written to PROFILE_DIR as JSON (span tree and samples)
+# and in the collapsed-stack format read by flamegraph.pl and speedscope,
+# where every sampled stack is prefixed by the spans it was taken under.
+# The files are shared, so /api/debug/profiles on any worker lists the
+# profiles of every worker, the scheduler leader included.
+#
+# Nothing is recorded unless PROFILING_ENABLED is set. Then requests and
+# ticks are profiled at PROFILE_SAMPLE_RATE, and a request is always
+# profiled when it carries "X-Profile: 1". Without an active profile,
+# span() costs one context variable lookup.
+#
+# Stacks are sampled on the thread that began the profile, and on any
+# other thread while it is inside one of the profile's spans (run_db and
+# pool threads, the threadpool running a sync route's DB calls). Samples
+# from the event loop thread can include other requests that ran while an
+# async route was waiting; the spans themselves are exact.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))  # fraction of requests and ticks
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", 5))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 100))            # newest profiles kept on disk
+PROFILE_MAX_SPANS = int(os.getenv("PROFILE_MAX_SPANS", 20000))  # per profile; later spans are counted only
+PROFILE_HEADER = "x-profile"
+
+_current_span = contextvars.ContextVar("profile_span", default=None)
+
+_active = set()  # profiles being recorded
+_active_lock = threading.Lock()
+_sampler_thread = None
+_sampler_wake = threading.Event()
+
+
+class Span:
+    __slots__ = ("trace", "parent", "name", "attrs", "started", "duration", "thread", "children")
+
+    def __init__(self, trace, parent, name: str, attrs: dict):
+        self.trace = trace
+        self.parent = parent
+        self.name = name
+        self.attrs = attrs
+        self.started = time.perf_counter()
+        self.duration = None
+        self.thread = threading.current_thread().name
+        self.children = []
+
+    def to_dict(self, origin: float) -> dict:
+        return {
+            "name": self.name,
+            **({"attrs": self.attrs} if self.attrs else {}),
+            "thread": self.thread,
+            "start_ms": round((self.started - origin) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "children": [child.to_dict(origin) for child in self.children]
+        }
+
+
+class Trace:
+    """One profile: the root span, the spans each thread is in, and the stack samples."""
+
+    def __init__(self, name: str, kind: str, attrs: dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.created_at = time.time()
+        self.root = Span(self, None, name, attrs)
+        self.span_count = 1
+        self.dropped_spans = 0
+        self.thread_spans = {}  # thread id -> innermost open span on that thread
+        self.samples = Counter()  # collapsed stack -> count
+        self.lock = threading.Lock()
+
+# --- Spans ---
+
+def _span_path(span: Span) -> list[str]:
+    """Names of the open spans down to this one, without the root (named at the end)."""
+    names = []
+    while span.parent is not None:
+        names.append(span.name)
+        span = span.parent
+    return names[::-1]
+
+@contextmanager
+def _record(parent: Span, name: str, attrs: dict):
+    trace = parent.trace
+    span = Span(trace, parent, name, attrs)
+    thread_id = threading.get_ident()
+    with trace.lock:
+        parent.children.append(span)
+        previous = trace.thread_spans.get(thread_id)
+        trace.thread_spans[thread_id] = span
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        span.duration = time.perf_counter() - span.started
+        _current_span.reset(token)
+        with trace.lock:
+            if previous is None:
+                trace.thread_spans.pop(thread_id, None)
+            else:
+                trace.thread_spans[thread_id] = previous
+
+def span(name: str, **attrs):
+    """
+    Times the with block as a child of the current span, if a profile is
+    being recorded; otherwise does nothing.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return nullcontext()
+    trace = parent.trace
+    if trace.span_count >= PROFILE_MAX_SPANS:
+        trace.dropped_spans += 1
+        return nullcontext()
+    trace.span_count += 1
+    return _record(parent, name, attrs)
+
+def sampled() -> bool:
+    """True for PROFILE_SAMPLE_RATE of calls when profiling is enabled."""
+    return PROFILING_ENABLED and PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+# --- Recording a Profile ---
+
+def begin(name: str, kind: str, **attrs):
+    """Starts a profile in the current context. Returns (trace, token) for end()."""
+    trace = Trace(name, kind, attrs)
+    trace.thread_spans[threading.get_ident()] = trace.root
+    token = _current_span.set(trace.root)
+    with _active_lock:
+        _active.add(trace)
+    _start_sampler()
+    return trace, token
+
+def end(trace: Trace, token) -> None:
+    trace.root.duration = time.perf_counter() - trace.root.started
+    _current_span.reset(token)
+    with _active_lock:
+        _active.discard(trace)
+
+@contextmanager
+def profile(name: str, kind: str, **attrs):
+    """Records a profile of the with block and writes it to PROFILE_DIR."""
+    trace, token = begin(name, kind, **attrs)
+    try:
+        yield trace
+    finally:
+        end(trace, token)
+        save(trace)
+
+# --- Stack Sampling ---
+
+def _frame_names(frame) -> list[str]:
+    names = []
+    while frame is not None and len(names) < 128:
+        names.append(f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}")
+        frame = frame.f_back
+    return names[::-1]
+
+def _sample_loop():
+    interval = PROFILE_SAMPLE_INTERVAL_MS / 1000
+    own_id = threading.get_ident()
+    while True:
+        # Cleared before looking, so a profile begun meanwhile still wakes us.
+        _sampler_wake.clear()
+        with _active_lock:
+            traces = list(_active)
+        if not traces:
+            _sampler_wake.wait()
+            continue
+        frames = sys._current_frames()
+        for trace in traces:
+            with trace.lock:
+                threads = list(trace.thread_spans.items())
+            for thread_id, open_span in threads:
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own_id:
+                    continue
+                stack = ";".join(_span_path(open_span) + _frame_names(frame))
+                with trace.lock:
+                    trace.samples[stack] += 1
+        del frames
+        time.sleep(interval)
+
+def _start_sampler() -> None:
+    global _sampler_thread
+    if _sampler_thread is None or not _sampler_thread.is_alive():
+        with _active_lock:
+            if _sampler_thread is None or not _sampler_thread.is_alive():
+                _sampler_thread = threading.Thread(target=_sample_loop, name="profile-sampler", daemon=True)
+                _sampler_thread.start()
+    _sampler_wake.set()
+
+# --- Output ---
+
+def _span_folded(span: Span, prefix: str, lines: list) -> None:
+    """Collapsed stacks of the span tree, weighted by each span's own time in microseconds."""
+    path = f"{prefix};{span.name}" if prefix else span.name
+    own = (span.duration or 0) - sum(child.duration or 0 for child in span.children)
+    if own > 0:
+        lines.append(f"{path} {max(1, round(own * 1_000_000))}")
+    for child in span.children:
+        _span_folded(child, path, lines)
+
+def to_dict(trace: Trace) -> dict:
+    return {
+        "id": trace.id,
+        "kind": trace.kind,
+        "name": trace.root.name,
+        "created_at": trace.created_at,
+        "duration_ms": round((trace.root.duration or 0) * 1000, 3),
+        "spans": trace.span_count,
+        "dropped_spans": trace.dropped_spans,
+        "sample_interval_ms": PROFILE_SAMPLE_INTERVAL_MS,
+        "samples": sum(trace.samples.values()),
+        "root": trace.root.to_dict(trace.root.started)
+    }
+
+def folded(trace: Trace, source: str = "samples") -> str:
+    """Collapsed stacks ("a;b;c count" lines) from the stack samples or from the span timings."""
+    if source == "spans":
+        lines = []
+        _span_folded(trace.root, "", lines)
+    else:
+        lines = [f"{trace.root.name};{stack} {count}" for stack, count in sorted(trace.samples.items())]
+    return "\n".join(lines) + "\n"
+
+def save(trace: Trace) -> None:
+    """Writes <id>.json, <id>.folded and <id>.spans.folded and prunes old profiles."""
+    base = os.path.join(PROFILE_DIR, f"{int(trace.created_at * 1000)}-{trace.kind}-{trace.id}")
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with trace.lock:
+            document = to_dict(trace)
+            sample_text = folded(trace, "samples")
+            span_text = folded(trace, "spans")
+        with open(base + ".json", "w") as f:
+            json.dump(document, f)
+        with open(base + ".folded", "w") as f:
+            f.write(sample_text)
+        with open(base + ".spans.folded", "w") as f:
+            f.write(span_text)
+        _prune()
+    except OSError as e:
+        logger.error(f"Failed to write profile {trace.id}: {e}")
+        return
+    logger.info(f"Profiled {trace.kind} '{trace.root.name}' in {document['duration_ms']:.1f} ms "
+                f"({trace.span_count} spans, {document['samples']} samples): {base}.json")
+
+def _prune() -> None:
+    names = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith(".json"))
+    for name in names[:max(0, len(names) - PROFILE_KEEP)]:
+        stem = name[:-len(".json")]
+        for suffix in (".json", ".folded", ".spans.folded"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, stem + suffix))
+            except FileNotFoundError:
+                pass
+
+# --- Reading Saved Profiles ---
+
+def list_profiles() -> list[dict]:
+    """The saved profiles, newest first."""
+    try:
+        names = sorted((n for n in os.listdir(PROFILE_DIR) if n.endswith(".json")), reverse=True)
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in names:
+        created_ms, kind, profile_id = name[:-len(".json")].split("-", 2)
+        profiles.append({"id": profile_id, "kind": kind, "created_at": int(created_ms) / 1000})
+    return profiles
+
+def _find(profile_id: str) -> str | None:
+    if not profile_id.isalnum():
+        return None
+    for profile in list_profiles():
+        if profile["id"] == profile_id:
+            return os.path.join(PROFILE_DIR, f"{int(profile['created_at'] * 1000)}-{profile['kind']}-{profile_id}")
+    return None
+
+def load_profile(profile_id: str) -> dict | None:
+    base = _find(profile_id)
+    if base is None:
+        return None
+    with open(base + ".json") as f:
+        return json.load(f)
+
+def load_folded(profile_id: str, source: str = "samples") -> str | None:
+    base = _find(profile_id)
+    if base is None:
+        return None
+    with open(base + (".spans.folded" if source == "spans" else ".folded")) as f:
+        return f.read()
+
+# --- HTTP Requests ---
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling sampled requests, and every request sent with
+    "X-Profile: 1". The profile's ID is returned in an X-Profile-Id header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        forced = dict(scope["headers"]).get(PROFILE_HEADER.encode()) in (b"1", b"true")
+        if not forced and not sampled():
+            await self.app(scope, receive, send)
+            return
+
+        trace, token = begin(scope["method"], "request", path=scope["path"])
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace.root.attrs["status"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", trace.id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end(trace, token)
+            trace.root.name = f"{scope['method']} {route_template(scope)}"
+            await asyncio.get_running_loop().run_in_executor(None, save, trace)
@@ -1,14 +1,24 @@
 # backend/routes.py
 
-from fastapi import APIRouter, HTTPException, Query
-from services import device_service, proevent_service, cache_service
-from models import (DeviceOut, DeviceActionRequest, DeviceActionSummaryResponse,
+import time
+from typing import Literal
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from services import (device_service, proevent_service, cache_service, ignore_index_service,
+                      scheduler_service, proserver_service, snapshot_service, event_service,
+                      history_service)
+from models import (DeviceOut, DevicePage, DeviceActionRequest, DeviceActionSummaryResponse,
                    BuildingOut, BuildingTimeRequest, BuildingTimeResponse,
-                   IgnoredItemRequest, IgnoredItemResponse, IgnoredItemBulkRequest,
+                   ScheduleWindow, BuildingScheduleRequest, BuildingScheduleResponse,
+                   IgnoredItemRequest, IgnoredItemResponse, IgnoredItemBulkRequest, IgnoredItemBulkResponse,
                    PanelStatus)
-from sqlite_config import (get_building_time, set_building_time,
-                           get_ignored_proevents, set_proevent_ignore_status)
-from logger import get_logger
+from services.schedule_table import get_schedule_table, minute_of_day, format_minute
+from sqlite_config import get_building_time, get_proevent_state_history
+from config import get_pool_stats
+from async_db import run_db, get_async_db_stats
+import http_cache
+import profiling
+from logger import get_logger, get_logging_stats
 
 router = APIRouter()
 logger = get_logger(__name__)
@@ -17,7 +27,7 @@ logger = get_logger(__name__)
 # --- Panel Status Endpoints ---
 
 @router.get("/panel_status", response_model=PanelStatus)
-def get_panel_status():
+async def get_panel_status():
     """
     Get the current global armed/disarmed status of the panel.
     """
@@ -25,7 +35,7 @@ def get_panel_status():
     if status is None:
         logger.warning("Panel status not found in cache, defaulting to 'armed'.")
         status = True
-        cache_service.set_cache_value('panel_armed', status)
+        await run_db(cache_service.set_cache_value, 'panel_armed', status)
     return PanelStatus(armed=status)
 
 @router.post("/panel_status", response_model=PanelStatus)
@@ -36,32 +46,125 @@ def set_panel_status(status: PanelStatus):
     try:
         cache_service.set_cache_value('panel_armed', status.armed)
         logger.info(f"Global panel status set to: {'Armed' if status.armed else 'Disarmed'}")
+        event_service.publish("panel_status", {"armed": status.armed})
         return status
     except Exception as e:
         logger.error(f"Failed to set panel status in cache: {e}")
         raise HTTPException(500, "Failed to update panel status")
 
 
+# --- Scheduler Status ---
+
+@router.get("/scheduler/status")
+def get_scheduler_status():
+    """
+    Shows which process holds the scheduler lease, its age and the number
+    of failovers so far.
+    """
+    return scheduler_service.get_scheduler_status()
+
+
+@router.get("/proserver/status")
+def get_proserver_status():
+    """
+    Queue depth, send latency and drop counts for ProServer notifications.
+    """
+    return proserver_service.get_dispatcher_stats()
+
+
+@router.get("/db/pool")
+def get_db_pool_status():
+    """
+    Occupancy, checkout wait times, connection ages and invalidations for
+    the MSSQL connection pool.
+    """
+    return {**get_pool_stats(), "async_executor": get_async_db_stats()}
+
+
+@router.get("/events")
+async def stream_events():
+    """
+    Server-Sent Events stream of state changes: 'building_state' (proevents
+    of some buildings were armed or disarmed), 'panel_status', 'schedule',
+    and 'resync' if this client fell too far behind and should reload.
+    """
+    queue = event_service.subscribe()
+    return StreamingResponse(
+        event_service.stream(queue),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/events/stats")
+def get_event_stats():
+    """
+    Subscriber count and delivered/dropped totals for the live event stream.
+    """
+    return event_service.get_event_stats()
+
+
+@router.get("/logging/stats")
+def get_log_pipeline_stats():
+    """
+    Records queued, dropped because the queue was full, and suppressed as
+    repeats, plus the current queue depth.
+    """
+    return get_logging_stats()
+
+
+@router.get("/http_cache/stats")
+def get_http_cache_stats():
+    """
+    Hit/miss and 304 counts for the encoded list responses.
+    """
+    return http_cache.get_http_cache_stats()
+
+
 # --- Building and Device Routes ---
 
+def _proevent_version(building_id: int, ignored_ids: frozenset):
+    """What a building's proevent lists were encoded from, or None if it can't be told cheaply."""
+    if not snapshot_service.SNAPSHOT_ENABLED:
+        return None
+    data_version = snapshot_service.get_data_version(building_id)
+    return (data_version, ignored_ids) if data_version is not None else None
+
+def _device_out(p: dict, ignored_ids: frozenset) -> dict:
+    # Plain dicts in DeviceOut's shape; encoding them directly skips model validation.
+    return {
+        "id": p["id"],
+        "name": p["name"],
+        "state": "armed" if p["reactive_state"] == 1 else "disarmed",
+        "building_name": None,
+        "is_ignored": p["id"] in ignored_ids
+    }
+
+
 @router.get("/buildings", response_model=list[BuildingOut])
-def list_buildings():
-    buildings = device_service.get_distinct_buildings()
-    buildings_out = []
-    for b in buildings:
-        start_time = b.get("start_time", "09:00")
-        end_time = b.get("end_time", "17:00")
-        buildings_out.append(BuildingOut(
-            id=b["id"],
-            name=b["name"],
-            start_time=start_time,
-            end_time=end_time
-        ))
-    return buildings_out
+async def list_buildings(request: Request):
+    # Served from memory when fresh; only a cache miss waits on the database.
+    buildings = device_service.get_cached_buildings()
+    if buildings is None:
+        buildings = await run_db(device_service.get_distinct_buildings)
+    # The cached list is replaced on every refresh, so it is its own version.
+    encoded = http_cache.lookup("buildings", buildings)
+    if encoded is None:
+        encoded = http_cache.encode("buildings", buildings, [
+            {
+                "id": b["id"],
+                "name": b["name"],
+                "start_time": b.get("start_time", "09:00"),
+                "end_time": b.get("end_time", "17:00")
+            }
+            for b in buildings
+        ])
+    return http_cache.json_response(request, *encoded)
 
 
 @router.get("/devices", response_model=list[DeviceOut])
-def list_proevents(
+async def list_proevents(
+    request: Request,
     building: int | None = Query(default=None),
     search: str | None = Query(default=None),
     limit: int = Query(default=100, ge=1, le=1000),
@@ -69,36 +172,62 @@ def list_proevents(
 ):
     if building is None:
         raise HTTPException(status_code=400, detail="A building ID is required.")
-    proevents = proevent_service.get_all_proevents_for_building(
-        building_id=building, search=search, limit=limit, offset=offset
-    )
-    ignored_proevents = get_ignored_proevents()
-    proevents_out = []
-    for p in proevents:
-        ignore_status = ignored_proevents.get(p["id"], {})
-        proevent_out = DeviceOut(
-            id=p["id"],
-            name=p["name"],
-            state="armed" if p["reactive_state"] == 1 else "disarmed",
-            building_name=None,
-            is_ignored=ignore_status.get("ignore_on_disarm", False)
+    ignored_ids = ignore_index_service.get_ignored_ids(building)
+    key = ("devices", building, search, limit, offset)
+    version = _proevent_version(building, ignored_ids)
+    encoded = http_cache.lookup(key, version)
+    if encoded is None:
+        proevents = await run_db(
+            proevent_service.get_all_proevents_for_building,
+            building_id=building, search=search, limit=limit, offset=offset
         )
-        proevents_out.append(proevent_out)
-    return proevents_out
+        encoded = http_cache.encode(key, version, [_device_out(p, ignored_ids) for p in proevents])
+    return http_cache.json_response(request, *encoded)
+
+
+@router.get("/devices/page", response_model=DevicePage)
+async def list_proevents_page(
+    request: Request,
+    building: int = Query(...),
+    cursor: str | None = Query(default=None),
+    limit: int = Query(default=100, ge=1, le=1000),
+    search: str | None = Query(default=None),
+    search_mode: Literal["prefix", "contains"] = Query(default="contains")
+):
+    """
+    Keyset-paginated proevents for a building. Pass the returned next_cursor
+    as ?cursor= to fetch the following page.
+    """
+    try:
+        after_id = int(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    ignored_ids = ignore_index_service.get_ignored_ids(building)
+    key = ("devices/page", building, after_id, limit, search or None, search_mode)
+    version = _proevent_version(building, ignored_ids)
+    encoded = http_cache.lookup(key, version)
+    if encoded is None:
+        get_page = (snapshot_service.get_proevents_page if snapshot_service.SNAPSHOT_ENABLED
+                    else device_service.get_devices_page)
+        page = await run_db(
+            get_page,
+            building, after_id=after_id, limit=limit, search=search or None, search_mode=search_mode
+        )
+        encoded = http_cache.encode(key, version, {
+            "items": [_device_out(p, ignored_ids) for p in page["items"]],
+            "next_cursor": str(page["next_cursor"]) if page["next_cursor"] is not None else None
+        })
+    return http_cache.json_response(request, *encoded)
 
 
 @router.post("/devices/action", response_model=DeviceActionSummaryResponse)
 def device_action(req: DeviceActionRequest):
     action = req.action.lower()
     reactive = 1 if action == "arm" else 0
-    ignored_proevents_map = get_ignored_proevents()
     ignored_ids = []
     if action == "disarm":
         logger.info(f"DEVICE_ACTIONs:starting disarm sequence")
-        ignored_ids = [
-            pid for pid, flags in ignored_proevents_map.items()
-            if flags.get("building_frk") == req.building_id and flags.get("ignore_on_disarm", False)
-        ]
+        ignored_ids = list(ignore_index_service.get_ignored_ids(req.building_id))
         
         # --- THIS IS THE NEW LOGGING LINE ---
         logger.info(f"DEVICE_ACTION: Building {req.building_id} - Ignored IDs list: {ignored_ids}")
@@ -110,8 +239,10 @@ def device_action(req: DeviceActionRequest):
         ignored_ids = []
         logger.info(f"Bulk arm for building {req.building_id}, ignoring 0 proevents.")
     try:
+        # Manual actions always reach the database, even if the scheduler
+        # applied the same target moments ago.
         affected_rows = proevent_service.set_proevent_reactive_for_building(
-            req.building_id, reactive, ignored_ids
+            req.building_id, reactive, ignored_ids, force=True
         )
         if affected_rows == 0:
             logger.warning(f"No proevents updated for building {req.building_id}.")
@@ -143,7 +274,7 @@ def get_building_scheduled_time(building_id: int):
 def set_building_scheduled_time(building_id: int, request: BuildingTimeRequest):
     if request.building_id != building_id:
         raise HTTPException(400, "Building ID in path and body must match")
-    success = set_building_time(building_id, request.start_time, request.end_time)
+    success = device_service.update_building_schedule(building_id, request.start_time, request.end_time)
     if not success:
         raise HTTPException(500, "Failed to update building scheduled time")
     return BuildingTimeResponse(
@@ -153,6 +284,27 @@ def set_building_scheduled_time(building_id: int, request: BuildingTimeRequest):
         updated=True
     )
 
+
+@router.get("/buildings/{building_id}/schedule", response_model=BuildingScheduleResponse)
+def get_building_schedule(building_id: int):
+    windows = get_schedule_table().windows(building_id)
+    return BuildingScheduleResponse(
+        building_id=building_id,
+        windows=[
+            ScheduleWindow(weekday=weekday, start_time=format_minute(start), end_time=format_minute(end))
+            for _, weekday, start, end in windows
+        ]
+    )
+
+
+@router.put("/buildings/{building_id}/schedule", response_model=BuildingScheduleResponse)
+def set_building_schedule(building_id: int, request: BuildingScheduleRequest):
+    """Replaces all of a building's schedule windows; an empty list clears the schedule."""
+    windows = [(w.weekday, minute_of_day(w.start_time), minute_of_day(w.end_time)) for w in request.windows]
+    if not device_service.update_building_windows(building_id, windows):
+        raise HTTPException(500, "Failed to update building schedule")
+    return BuildingScheduleResponse(building_id=building_id, windows=request.windows)
+
 # --- NEW ENDPOINT TO TRIGGER RE-EVALUATION ---
 @router.post("/buildings/{building_id}/reevaluate")
 def reevaluate_building(building_id: int):
@@ -170,15 +322,139 @@ def reevaluate_building(building_id: int):
 
 # --- Redundant /proevents/ignore endpoint was removed ---
 
-@router.post("/proevents/ignore/bulk")
+@router.post("/proevents/ignore/bulk", response_model=IgnoredItemBulkResponse)
 def manage_ignored_proevents_bulk(req: IgnoredItemBulkRequest):
     """
-    Set the ignore status for multiple proevents.
+    Set the ignore status for multiple proevents in one transaction.
+
+    Items are diffed against the current rules and only the changes are
+    written, so clients may send either just their edits or every item.
+    With reevaluate=true the buildings that changed are re-evaluated before
+    returning, saving a separate /reevaluate call.
     """
-    for item in req.items:
-        set_proevent_ignore_status(
-            item.item_id, item.building_frk, item.device_prk, 
-            ignore_on_arm=False, 
-            ignore_on_disarm=item.ignore
-        )
-    return {"status": "success"}
\ No newline at end of file
+    started = time.perf_counter()
+    try:
+        diff = ignore_index_service.apply_ignore_changes([
+            {
+                "proevent_id": item.item_id,
+                "building_frk": item.building_frk,
+                "device_prk": item.device_prk,
+                "ignore_on_arm": False,
+                "ignore_on_disarm": item.ignore
+            }
+            for item in req.items
+        ])
+    except Exception as e:
+        logger.error(f"Failed to save ignore settings for {len(req.items)} proevents: {e}")
+        raise HTTPException(500, "Failed to save ignore settings")
+    saved = time.perf_counter()
+
+    reevaluated = []
+    if req.reevaluate:
+        for building_id in diff["buildings"]:
+            try:
+                proevent_service.reevaluate_building_state(building_id)
+            except Exception as e:
+                logger.error(f"Failed to re-evaluate building {building_id} after ignore changes: {e}")
+                raise HTTPException(500, f"Ignore settings saved, but re-evaluating building {building_id} failed: {e}")
+            reevaluated.append(building_id)
+    finished = time.perf_counter()
+
+    logger.info(f"Ignore bulk save: {len(diff['ignored'])} ignored, {len(diff['unignored'])} unignored, "
+                f"{diff['unchanged']} unchanged, {len(reevaluated)} buildings re-evaluated "
+                f"in {(finished - started) * 1000:.1f} ms")
+    return IgnoredItemBulkResponse(
+        status="success",
+        ignored=diff["ignored"],
+        unignored=diff["unignored"],
+        unchanged=diff["unchanged"],
+        reevaluated=reevaluated,
+        timing_ms={
+            "save": round((saved - started) * 1000, 3),
+            "reevaluate": round((finished - saved) * 1000, 3),
+            "total": round((finished - started) * 1000, 3)
+        }
+    )
+
+
+@router.get("/proevents/snapshot/stats")
+def get_proevent_snapshot_stats():
+    """
+    Size and age of the in-process proevent snapshots, and what refreshing
+    them has cost.
+    """
+    return snapshot_service.get_snapshot_stats()
+
+
+@router.get("/proevents/history/stats")
+def get_proevent_history_stats():
+    """
+    Buffer depth, flush latency and write counts for the state history recorder.
+    """
+    return history_service.get_history_stats()
+
+
+@router.get("/buildings/{building_id}/history")
+def get_building_history(building_id: int, limit: int = Query(default=100, ge=1, le=1000)):
+    """
+    The building's most recent proevent state changes, newest first. Changes
+    from the last few seconds may still be buffered and not yet listed.
+    """
+    return get_proevent_state_history(building_id, limit)
+
+
+@router.get("/proevents/ignore/index_stats")
+def get_ignore_index_stats():
+    """
+    Hit/miss/rebuild counters for the in-memory ignore rule index.
+    """
+    return ignore_index_service.get_index_stats()
+
+
+# --- Profiling (only with PROFILING_ENABLED) ---
+
+def _require_profiling():
+    if not profiling.PROFILING_ENABLED:
+        raise HTTPException(404, "Profiling is disabled (set PROFILING_ENABLED=true).")
+
+@router.get("/debug/profiles")
+def list_profiles():
+    """
+    Saved request and scheduler tick profiles, newest first. Send a request
+    with 'X-Profile: 1' to profile it; its ID comes back in X-Profile-Id.
+    """
+    _require_profiling()
+    return profiling.list_profiles()
+
+@router.post("/debug/profiles/scheduler")
+def profile_scheduler_ticks(ticks: int = Query(default=1, ge=1, le=100)):
+    """
+    Profiles the next `ticks` scheduler runs on whichever process holds the lease.
+    """
+    _require_profiling()
+    scheduler_service.request_tick_profiles(ticks)
+    return {"status": "requested", "ticks": ticks}
+
+@router.get("/debug/profiles/{profile_id}")
+def get_profile(profile_id: str):
+    """
+    One profile's span tree: every MSSQL, SQLite and ProServer call and
+    scheduler phase, with start offsets and durations.
+    """
+    _require_profiling()
+    document = profiling.load_profile(profile_id)
+    if document is None:
+        raise HTTPException(404, f"Profile {profile_id} not found.")
+    return document
+
+@router.get("/debug/profiles/{profile_id}/folded", response_class=PlainTextResponse)
+def get_profile_folded(profile_id: str, source: Literal["samples", "spans"] = Query(default="samples")):
+    """
+    The profile as collapsed stacks for flamegraph.pl or speedscope: sampled
+    Python stacks under their spans, or the span tree weighted by time (us).
+    """
+    _require_profiling()
+    text = profiling.load_folded(profile_id, source)
+    if text is None:
+        raise HTTPException(404, f"Profile {profile_id} not found.")
+    return PlainTextResponse(text)
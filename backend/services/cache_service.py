@@ -1,17 +1,30 @@
-from cache import load_cache, save_cache
+from cache import get_value, get_many, set_value, set_many, delete_value
 from logger import get_logger
 
 logger = get_logger(__name__)
 
 def get_cache_value(key):
     logger.debug(f"Getting value from cache for key: {key}")
-    cache = load_cache()
-    return cache.get(key)
+    return get_value(key)
 
-def set_cache_value(key, value):
+def get_cache_values(keys) -> dict:
+    keys = list(keys)
+    logger.debug(f"Getting values from cache for keys: {keys}")
+    return get_many(keys)
+
+def set_cache_value(key, value, ttl: float | None = None):
     logger.debug(f"Setting value in cache for key: {key}")
-    cache = load_cache()
-    cache[key] = value
-    save_cache(cache)
+    set_value(key, value, ttl=ttl)
     logger.info(f"Cache updated for key: {key}")
-    return True
\ No newline at end of file
+    return True
+
+def set_cache_values(values: dict, ttl: float | None = None):
+    logger.debug(f"Setting values in cache for keys: {list(values)}")
+    set_many(values, ttl=ttl)
+    logger.info(f"Cache updated for {len(values)} keys")
+    return True
+
+def delete_cache_value(key):
+    logger.debug(f"Deleting value from cache for key: {key}")
+    delete_value(key)
+    return True
@@ -1,39 +1,114 @@
 from typing import List, Dict, Any
-from config import fetch_all, fetch_one, execute_query
-from sqlite_config import get_all_building_times
+from config import fetch_all, fetch_one, execute_query, execute_returning
+from sqlite_config import get_all_building_times, get_building_time, set_building_time, set_building_windows
+from shared_state import NAMESPACE_APPLIED_STATES, NAMESPACE_SCHEDULES, bump_version, register_listener
+from services import cache_service, event_service, history_service
+from services.schedule_table import invalidate_schedule_table
+import metrics
 import logging
+import threading
 import time
 
 logger = logging.getLogger(__name__)
 
 # --- Simple In-Memory Cache for Buildings ---
 # This will store the buildings list to avoid hitting the database repeatedly.
+# The raw list from MSSQL is also kept in the shared app cache, so only one
+# worker per CACHE_DURATION_SECONDS has to query it. Schedule edits made by
+# any process invalidate every worker's local copy.
 buildings_cache = {
     "data": None,
     "timestamp": 0
 }
 CACHE_DURATION_SECONDS = 300 # Cache for 5 minutes
+SHARED_BUILDINGS_CACHE_KEY = "distinct_buildings"
+# result: "hit" (this process's copy), "shared" (the shared app cache) or "database"
+_buildings_lookups = metrics.counter(
+    "buildings_cache_lookups_total",
+    "Buildings list lookups by where the list came from.",
+    ("result",)
+)
 
-def get_distinct_buildings() -> List[Dict[str, Any]]:
+# --- Last Applied Reactive State per Building ---
+# Remembers the (reactive, ignored IDs) target last written for each building,
+# so re-applying the same target costs no database writes. Entries expire so
+# that changes made to ProEvent_TBL outside this service are still corrected.
+# The record is per process, so a forced write (a manual device action) bumps
+# the shared 'applied_states' version and every other process forgets what
+# it applied; otherwise the scheduler leader would trust its old target for
+# up to the TTL. Forced writes are rare, so all buildings are dropped rather
+# than tracking which ones changed.
+_applied_states = {}
+_applied_states_lock = threading.Lock()
+APPLIED_STATE_TTL_SECONDS = 600 # Re-verify against the database every 10 minutes
+
+
+# Every reactive-state write goes through _update_reactive_state(), which
+# adds the OUTPUT clause when state history is being recorded. The changed
+# rows go INTO a table variable and are selected from it, because SQL Server
+# rejects a plain OUTPUT clause on a table with enabled triggers.
+_REACTIVE_UPDATE_SQL = """
+        UPDATE ProEvent_TBL
+        SET pevReactive_FRK = :reactive
+"""
+_REACTIVE_OUTPUT_PREFIX_SQL = """
+        SET NOCOUNT ON;
+        DECLARE @changed TABLE (id INT, building_id INT, reactive_state INT);
+"""
+_REACTIVE_OUTPUT_SQL = """
+        OUTPUT inserted.ProEvent_PRK, inserted.pevBuilding_FRK, inserted.pevReactive_FRK
+        INTO @changed (id, building_id, reactive_state)
+"""
+_REACTIVE_OUTPUT_SELECT_SQL = """;
+        SELECT id, building_id, reactive_state FROM @changed;
+"""
+
+
+def _id_list_param(ids) -> str:
     """
-    Fetches a distinct list of buildings, using a time-based cache
-    to avoid excessive database queries.
+    Serializes a list of integer IDs into a single comma-separated parameter
+    for use with STRING_SPLIT. This keeps set-based statements to one bound
+    parameter per list, regardless of how many IDs are involved (pyodbc is
+    limited to 2100 parameters per statement).
+    """
+    return ",".join(str(int(i)) for i in ids)
+
+def get_cached_buildings() -> List[Dict[str, Any]] | None:
+    """
+    Returns this process's cached buildings list if it is still fresh, else
+    None. Never touches a database, so async routes can call it directly.
     """
-    # Check if the cache is still valid
     is_cache_valid = (time.time() - buildings_cache["timestamp"]) < CACHE_DURATION_SECONDS
-    
     if buildings_cache["data"] and is_cache_valid:
-        logger.info("Returning buildings list from cache.")
+        _buildings_lookups.labels("hit").inc()
         return buildings_cache["data"]
+    return None
 
-    logger.info("Fetching distinct buildings from database (cache empty or expired).")
-    sql = """
-        SELECT DISTINCT b.Building_PRK AS id, b.bldBuildingName_TXT AS name
-        FROM Device_TBL d JOIN Building_TBL b ON d.dvcBuilding_FRK = b.Building_PRK
-        WHERE d.dvcBuilding_FRK IS NOT NULL AND d.dvcDeviceType_FRK=138
-        ORDER BY b.bldBuildingName_TXT
+def get_distinct_buildings() -> List[Dict[str, Any]]:
+    """
+    Fetches a distinct list of buildings, using a time-based cache
+    to avoid excessive database queries.
     """
-    rows = fetch_all(sql)
+    cached = get_cached_buildings()
+    if cached is not None:
+        logger.info("Returning buildings list from cache.")
+        return cached
+
+    rows = cache_service.get_cache_value(SHARED_BUILDINGS_CACHE_KEY)
+    if rows is not None:
+        logger.info("Using buildings list from the shared cache.")
+        _buildings_lookups.labels("shared").inc()
+    else:
+        logger.info("Fetching distinct buildings from database (cache empty or expired).")
+        sql = """
+            SELECT DISTINCT b.Building_PRK AS id, b.bldBuildingName_TXT AS name
+            FROM Device_TBL d JOIN Building_TBL b ON d.dvcBuilding_FRK = b.Building_PRK
+            WHERE d.dvcBuilding_FRK IS NOT NULL AND d.dvcDeviceType_FRK=138
+            ORDER BY b.bldBuildingName_TXT
+        """
+        rows = fetch_all(sql)
+        _buildings_lookups.labels("database").inc()
+        cache_service.set_cache_value(SHARED_BUILDINGS_CACHE_KEY, rows, ttl=CACHE_DURATION_SECONDS)
     buildings = [dict(row) for row in rows]
     logger.info(f"Found {len(buildings)} distinct buildings.")
     
@@ -50,6 +125,44 @@ def get_distinct_buildings() -> List[Dict[str, Any]]:
     
     return buildings
 
+def invalidate_buildings_cache() -> None:
+    """Drops this process's copy of the buildings list."""
+    buildings_cache["data"] = None
+    buildings_cache["timestamp"] = 0
+
+def update_building_schedule(building_id: int, start_time: str, end_time: str | None) -> bool:
+    """
+    Saves a building's schedule and makes every process (including this one)
+    drop its cached buildings list, so the new times show up immediately.
+    """
+    success = set_building_time(building_id, start_time, end_time)
+    if success:
+        _schedule_changed(building_id)
+    return success
+
+def update_building_windows(building_id: int, windows: list[tuple]) -> bool:
+    """
+    Replaces all of a building's schedule windows with
+    [(weekday or None, start_minute, end_minute), ...].
+    """
+    success = set_building_windows(building_id, windows)
+    if success:
+        _schedule_changed(building_id)
+    return success
+
+def _schedule_changed(building_id: int) -> None:
+    invalidate_buildings_cache()
+    invalidate_schedule_table()
+    bump_version(NAMESPACE_SCHEDULES)
+    times = get_building_time(building_id) or {}
+    event_service.publish("schedule", {
+        "building_id": building_id,
+        "start_time": times.get("start_time"),
+        "end_time": times.get("end_time")
+    })
+
+register_listener(NAMESPACE_SCHEDULES, invalidate_buildings_cache)
+
 def get_building_panel_state(building_id: int) -> str:
     sql = """
         SELECT dvcCurrentState_TXT 
@@ -69,21 +182,36 @@ def get_building_panel_state(building_id: int) -> str:
     else:
         return "Unknown"
 
+# Limits proevents to buildings that have a panel device. Written as EXISTS
+# rather than a JOIN so a building with several panels doesn't repeat rows.
+_PANEL_BUILDING_FILTER = """
+    EXISTS (
+        SELECT 1 FROM Device_TBL d
+        WHERE d.dvcBuilding_FRK = p.pevBuilding_FRK AND d.dvcDeviceType_FRK = 138
+    )
+"""
+
+def _like_pattern(search: str, prefix: bool) -> str:
+    """Builds a LIKE pattern (used with ESCAPE '\\') that matches search literally."""
+    escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_").replace("[", "\\[")
+    return f"{escaped}%" if prefix else f"%{escaped}%"
+
 # --- ADDED: Function to get all proevents/devices for a building ---
 def get_devices(building_id: int, search: str | None = None,
                 limit: int = 100, offset: int = 0) -> list[dict]:
     """
-    Fetches all proevents (devices) for a specific building,
-    joining with ProEvent_TBL to get their reactive state.
+    Fetches all proevents (devices) for a specific building that has a
+    panel, optionally filtered by a substring of the proevent alias.
     """
     logger.debug(f"Fetching devices for building {building_id} with search='{search}'")
     
     # Parameters for OFFSET/FETCH must be literals for pyodbc, not bound parameters.
     # This is safe as limit/offset are guaranteed to be integers.
-    params = {
-        "building_id": building_id,
-        "search": f"%{search}%" if search else "%",
-    }
+    params = {"building_id": building_id}
+    search_clause = ""
+    if search:
+        params["search"] = _like_pattern(search, prefix=False)
+        search_clause = "AND p.pevAlias_TXT LIKE :search ESCAPE '\\'"
     
     # We now use f-strings for {int(offset)} and {int(limit)}
     sql = f"""
@@ -92,15 +220,13 @@ def get_devices(building_id: int, search: str | None = None,
             p.pevAlias_TXT AS name,
             p.pevReactive_FRK AS reactive_state
         FROM 
-            Device_TBL d
-        JOIN 
-            ProEvent_TBL p ON p.pevBuilding_FRK = d.dvcBuilding_FRK
+            ProEvent_TBL p
         WHERE 
-            d.dvcBuilding_FRK = :building_id
-            AND d.dvcDeviceType_FRK = 138
-            AND d.dvcName_TXT LIKE :search
+            p.pevBuilding_FRK = :building_id
+            {search_clause}
+            AND {_PANEL_BUILDING_FILTER}
         ORDER BY
-            d.dvcName_TXT
+            p.ProEvent_PRK
         OFFSET {int(offset)} ROWS
         FETCH NEXT {int(limit)} ROWS ONLY
     """
@@ -113,25 +239,133 @@ def get_devices(building_id: int, search: str | None = None,
         logger.error(f"Error fetching devices: {e}")
         return []
 
+def get_devices_page(building_id: int, after_id: int | None = None, limit: int = 100,
+                     search: str | None = None, search_mode: str = "contains") -> dict:
+    """
+    Fetches one page of a building's proevents ordered by ID, starting after
+    after_id (keyset pagination). Unlike OFFSET paging, the cost of a page
+    does not grow with how far into the list it is.
+
+    search matches the proevent alias, as a prefix (search_mode="prefix",
+    which can use an index on pevAlias_TXT) or anywhere in it ("contains").
+
+    Returns {"items": [...], "next_cursor": last ID of the page, or None on
+    the last page}.
+    """
+    params = {
+        "building_id": building_id,
+        "after_id": after_id if after_id is not None else -1,
+    }
+    search_clause = ""
+    if search:
+        params["search"] = _like_pattern(search, prefix=(search_mode == "prefix"))
+        search_clause = "AND p.pevAlias_TXT LIKE :search ESCAPE '\\'"
+
+    # One extra row tells us whether another page exists.
+    sql = f"""
+        SELECT
+            p.ProEvent_PRK AS id,
+            p.pevAlias_TXT AS name,
+            p.pevReactive_FRK AS reactive_state
+        FROM ProEvent_TBL p
+        WHERE p.pevBuilding_FRK = :building_id
+            AND p.ProEvent_PRK > :after_id
+            {search_clause}
+            AND {_PANEL_BUILDING_FILTER}
+        ORDER BY p.ProEvent_PRK
+        OFFSET 0 ROWS
+        FETCH NEXT {int(limit) + 1} ROWS ONLY
+    """
+    rows = fetch_all(sql, params)
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = items[-1]["id"] if len(rows) > limit else None
+    logger.debug(f"Devices page for building {building_id} after {after_id}: "
+                 f"{len(items)} rows, next_cursor={next_cursor}")
+    return {"items": items, "next_cursor": next_cursor}
+
+# --- Applied State Tracking ---
+
+def is_state_applied(building_id: int, reactive: int, ignored_ids) -> bool:
+    """
+    Returns True if this exact target (reactive state and ignored IDs) was
+    applied to the building recently enough to be trusted.
+    """
+    with _applied_states_lock:
+        entry = _applied_states.get(building_id)
+    if not entry:
+        return False
+    if (time.time() - entry["applied_at"]) >= APPLIED_STATE_TTL_SECONDS:
+        return False
+    return entry["reactive"] == reactive and entry["ignored_ids"] == frozenset(ignored_ids)
+
+def record_applied_state(building_id: int, reactive: int, ignored_ids) -> None:
+    """Records that the building's proevents are now in the given target state."""
+    with _applied_states_lock:
+        _applied_states[building_id] = {
+            "reactive": reactive,
+            "ignored_ids": frozenset(ignored_ids),
+            "applied_at": time.time()
+        }
+
+def invalidate_applied_states(building_ids: list[int] | None = None) -> None:
+    """
+    Forgets the applied state for the given buildings (or all buildings),
+    forcing the next write to go to the database.
+    """
+    with _applied_states_lock:
+        if building_ids is None:
+            _applied_states.clear()
+        else:
+            for building_id in building_ids:
+                _applied_states.pop(building_id, None)
+
+register_listener(NAMESPACE_APPLIED_STATES, invalidate_applied_states)
+
 # --- MODIFIED: Function to set the reactive state for a building ---
+def _update_reactive_state(where_sql: str, params: dict, site: str) -> int:
+    """
+    Runs UPDATE ProEvent_TBL SET pevReactive_FRK = :reactive with the given
+    WHERE clause and returns the number of rows changed. While history is
+    enabled, the batch also returns the changed rows (OUTPUT ... INTO a
+    table variable), which are handed to the history recorder. site is the
+    label the statement is timed under in /metrics (the caller's name).
+    """
+    if not history_service.HISTORY_ENABLED:
+        return execute_query(_REACTIVE_UPDATE_SQL + where_sql, params, site=site)
+    rows = execute_returning(
+        _REACTIVE_OUTPUT_PREFIX_SQL + _REACTIVE_UPDATE_SQL + _REACTIVE_OUTPUT_SQL
+        + where_sql + _REACTIVE_OUTPUT_SELECT_SQL,
+        params,
+        site=site
+    )
+    history_service.record(rows)
+    return len(rows)
+
 def set_reactive_state_for_building(building_id: int, reactive: int, 
-                                    ignored_ids: list[int]) -> int:
+                                    ignored_ids: list[int], force: bool = False) -> int:
     """
     Sets the reactive state for all proevents in a building, skipping
     any IDs in the ignored_ids list.
+
+    Only rows whose pevReactive_FRK differs from the target are updated.
+    If the same target was applied recently, no statement is issued at all
+    unless force is True. Database errors are raised to the caller.
     """
-    action = "Arm" if reactive == 0 else "Disarm"
+    action = "Arm" if reactive == 1 else "Disarm"
+    if not force and is_state_applied(building_id, reactive, ignored_ids):
+        logger.debug(f"Building {building_id} already set to {action}; skipping database write.")
+        return 0
+
     logger.info(f"Setting reactive state to {action} for building {building_id}")
 
-    # Base query
+    # Base query (the UPDATE ... SET part is added by _update_reactive_state)
     sql = """
-        UPDATE ProEvent_TBL
-        SET pevReactive_FRK = :reactive
         WHERE pevBuilding_FRK IN (
             SELECT dvcBuilding_FRK 
             FROM Device_TBL 
             WHERE dvcBuilding_FRK = :building_id AND dvcDeviceType_FRK = 138
         )
+        AND (pevReactive_FRK <> :reactive OR pevReactive_FRK IS NULL)
     """
     params = {
         "reactive": reactive,
@@ -143,22 +377,169 @@ def set_reactive_state_for_building(building_id: int, reactive: int,
         logger.info('found ignoredIDs running sql query for it')
         # Create named parameters for each ignored ID
         ignored_params = {f"id_{i}": p_id for i, p_id in enumerate(ignored_ids)}
-        print(ignored_params)
         # --- THIS IS THE FIX ---
         # Changed "proDevice_FRK" to "ProEvent_PRK" to match the primary key
         # of ProEvent_TBL, which is what your ignored_ids list contains.
         sql += f" AND ProEvent_PRK NOT IN ({', '.join([f':{k}' for k in ignored_params.keys()])})"
-        logger.info(f'o sqlqueries for/device/action:{sql}')
+        logger.debug(f'o sqlqueries for/device/action:{sql}')
         # --- END OF FIX ---
         
         # Add the new parameters to the main params dict
         params.update(ignored_params)
         
 
-    try:
-        affected_rows = execute_query(sql, params)
-        logger.info(f"Affected {affected_rows} rows for building {building_id}.")
-        return affected_rows
-    except Exception as e:
-        logger.error(f"Error setting reactive state for building {building_id}: {e}")
-        return 0
\ No newline at end of file
+    # Errors propagate: the scheduler counts them per building, and the
+    # route path (set_proevent_reactive_for_building) logs them.
+    affected_rows = _update_reactive_state(sql, params, f"{__name__}.set_reactive_state_for_building")
+    logger.info(f"Affected {affected_rows} rows for building {building_id}.")
+    if force:
+        try:
+            bump_version(NAMESPACE_APPLIED_STATES)
+        except Exception as e:
+            logger.error(f"Failed to notify other processes of the write to building {building_id}: {e}")
+    record_applied_state(building_id, reactive, ignored_ids)
+    return affected_rows
+
+# --- Set-based helpers used by the batched scheduler tick ---
+
+def get_proevent_counts_for_buildings(building_ids: list[int], reactive: int,
+                                      excluded_ids: list[int]) -> dict[int, dict]:
+    """
+    Returns, for every building in building_ids, how many proevents exist
+    ('total') and how many of them are not yet in the target reactive state
+    ('pending'), leaving out any IDs in excluded_ids. All buildings are
+    counted in one query. Buildings without proevents are absent.
+    """
+    if not building_ids:
+        return {}
+
+    sql = """
+        SELECT
+            p.pevBuilding_FRK AS building_id,
+            COUNT(*) AS total,
+            SUM(CASE WHEN p.pevReactive_FRK = :reactive THEN 0 ELSE 1 END) AS pending
+        FROM ProEvent_TBL p
+        WHERE p.pevBuilding_FRK IN (
+            SELECT CAST(value AS INT) FROM STRING_SPLIT(:building_ids, ',')
+        )
+    """
+    params = {
+        "reactive": reactive,
+        "building_ids": _id_list_param(building_ids)
+    }
+    if excluded_ids:
+        sql += """
+            AND p.ProEvent_PRK NOT IN (
+                SELECT CAST(value AS INT) FROM STRING_SPLIT(:excluded_ids, ',')
+            )
+        """
+        params["excluded_ids"] = _id_list_param(excluded_ids)
+    sql += " GROUP BY p.pevBuilding_FRK"
+
+    rows = fetch_all(sql, params)
+    return {
+        row["building_id"]: {"total": row["total"] or 0, "pending": row["pending"] or 0}
+        for row in rows
+    }
+
+def set_reactive_state_for_buildings(building_ids: list[int], reactive: int,
+                                     ignored_ids: list[int]) -> int:
+    """
+    Sets the reactive state for all proevents of every building in
+    building_ids with a single UPDATE, skipping any IDs in ignored_ids.
+    ProEvent IDs are unique across buildings, so the ignored IDs of all
+    buildings can be combined into one list. Rows already in the target
+    state are not touched.
+
+    The caller is responsible for recording the applied state per building,
+    since only it knows which ignored IDs belong to which building.
+    """
+    if not building_ids:
+        return 0
+
+    action = "Arm" if reactive == 1 else "Disarm"
+    logger.info(f"Setting reactive state to {action} for {len(building_ids)} buildings in one statement")
+
+    sql = """
+        WHERE pevBuilding_FRK IN (
+            SELECT CAST(value AS INT) FROM STRING_SPLIT(:building_ids, ',')
+        )
+        AND (pevReactive_FRK <> :reactive OR pevReactive_FRK IS NULL)
+    """
+    params = {
+        "reactive": reactive,
+        "building_ids": _id_list_param(building_ids)
+    }
+    if ignored_ids:
+        sql += """
+            AND ProEvent_PRK NOT IN (
+                SELECT CAST(value AS INT) FROM STRING_SPLIT(:ignored_ids, ',')
+            )
+        """
+        params["ignored_ids"] = _id_list_param(ignored_ids)
+
+    affected_rows = _update_reactive_state(sql, params, f"{__name__}.set_reactive_state_for_buildings")
+    logger.info(f"Affected {affected_rows} rows across {len(building_ids)} buildings.")
+    return affected_rows
+
+# --- Snapshot helpers used by snapshot_service ---
+
+def get_proevent_versions_for_buildings(building_ids: list[int],
+                                        rowversion_column: str | None = None) -> dict[int, tuple]:
+    """
+    Returns {building_id: (row_count, version)} for the given buildings in
+    one query. version is the highest value of rowversion_column when the
+    table has one, otherwise a CHECKSUM_AGG over the columns the snapshot
+    keeps. Either changes whenever one of the building's rows does (the row
+    count catches deletes). Buildings without proevents are absent.
+    """
+    if not building_ids:
+        return {}
+
+    if rowversion_column:
+        version_expr = f"MAX(CAST(p.{rowversion_column} AS BIGINT))"
+    else:
+        version_expr = "CHECKSUM_AGG(BINARY_CHECKSUM(p.ProEvent_PRK, p.pevAlias_TXT, p.pevReactive_FRK))"
+
+    sql = f"""
+        SELECT
+            p.pevBuilding_FRK AS building_id,
+            COUNT(*) AS row_count,
+            {version_expr} AS version
+        FROM ProEvent_TBL p
+        WHERE p.pevBuilding_FRK IN (
+            SELECT CAST(value AS INT) FROM STRING_SPLIT(:building_ids, ',')
+        )
+            AND {_PANEL_BUILDING_FILTER}
+        GROUP BY p.pevBuilding_FRK
+    """
+    rows = fetch_all(sql, {"building_ids": _id_list_param(building_ids)})
+    return {row["building_id"]: (row["row_count"], row["version"]) for row in rows}
+
+def get_proevents_for_buildings(building_ids: list[int]) -> dict[int, list[dict]]:
+    """
+    Returns {building_id: [proevent rows ordered by ID]} for the given
+    buildings in one query, with the same columns and panel filter as
+    get_devices(). Buildings without proevents map to an empty list.
+    """
+    result = {building_id: [] for building_id in building_ids}
+    if not building_ids:
+        return result
+
+    sql = f"""
+        SELECT
+            p.pevBuilding_FRK AS building_id,
+            p.ProEvent_PRK AS id,
+            p.pevAlias_TXT AS name,
+            p.pevReactive_FRK AS reactive_state
+        FROM ProEvent_TBL p
+        WHERE p.pevBuilding_FRK IN (
+            SELECT CAST(value AS INT) FROM STRING_SPLIT(:building_ids, ',')
+        )
+            AND {_PANEL_BUILDING_FILTER}
+        ORDER BY p.pevBuilding_FRK, p.ProEvent_PRK
+    """
+    for row in fetch_all(sql, {"building_ids": _id_list_param(building_ids)}):
+        row = dict(row)
+        result.setdefault(row.pop("building_id"), []).append(row)
+    return result
@@ -0,0 +1,166 @@
+# backend/services/event_service.py
+
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from sqlite_config import get_sqlite_connection
+from shared_state import NAMESPACE_EVENTS, bump_version, register_listener
+from services import snapshot_service
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# --- Live Event Broadcaster ---
+# Pushes state changes (proevent states, panel status, schedules) to
+# dashboards over Server-Sent Events. Each subscriber has a bounded asyncio
+# queue; publishing hands the event to the event loop once and the loop
+# copies it into every queue, so idle subscribers cost one parked
+# coroutine each. A subscriber whose queue is full has it cleared and
+# replaced by a single 'resync' event, telling the client to reload rather
+# than letting one slow reader hold memory or back up the publisher.
+#
+# The scheduler only runs in the process holding the lease, so events are
+# also appended to the live_events table in SQLite. Other processes pick
+# them up through the shared 'events' version and deliver them to their own
+# subscribers.
+EVENTS_CLIENT_QUEUE_SIZE = int(os.getenv("EVENTS_CLIENT_QUEUE_SIZE", 100))
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", 15))
+EVENTS_RELAY_KEEP_ROWS = int(os.getenv("EVENTS_RELAY_KEEP_ROWS", 1000))
+
+PROCESS_ID = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_subscribers = set()  # asyncio.Queue per connected client; only touched on the loop
+_loop = None
+_last_relayed_seq = 0
+_relay_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {
+    "published": 0,
+    "relayed_in": 0,
+    "delivered": 0,
+    "dropped": 0,
+    "resyncs": 0,
+    "subscribers": 0,
+    "max_subscribers": 0
+}
+
+
+def _count(key: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats[key] += amount
+
+# --- Publishing ---
+
+def publish(event_type: str, data: dict) -> None:
+    """
+    Broadcasts an event to every subscriber in every process. Safe to call
+    from any thread; never blocks on slow subscribers.
+    """
+    event = {"type": event_type, "data": data, "at": time.time()}
+    _count("published")
+    try:
+        _store(event)
+    except Exception as e:
+        logger.error(f"Failed to relay '{event_type}' event to other processes: {e}")
+    _dispatch(event)
+
+def _store(event: dict) -> None:
+    with get_sqlite_connection() as conn:
+        cursor = conn.execute(
+            "INSERT INTO live_events (origin, payload, created_at) VALUES (?, ?, ?)",
+            (PROCESS_ID, json.dumps(event), event["at"])
+        )
+        conn.execute("DELETE FROM live_events WHERE seq <= ?", (cursor.lastrowid - EVENTS_RELAY_KEEP_ROWS,))
+        bump_version(NAMESPACE_EVENTS, conn=conn)
+
+def _dispatch(event: dict) -> None:
+    loop = _loop
+    if loop is None or not _subscribers:
+        return
+    try:
+        loop.call_soon_threadsafe(_fan_out, event)
+    except RuntimeError:
+        pass  # The loop has closed (shutdown)
+
+def _fan_out(event: dict) -> None:
+    for queue in list(_subscribers):
+        try:
+            queue.put_nowait(event)
+            _count("delivered")
+        except asyncio.QueueFull:
+            _count("dropped", queue.qsize() + 1)
+            _count("resyncs")
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({"type": "resync", "data": {}, "at": event["at"]})
+
+def _relay_remote_events() -> None:
+    """Delivers events that other processes stored since the last call."""
+    global _last_relayed_seq
+    with _relay_lock:
+        with get_sqlite_connection() as conn:
+            rows = conn.execute(
+                "SELECT seq, origin, payload FROM live_events WHERE seq > ? ORDER BY seq",
+                (_last_relayed_seq,)
+            ).fetchall()
+        if rows:
+            _last_relayed_seq = rows[-1]["seq"]
+    for row in rows:
+        if row["origin"] != PROCESS_ID:
+            _count("relayed_in")
+            event = json.loads(row["payload"])
+            if event["type"] == "building_state":
+                # The writing process only dropped its own snapshots. Without
+                # this, the dashboards' reload would be served (or 304'd) from
+                # this process's old snapshot.
+                snapshot_service.mark_stale(event["data"]["building_ids"])
+            _dispatch(event)
+
+register_listener(NAMESPACE_EVENTS, _relay_remote_events)
+
+# --- Subscribing ---
+
+def start_broadcaster() -> None:
+    """Binds the broadcaster to the running event loop. Call from the app's lifespan."""
+    global _loop, _last_relayed_seq
+    _loop = asyncio.get_running_loop()
+    with _relay_lock, get_sqlite_connection() as conn:
+        # Only events published from now on are relayed.
+        _last_relayed_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM live_events").fetchone()[0]
+    logger.info("Live event broadcaster started.")
+
+def subscribe() -> asyncio.Queue:
+    """Registers a new subscriber. Must be called on the event loop."""
+    queue = asyncio.Queue(maxsize=EVENTS_CLIENT_QUEUE_SIZE)
+    _subscribers.add(queue)
+    with _stats_lock:
+        _stats["subscribers"] = len(_subscribers)
+        _stats["max_subscribers"] = max(_stats["max_subscribers"], len(_subscribers))
+    return queue
+
+def unsubscribe(queue: asyncio.Queue) -> None:
+    _subscribers.discard(queue)
+    with _stats_lock:
+        _stats["subscribers"] = len(_subscribers)
+
+async def stream(queue: asyncio.Queue):
+    """Yields a subscriber's events as SSE frames, with periodic keepalives."""
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=EVENTS_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+    finally:
+        unsubscribe(queue)
+
+def get_event_stats() -> dict:
+    with _stats_lock:
+        return {**_stats, "queue_size": EVENTS_CLIENT_QUEUE_SIZE}
@@ -0,0 +1,153 @@
+# backend/services/history_service.py
+
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from sqlite_config import log_proevent_states
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# --- Write-Behind State History ---
+# Every proevent whose reactive state is changed is recorded in
+# proevent_state_history. The UPDATEs report the rows they changed (OUTPUT
+# inserted.*), and record() only appends those to an in-memory buffer, so
+# the write path never waits on SQLite. A background thread writes the
+# buffer in one transaction whenever it reaches HISTORY_FLUSH_SIZE records
+# or HISTORY_FLUSH_INTERVAL_SECONDS have passed, and stop_recorder() drains
+# what is left. If SQLite stays unavailable the buffer is capped, and the
+# oldest records are dropped (and counted) first.
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "true").lower() in ("1", "true", "yes")
+HISTORY_FLUSH_SIZE = int(os.getenv("HISTORY_FLUSH_SIZE", 500))
+HISTORY_FLUSH_INTERVAL_SECONDS = float(os.getenv("HISTORY_FLUSH_INTERVAL_SECONDS", 2))
+HISTORY_MAX_BUFFER = int(os.getenv("HISTORY_MAX_BUFFER", 100000))
+
+# (proevent_id, building_frk, state, timestamp) tuples waiting to be written
+_buffer = deque()
+_buffer_lock = threading.Lock()
+_flush_needed = threading.Event()
+# Only one flush at a time, so records are written in the order they happened.
+_flush_lock = threading.Lock()
+
+_recorder_thread = None
+_recorder_stop = threading.Event()
+
+_stats = {
+    "recorded": 0,
+    "written": 0,
+    "dropped": 0,
+    "flushes": 0,
+    "flush_errors": 0,
+    "max_buffered": 0,
+    "last_flush_ms": None,
+    "max_flush_ms": 0.0,
+    "total_flush_ms": 0.0
+}
+
+
+def record(rows: list[dict]) -> None:
+    """
+    Buffers the rows returned by an UPDATE ... OUTPUT inserted.ProEvent_PRK,
+    inserted.pevBuilding_FRK, inserted.pevReactive_FRK. Never blocks on I/O.
+    """
+    if not HISTORY_ENABLED or not rows:
+        return
+    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    records = [
+        (row["id"], row["building_id"], "armed" if row["reactive_state"] == 1 else "disarmed", timestamp)
+        for row in rows
+    ]
+    with _buffer_lock:
+        _buffer.extend(records)
+        overflow = len(_buffer) - HISTORY_MAX_BUFFER
+        for _ in range(max(0, overflow)):
+            _buffer.popleft()
+        _stats["recorded"] += len(records)
+        if overflow > 0:
+            _stats["dropped"] += overflow
+        _stats["max_buffered"] = max(_stats["max_buffered"], len(_buffer))
+        size = len(_buffer)
+    if size >= HISTORY_FLUSH_SIZE:
+        _flush_needed.set()
+
+def flush() -> int:
+    """
+    Writes everything buffered so far in batches of HISTORY_FLUSH_SIZE, one
+    transaction each. Returns the number of records written. On error the
+    unwritten records go back to the front of the buffer for the next flush.
+    """
+    written = 0
+    with _flush_lock:
+        while True:
+            with _buffer_lock:
+                batch = [_buffer.popleft() for _ in range(min(HISTORY_FLUSH_SIZE, len(_buffer)))]
+            if not batch:
+                break
+            started = time.perf_counter()
+            try:
+                log_proevent_states(batch)
+            except Exception:
+                with _buffer_lock:
+                    _buffer.extendleft(reversed(batch))
+                    _stats["flush_errors"] += 1
+                raise
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            written += len(batch)
+            with _buffer_lock:
+                _stats["written"] += len(batch)
+                _stats["flushes"] += 1
+                _stats["last_flush_ms"] = round(elapsed_ms, 3)
+                _stats["max_flush_ms"] = max(_stats["max_flush_ms"], round(elapsed_ms, 3))
+                _stats["total_flush_ms"] += elapsed_ms
+    return written
+
+def _recorder_loop():
+    while not _recorder_stop.is_set():
+        _flush_needed.wait(HISTORY_FLUSH_INTERVAL_SECONDS)
+        _flush_needed.clear()
+        try:
+            flush()
+        except Exception as e:
+            logger.error(f"Failed to write proevent state history: {e}")
+            # Back off instead of retrying in a tight loop while SQLite is unavailable.
+            _recorder_stop.wait(HISTORY_FLUSH_INTERVAL_SECONDS)
+
+def start_recorder() -> None:
+    """Starts the thread that writes buffered history in the background."""
+    global _recorder_thread
+    if not HISTORY_ENABLED or (_recorder_thread and _recorder_thread.is_alive()):
+        return
+    _recorder_stop.clear()
+    _recorder_thread = threading.Thread(target=_recorder_loop, name="history-recorder", daemon=True)
+    _recorder_thread.start()
+    logger.info("Proevent history recorder started.")
+
+def stop_recorder() -> None:
+    """Stops the recorder thread and writes whatever is still buffered."""
+    _recorder_stop.set()
+    _flush_needed.set()
+    if _recorder_thread:
+        _recorder_thread.join(timeout=10)
+    try:
+        written = flush()
+        logger.info(f"Proevent history recorder stopped; {written} buffered records written on shutdown.")
+    except Exception as e:
+        with _buffer_lock:
+            remaining = len(_buffer)
+        logger.error(f"Proevent history recorder stopped with {remaining} records unwritten: {e}")
+
+def get_history_stats() -> dict:
+    """Returns the buffer depth, flush latency and record counters."""
+    with _buffer_lock:
+        stats = dict(_stats)
+        stats["buffered"] = len(_buffer)
+    total_flush_ms = stats.pop("total_flush_ms")
+    stats["avg_flush_ms"] = round(total_flush_ms / stats["flushes"], 3) if stats["flushes"] else None
+    stats.update({
+        "enabled": HISTORY_ENABLED,
+        "flush_size": HISTORY_FLUSH_SIZE,
+        "flush_interval_seconds": HISTORY_FLUSH_INTERVAL_SECONDS
+    })
+    return stats
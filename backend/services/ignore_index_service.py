@@ -0,0 +1,177 @@
+# backend/services/ignore_index_service.py
+
+import threading
+from sqlite_config import (get_ignored_proevents, set_proevent_ignore_status,
+                           set_proevent_ignore_status_bulk)
+from shared_state import NAMESPACE_IGNORE_RULES, bump_version, register_listener
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# --- In-Memory Ignore Rule Index ---
+# building_id -> frozenset of proevent IDs ignored on disarm. Loaded once from
+# SQLite and kept current by the write-through setters below, so lookups never
+# touch the database. Writes made by other processes trigger a rebuild through
+# the shared 'ignore_rules' version.
+_index = {}
+# proevent_id -> building_id, so a proevent moved between buildings is removed
+# from its old building's set.
+_proevent_buildings = {}
+_index_lock = threading.Lock()
+_loaded = False
+# Serializes diff-then-write updates so two saves can't diff against the same state.
+_write_lock = threading.Lock()
+
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "rebuilds": 0
+}
+
+
+def rebuild_index() -> None:
+    """
+    (Re)loads the whole index from SQLite. Called once at startup, and again
+    whenever the ignore table may have been changed by another process.
+    """
+    global _index, _proevent_buildings, _loaded
+    ignored_proevents = get_ignored_proevents()
+
+    grouped = {}
+    proevent_buildings = {}
+    for pid, flags in ignored_proevents.items():
+        building_id = flags.get("building_frk")
+        proevent_buildings[pid] = building_id
+        if flags.get("ignore_on_disarm", False):
+            grouped.setdefault(building_id, set()).add(pid)
+
+    with _index_lock:
+        _index = {building_id: frozenset(ids) for building_id, ids in grouped.items()}
+        _proevent_buildings = proevent_buildings
+        _loaded = True
+        _stats["rebuilds"] += 1
+
+    logger.info(f"Ignore index rebuilt: {len(proevent_buildings)} rules across {len(grouped)} buildings.")
+
+def _ensure_loaded():
+    if not _loaded:
+        rebuild_index()
+
+def get_ignored_ids(building_id: int) -> frozenset:
+    """Returns the proevent IDs ignored on disarm for a building. O(1)."""
+    _ensure_loaded()
+    with _index_lock:
+        ids = _index.get(building_id)
+        if ids is None:
+            _stats["misses"] += 1
+            return frozenset()
+        _stats["hits"] += 1
+        return ids
+
+def is_ignored(building_id: int, proevent_id: int) -> bool:
+    """Returns True if the proevent is ignored on disarm."""
+    return proevent_id in get_ignored_ids(building_id)
+
+def get_ignored_ids_by_building() -> dict[int, frozenset]:
+    """Returns a snapshot of the whole index, for evaluating all buildings at once."""
+    _ensure_loaded()
+    with _index_lock:
+        _stats["hits"] += 1
+        return dict(_index)
+
+def _apply_to_index(proevent_id: int, building_frk: int, ignore_on_disarm: bool) -> None:
+    """Updates the index for one rule. Must be called with _index_lock held."""
+    old_building = _proevent_buildings.get(proevent_id)
+    if old_building is not None and proevent_id in _index.get(old_building, ()):
+        remaining = _index[old_building] - {proevent_id}
+        if remaining:
+            _index[old_building] = remaining
+        else:
+            del _index[old_building]
+
+    _proevent_buildings[proevent_id] = building_frk
+    if ignore_on_disarm:
+        _index[building_frk] = _index.get(building_frk, frozenset()) | {proevent_id}
+
+# --- Write-Through Setters ---
+
+def set_ignore_status(proevent_id: int, building_frk: int, device_prk: int,
+                      ignore_on_arm: bool, ignore_on_disarm: bool) -> bool:
+    """Saves one ignore rule to SQLite and, if that succeeds, to the index."""
+    _ensure_loaded()
+    success = set_proevent_ignore_status(proevent_id, building_frk, device_prk,
+                                         ignore_on_arm, ignore_on_disarm)
+    if success:
+        with _index_lock:
+            _apply_to_index(proevent_id, building_frk, ignore_on_disarm)
+        bump_version(NAMESPACE_IGNORE_RULES)
+    return success
+
+def set_ignore_status_bulk(items: list[dict]) -> int:
+    """
+    Saves many ignore rules to SQLite in one transaction and then applies them
+    to the index. Items use the same keys as set_proevent_ignore_status_bulk().
+    """
+    _ensure_loaded()
+    count = set_proevent_ignore_status_bulk(items)
+    with _index_lock:
+        for item in items:
+            _apply_to_index(item["proevent_id"], item["building_frk"],
+                            bool(item["ignore_on_disarm"]))
+    if count:
+        bump_version(NAMESPACE_IGNORE_RULES)
+    return count
+
+def diff_ignore_status(items: list[dict]) -> list[dict]:
+    """
+    Returns the items that would change a rule: those whose ignore flag or
+    building differs from the index. Turning off a rule that doesn't exist
+    is not a change.
+    """
+    _ensure_loaded()
+    changed = []
+    with _index_lock:
+        for item in items:
+            proevent_id = item["proevent_id"]
+            old_building = _proevent_buildings.get(proevent_id)
+            currently_ignored = proevent_id in _index.get(old_building, ())
+            wanted = bool(item["ignore_on_disarm"])
+            if wanted != currently_ignored or (old_building is not None and old_building != item["building_frk"]):
+                changed.append(item)
+    return changed
+
+def apply_ignore_changes(items: list[dict]) -> dict:
+    """
+    Diffs the items against the current rules and saves only the ones that
+    change, in one transaction. Returns {"ignored": [ids], "unignored": [ids],
+    "unchanged": count, "buildings": [building IDs touched]}. The buildings
+    include the previous building of a rule that moved.
+    """
+    with _write_lock:
+        changed = diff_ignore_status(items)
+        buildings = {item["building_frk"] for item in changed}
+        # A rule moved to another building changes the old building's set too.
+        with _index_lock:
+            buildings.update(
+                _proevent_buildings[item["proevent_id"]] for item in changed
+                if _proevent_buildings.get(item["proevent_id"]) is not None
+            )
+        set_ignore_status_bulk(changed)
+    return {
+        "ignored": [item["proevent_id"] for item in changed if item["ignore_on_disarm"]],
+        "unignored": [item["proevent_id"] for item in changed if not item["ignore_on_disarm"]],
+        "unchanged": len(items) - len(changed),
+        "buildings": sorted(buildings)
+    }
+
+def get_index_stats() -> dict:
+    """Returns hit/miss/rebuild counters and the size of the index."""
+    with _index_lock:
+        return {
+            **_stats,
+            "loaded": _loaded,
+            "buildings": len(_index),
+            "ignored_proevents": sum(len(ids) for ids in _index.values())
+        }
+
+register_listener(NAMESPACE_IGNORE_RULES, rebuild_index)
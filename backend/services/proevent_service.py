@@ -1,13 +1,56 @@
 # backend/services/proevent_service.py
 
-from sqlite_config import get_building_time, get_ignored_proevents
-from services import device_service, proserver_service, cache_service
+from services import (device_service, proserver_service, cache_service, ignore_index_service,
+                      snapshot_service, event_service)
+from services.schedule_table import ScheduleTable, get_schedule_table
+from shared_state import check_for_changes
+import config
+import metrics
+import profiling
 from logger import get_logger
+from concurrent.futures import ThreadPoolExecutor, wait
+import contextvars
 from datetime import datetime
+import os
+import threading
+import time
 import traceback
 
 logger = get_logger(__name__)
 
+# --- Scheduler Execution Mode ---
+# "batched":  every set of buildings is applied with a few set-based statements (default).
+# "serial":   buildings are applied one at a time, one statement each.
+# "parallel": buildings are applied one statement each across a bounded thread
+#             pool, sized to the SQLAlchemy connection pool by default.
+SCHEDULER_EXECUTION_MODE = os.getenv("SCHEDULER_EXECUTION_MODE", "batched").lower()
+SCHEDULER_MAX_WORKERS = int(os.getenv("SCHEDULER_MAX_WORKERS", 0))  # 0 = size of the DB pool
+# Buildings not finished this long after the tick started are reported as
+# overdue instead of running into the next one-minute tick.
+SCHEDULER_TICK_DEADLINE_SECONDS = float(os.getenv("SCHEDULER_TICK_DEADLINE_SECONDS", 55))
+
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = set()  # Building IDs still being applied by an earlier tick
+_in_flight_lock = threading.Lock()
+
+# --- Scheduler Metrics ---
+# scope: "sweep" (every building) or "transition" (buildings whose schedule just changed)
+_tick_seconds = metrics.histogram(
+    "scheduler_tick_duration_seconds",
+    "Duration of one check_and_manage_scheduled_states() run.",
+    ("scope", "mode")
+)
+# outcome: evaluated, armed, disarmed, skipped, failed, overdue
+_tick_buildings = metrics.counter(
+    "scheduler_buildings_total",
+    "Buildings handled by scheduler runs, by outcome.",
+    ("outcome",)
+)
+_tick_rows_changed = metrics.counter("scheduler_rows_changed_total", "ProEvent rows whose state the scheduler changed.")
+_tick_round_trips = metrics.counter("scheduler_round_trips_total", "MSSQL round trips made by scheduler runs.")
+_tick_errors = metrics.counter("scheduler_tick_errors_total", "Scheduler runs that ended with an error.")
+
 
 def get_all_proevents_for_building(building_id: int, search: str | None = None,
                                  limit: int = 100, offset: int = 0) -> list[dict]:
@@ -16,6 +59,10 @@ def get_all_proevents_for_building(building_id: int, search: str | None = None,
     """
     logger.debug(f"Fetching proevents for building {building_id} with search='{search}'")
     try:
+        if snapshot_service.SNAPSHOT_ENABLED:
+            return snapshot_service.search_proevents(
+                building_id, search=search, limit=limit, offset=offset
+            )
         proevents = device_service.get_devices(
             building_id=building_id, search=search, limit=limit, offset=offset
         )
@@ -28,15 +75,16 @@ def get_all_proevents_for_building(building_id: int, search: str | None = None,
         return []
 
 def set_proevent_reactive_for_building(building_id: int, reactive: int,
-                                       ignored_ids: list[int] | None = None) -> int:
+                                       ignored_ids: list[int] | None = None,
+                                       force: bool = False) -> int:
     """
     Sets the reactive state for all proevents in a building,
-    skipping those in the ignored_ids list.
+    skipping those in the ignored_ids list. With force=True the write
+    goes to the database even if this target was applied recently.
     """
     if ignored_ids is None:
         ignored_ids = []
-        
-    print(ignored_ids)
+
     action = "Arm" if reactive == 1 else "Disarm"
     logger.info(f"Setting reactive state for building {building_id} to {action}, ignoring {len(ignored_ids)} proevents.")
     
@@ -44,11 +92,13 @@ def set_proevent_reactive_for_building(building_id: int, reactive: int,
         affected_rows = device_service.set_reactive_state_for_building(
             building_id=building_id, 
             reactive=reactive, 
-            ignored_ids=ignored_ids
+            ignored_ids=ignored_ids,
+            force=force
         )
         
         if affected_rows > 0:
             logger.info(f"Updated {affected_rows} proevents for building {building_id} to state {reactive}.")
+            _state_changed([building_id], reactive)
         return affected_rows
     except AttributeError:
          logger.error("CRITICAL: device_service.set_reactive_state_for_building() function is missing from device_service.py.")
@@ -57,6 +107,14 @@ def set_proevent_reactive_for_building(building_id: int, reactive: int,
         logger.error(f"Error in bulk {action} for building {building_id}: {e}")
         return 0
 
+def _state_changed(building_ids: list[int], reactive: int) -> None:
+    """Called after proevent states were written: drops the snapshots and tells the dashboards."""
+    snapshot_service.mark_stale(building_ids)
+    event_service.publish("building_state", {
+        "building_ids": list(building_ids),
+        "state": "armed" if reactive == 1 else "disarmed"
+    })
+
 def get_proevents_to_change(building_id: int, target_state: int,
                             ignored_ids: list[int]) -> list[dict]:
     """
@@ -97,22 +155,15 @@ def reevaluate_building_state(building_id: int):
         logger.info(f"Panel Status: {'ARMED' if panel_is_armed else 'DISARMED'}")
 
         # 2. Get schedule from SQLite
-        times = get_building_time(building_id)
-        if not isinstance(times, dict) or not times.get("start_time") or not times.get("end_time"):
+        schedules = get_schedule_table()
+        if not schedules.has_schedule(building_id):
             logger.warning(f"Skipping re-evaluation for building {building_id} - no schedule.")
             return
 
-        start_time = datetime.strptime(times["start_time"], "%H:%M").time()
-        end_time = datetime.strptime(times["end_time"], "%H:%M").time()
-        now = datetime.now().time()
-        is_within_schedule = start_time <= now < end_time
+        is_within_schedule = schedules.is_active(building_id, datetime.now())
 
         # 3. Get ignored IDs
-        ignored_proevents_map = get_ignored_proevents()
-        ignored_on_disarm_ids = [
-            pid for pid, flags in ignored_proevents_map.items()
-            if flags.get("building_frk") == building_id and flags.get("ignore_on_disarm", False)
-        ]
+        ignored_on_disarm_ids = list(ignore_index_service.get_ignored_ids(building_id))
         
         # --- THIS IS THE NEW LOGGING LINE ---
         logger.info(f"RE-EVALUATE: Building {building_id} - Ignored IDs list: {ignored_on_disarm_ids}")
@@ -139,16 +190,331 @@ def reevaluate_building_state(building_id: int):
         # Re-raise so the API endpoint can return a 500
         raise
 
-def check_and_manage_scheduled_states():
+def plan_scheduled_states(all_buildings: list[dict], schedules: ScheduleTable,
+                          panel_is_armed: bool, now: datetime,
+                          start_alert_ids=frozenset()) -> dict:
+    """
+    Decides, without touching MSSQL, what every building needs this tick.
+
+    Returns a plan with the building IDs to arm, the building IDs to disarm,
+    the building IDs that need a 'not-armed' check, the names of buildings
+    in start_alert_ids that should get the schedule-start alert, and the
+    IDs that were skipped. Start alerts are driven by the schedule timeline,
+    which knows when a start transition actually happened.
+    """
+    active_mask = schedules.active_mask(now)
+
+    plan = {
+        "arm": [],
+        "disarm": [],
+        "not_armed_check": [],
+        "start_alerts": [],
+        "skipped": []
+    }
+
+    for building in all_buildings:
+        building_id = building["id"]
+        if not schedules.has_schedule(building_id):
+            logger.warning(f"Skipping building {building_id} - invalid or no schedule set.")
+            plan["skipped"].append(building_id)
+            continue
+
+        is_within_schedule = schedules.is_active(building_id, now, active_mask)
+
+        if panel_is_armed:
+            if building_id in start_alert_ids and is_within_schedule:
+                plan["start_alerts"].append(building["name"])
+            if is_within_schedule:
+                plan["arm"].append(building_id)
+            else:
+                plan["disarm"].append(building_id)
+        elif is_within_schedule:
+            plan["not_armed_check"].append(building_id)
+
+    return plan
+
+def _count_proevents(building_ids: list[int], reactive: int,
+                     ignored_by_building: dict, stats: dict) -> dict[int, dict]:
+    """
+    Returns {building_id: {"total", "pending"}} leaving out each building's
+    ignored IDs, from the snapshots when enabled and otherwise with one query.
     """
-    Checks building schedules and updates proevent states.
+    if snapshot_service.SNAPSHOT_ENABLED:
+        return snapshot_service.get_proevent_counts(building_ids, reactive, ignored_by_building)
+    stats["round_trips"] += 1
+    return device_service.get_proevent_counts_for_buildings(
+        building_ids, reactive,
+        [pid for building_id in building_ids for pid in ignored_by_building.get(building_id, [])]
+    )
+
+def _apply_state_to_buildings(building_ids: list[int], reactive: int,
+                              ignored_by_building: dict[int, frozenset],
+                              stats: dict) -> list[int]:
+    """
+    Pushes a target reactive state to a set of buildings with set-based
+    statements, writing only where something actually differs.
+
+    Buildings whose target was applied recently are skipped without any
+    query. The rest are counted in one query, and only those with pending
+    rows are included in the single UPDATE. Returns the IDs of buildings
+    that had rows changed; counters are accumulated into stats.
+    """
+    def building_ignored_ids(building_id):
+        # Ignore flags only apply when disarming.
+        return ignored_by_building.get(building_id, []) if reactive == 0 else []
+
+    candidates = [
+        building_id for building_id in building_ids
+        if not device_service.is_state_applied(building_id, reactive, building_ignored_ids(building_id))
+    ]
+    stats["buildings_skipped"] += len(building_ids) - len(candidates)
+    if not candidates:
+        return []
+
+    with profiling.span("count_pending", buildings=len(candidates)):
+        counts = _count_proevents(
+            candidates, reactive, {b: building_ignored_ids(b) for b in candidates}, stats
+        )
+
+    to_write = [
+        building_id for building_id in candidates
+        if counts.get(building_id, {}).get("pending", 0) > 0
+    ]
+    stats["rows_skipped"] += sum(c["total"] - c["pending"] for c in counts.values())
+
+    if to_write:
+        with profiling.span("write", buildings=len(to_write)):
+            stats["rows_changed"] += device_service.set_reactive_state_for_buildings(
+                to_write, reactive,
+                [pid for building_id in to_write for pid in building_ignored_ids(building_id)]
+            )
+        stats["round_trips"] += 1
+        _state_changed(to_write, reactive)
+
+    for building_id in candidates:
+        device_service.record_applied_state(building_id, reactive, building_ignored_ids(building_id))
+
+    return to_write
+
+def _run_batched(plan: dict, building_names: dict,
+                 ignored_by_building: dict[int, frozenset], stats: dict) -> None:
+    """Applies a plan with set-based statements covering many buildings each."""
+    with profiling.span("arm", buildings=len(plan["arm"])):
+        armed_buildings = _apply_state_to_buildings(plan["arm"], 1, ignored_by_building, stats)
+    with profiling.span("disarm", buildings=len(plan["disarm"])):
+        disarmed_buildings = _apply_state_to_buildings(plan["disarm"], 0, ignored_by_building, stats)
+    stats["armed"] += len(armed_buildings)
+    stats["disarmed"] += len(disarmed_buildings)
+
+    # Only buildings that actually had armed, non-ignored proevents get
+    # the disarm alert.
+    for building_id in disarmed_buildings:
+        building_name = building_names[building_id]
+        logger.info(f"Panel is ARMED, outside schedule. Sent common disarm alert for {building_name}.")
+        proserver_service.send_proserver_notification(
+            building_name=building_name,
+            device_id=None
+        )
+
+    if plan["not_armed_check"]:
+        logger.info(f"Panel is DISARMED. Checking 'not-armed' alerts for {len(plan['not_armed_check'])} buildings")
+        counts = _count_proevents(plan["not_armed_check"], 1, ignored_by_building, stats)
+
+        for building_id in plan["not_armed_check"]:
+            _send_not_armed_alert_if_needed(
+                building_names[building_id], counts.get(building_id, {}).get("total", 0)
+            )
+
+def _send_not_armed_alert_if_needed(building_name: str, unignored_count: int) -> None:
+    if unignored_count > 0:
+        logger.debug(f"Panel is DISARMED within schedule. Sending common 'not-armed' alert for {building_name}")
+        proserver_service.send_proserver_notification(
+            building_name=building_name,
+            device_id=None
+        )
+    else:
+        logger.debug(f"Panel is DISARMED within schedule for {building_name}, but all proevents are ignored. No alert.")
+
+def _apply_single_building(building_id: int, building_name: str, action: str,
+                           ignored_ids: frozenset) -> dict:
+    """
+    Applies one building's part of the plan with its own statement.
+    Runs on a pool thread in parallel mode, so it only returns results and
+    never touches the shared stats.
+    """
+    if action in ("arm", "disarm"):
+        reactive = 1 if action == "arm" else 0
+        target_ignored_ids = list(ignored_ids) if action == "disarm" else []
+        if device_service.is_state_applied(building_id, reactive, target_ignored_ids):
+            return {"action": action, "rows_changed": 0, "round_trips": 0, "unchanged": True}
+
+    if action == "arm":
+        changed = device_service.set_reactive_state_for_building(building_id, 1, [])
+        if changed > 0:
+            _state_changed([building_id], 1)
+        return {"action": action, "rows_changed": changed, "round_trips": 1}
+
+    if action == "disarm":
+        changed = device_service.set_reactive_state_for_building(building_id, 0, list(ignored_ids))
+        # The UPDATE only touches rows that differ, so a non-zero count means
+        # something was actually armed and the alert is due.
+        if changed > 0:
+            _state_changed([building_id], 0)
+            logger.info(f"Panel is ARMED, outside schedule. Sent common disarm alert for {building_name}.")
+            proserver_service.send_proserver_notification(
+                building_name=building_name,
+                device_id=None
+            )
+        return {"action": action, "rows_changed": changed, "round_trips": 1}
+
+    result = {"action": action, "rows_changed": 0, "round_trips": 0}
+    counts = _count_proevents([building_id], 1, {building_id: ignored_ids}, result)
+    _send_not_armed_alert_if_needed(building_name, counts.get(building_id, {}).get("total", 0))
+    return result
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Returns the pool used in parallel mode, created on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            max_workers = SCHEDULER_MAX_WORKERS
+            if max_workers <= 0:
+                max_workers = config.get_engine().pool.size()
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scheduler-worker")
+            logger.info(f"Scheduler worker pool started with {max_workers} threads.")
+        return _executor
+
+def _record_building_result(building_id: int, result: dict, stats: dict) -> None:
+    if result.get("unchanged"):
+        stats["buildings_skipped"] += 1
+    stats["round_trips"] += result["round_trips"]
+    stats["rows_changed"] += result["rows_changed"]
+    if result["action"] == "arm" and result["rows_changed"] > 0:
+        stats["armed"] += 1
+    elif result["action"] == "disarm" and result["rows_changed"] > 0:
+        stats["disarmed"] += 1
+
+def _run_per_building(plan: dict, building_names: dict,
+                      ignored_by_building: dict[int, frozenset], stats: dict,
+                      parallel: bool, deadline: float) -> None:
+    """
+    Applies a plan one building at a time, either serially or across the
+    worker pool. A failure in one building is logged and counted without
+    affecting the others. Buildings not finished by the deadline are
+    reported; buildings still running from an earlier tick are left alone.
+    """
+    work = (
+        [(building_id, "arm") for building_id in plan["arm"]]
+        + [(building_id, "disarm") for building_id in plan["disarm"]]
+        + [(building_id, "not_armed_check") for building_id in plan["not_armed_check"]]
+    )
+
+    with _in_flight_lock:
+        still_running = [building_id for building_id, _ in work if building_id in _in_flight]
+        work = [(building_id, action) for building_id, action in work if building_id not in _in_flight]
+        _in_flight.update(building_id for building_id, _ in work)
+    if still_running:
+        stats["overdue"] += len(still_running)
+        logger.warning(f"{len(still_running)} buildings are still being applied by an earlier tick and were not re-queued: {still_running}")
+
+    def finish(building_id):
+        with _in_flight_lock:
+            _in_flight.discard(building_id)
+
+    def run(building_id, action):
+        try:
+            with profiling.span("building", building_id=building_id, action=action):
+                return _apply_single_building(
+                    building_id, building_names[building_id], action,
+                    ignored_by_building.get(building_id, frozenset())
+                )
+        finally:
+            finish(building_id)
+
+    if not parallel:
+        for index, (building_id, action) in enumerate(work):
+            if time.monotonic() >= deadline:
+                remaining = [b for b, _ in work[index:]]
+                for b in remaining:
+                    finish(b)
+                stats["overdue"] += len(remaining)
+                logger.warning(f"Tick deadline reached; {len(remaining)} buildings not applied this tick: {remaining}")
+                break
+            try:
+                _record_building_result(building_id, run(building_id, action), stats)
+            except Exception as e:
+                stats["failed"] += 1
+                logger.error(f"Error applying schedule for building {building_id}: {e}")
+        return
+
+    executor = _get_executor()
+    # Each task runs in a copy of this context, so its spans land in the tick's profile.
+    futures = {
+        executor.submit(contextvars.copy_context().run, run, building_id, action): building_id
+        for building_id, action in work
+    }
+    done, not_done = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+
+    for future in done:
+        building_id = futures[future]
+        try:
+            _record_building_result(building_id, future.result(), stats)
+        except Exception as e:
+            stats["failed"] += 1
+            logger.error(f"Error applying schedule for building {building_id}: {e}")
+
+    if not_done:
+        overdue = []
+        for future in not_done:
+            building_id = futures[future]
+            overdue.append(building_id)
+            # Queued work that never started is dropped; running work is left
+            # to finish and stays in _in_flight until it does.
+            if future.cancel():
+                finish(building_id)
+        stats["overdue"] += len(overdue)
+        logger.warning(f"Tick deadline reached; {len(overdue)} buildings not finished this tick: {sorted(overdue)}")
+
+def check_and_manage_scheduled_states(building_ids=None, start_alert_ids=frozenset()):
+    """
+    Checks building schedules and updates proevent states, for every
+    building or only for building_ids (the buildings whose schedule just
+    had a transition). Buildings in start_alert_ids get the schedule-start
+    alert if the panel is armed.
     If panel is ARMED: Arms/disarms devices based on schedule.
     If panel is DISARMED: Sends 'notarmed' alerts for devices that *should* be
     armed but are not ignored.
+
+    All buildings are evaluated in one pass: schedules and ignore flags are
+    loaded once, buildings are split into 'arm' and 'disarm' sets, and each
+    set is pushed to ProEvent_TBL with a constant number of set-based
+    statements rather than one or two round trips per building. Only rows
+    that differ from the target are written, and buildings already in
+    their target state cost no writes at all.
+
+    With SCHEDULER_EXECUTION_MODE set to 'serial' or 'parallel', buildings
+    are instead applied one statement each, one at a time or across a
+    bounded worker pool, with per-building error isolation and a tick
+    deadline.
     """
     try:
         logger.info("Scheduler running: Checking building schedules...")
-        
+        tick_started = time.perf_counter()
+        tick_deadline = time.monotonic() + SCHEDULER_TICK_DEADLINE_SECONDS
+        # Pick up panel status, ignore rule and schedule changes made by
+        # other processes before deciding anything.
+        check_for_changes()
+        stats = {
+            "round_trips": 0,
+            "rows_changed": 0,
+            "rows_skipped": 0,
+            "buildings_skipped": 0,
+            "armed": 0,
+            "disarmed": 0,
+            "failed": 0,
+            "overdue": 0
+        }
+
         panel_is_armed = cache_service.get_cache_value('panel_armed')
         if panel_is_armed is None:
             logger.warning("Panel status not in cache. Defaulting to 'Armed'.")
@@ -156,89 +522,57 @@ def check_and_manage_scheduled_states():
             
         logger.info(f"Panel Status: {'ARMED' if panel_is_armed else 'DISARMED'}")
 
-        all_buildings = device_service.get_distinct_buildings()
-        ignored_proevents_map = get_ignored_proevents()
-        now = datetime.now().time()
-        now_time_minute = now.replace(second=0, microsecond=0)
+        with profiling.span("load_inputs"):
+            all_buildings = device_service.get_distinct_buildings()
+            if building_ids is not None:
+                wanted = set(building_ids)
+                all_buildings = [b for b in all_buildings if b["id"] in wanted]
+            building_names = {b["id"]: b["name"] for b in all_buildings}
+            schedules = get_schedule_table()
+            ignored_by_building = ignore_index_service.get_ignored_ids_by_building()
 
-        for building in all_buildings:
-            building_id = building["id"]
-            building_name = building["name"]
-            
-            times = get_building_time(building_id)
-            
-            if not isinstance(times, dict) or not times.get("start_time") or not times.get("end_time"):
-                logger.warning(f"Skipping building {building_id} - invalid or no schedule set (times: {times}).")
-                continue
+        with profiling.span("plan", buildings=len(all_buildings)):
+            plan = plan_scheduled_states(all_buildings, schedules, panel_is_armed, datetime.now(),
+                                         start_alert_ids)
 
-            try:
-                start_time = datetime.strptime(times["start_time"], "%H:%M").time()
-                end_time = datetime.strptime(times["end_time"], "%H:%M").time()
-            except ValueError:
-                logger.error(f"Invalid time format for building {building_id}. Skipping.")
-                continue
-
-            is_start_time = (now_time_minute == start_time)
-            is_within_schedule = start_time <= now < end_time
-            
-            ignored_on_disarm_ids = [
-                pid for pid, flags in ignored_proevents_map.items()
-                if flags.get("building_frk") == building_id and flags.get("ignore_on_disarm", False)
-            ]
-            
-            if panel_is_armed:
-                logger.debug(f"Panel is ARMED. Checking schedule for {building_name}")
-                
-                if is_start_time:
-                    logger.info(f"Panel is ARMED at schedule start for {building_name}. Sending common alert.")
-                    proserver_service.send_proserver_notification(
-                        building_name=building_name,
-                        device_id=None 
-                    )
-
-                if is_within_schedule:
-                    set_proevent_reactive_for_building(building_id, 1, [])
-                else:
-                    proevents_to_disarm = get_proevents_to_change(
-                        building_id, 0, ignored_on_disarm_ids
-                    )
-                    
-                    if proevents_to_disarm:
-                        set_proevent_reactive_for_building(building_id, 0, ignored_on_disarm_ids)
-                        
-                        logger.info(f"Panel is ARMED, outside schedule. Sent common disarm alert for {building_name}.")
-                        proserver_service.send_proserver_notification(
-                            building_name=building_name,
-                            device_id=None 
-                        )
-            
+        for building_name in plan["start_alerts"]:
+            logger.info(f"Panel is ARMED at schedule start for {building_name}. Sending common alert.")
+            proserver_service.send_proserver_notification(
+                building_name=building_name,
+                device_id=None
+            )
+
+        with profiling.span("apply", mode=SCHEDULER_EXECUTION_MODE):
+            if SCHEDULER_EXECUTION_MODE in ("serial", "parallel"):
+                _run_per_building(
+                    plan, building_names, ignored_by_building, stats,
+                    parallel=(SCHEDULER_EXECUTION_MODE == "parallel"),
+                    deadline=tick_deadline
+                )
             else:
-                if is_within_schedule:
-                    logger.info(f"Panel is DISARMED. Checking 'not-armed' alerts for {building_name}")
-                    
-                    all_proevents = get_all_proevents_for_building(building_id, limit=10000)
-                    
-                    alert_needed = False
-                    for proevent in all_proevents:
-                        proevent_id = proevent["id"]
-                        is_ignored_on_disarm = proevent_id in ignored_on_disarm_ids
-                        
-                        if not is_ignored_on_disarm:
-                            alert_needed = True
-                            break 
-                    
-                    if alert_needed:
-                        logger.debug(f"Panel is DISARMED within schedule. Sending common 'not-armed' alert for {building_name}")
-                        proserver_service.send_proserver_notification(
-                            building_name=building_name,
-                            device_id=None 
-                        )
-                    else:
-                         logger.debug(f"Panel is DISARMED within schedule for {building_name}, but all proevents are ignored. No alert.")
-                else:
-                    logger.debug(f"Panel is DISARMED and outside schedule for {building_name}. No action.")
-                    pass 
+                _run_batched(plan, building_names, ignored_by_building, stats)
+
+        elapsed_ms = (time.perf_counter() - tick_started) * 1000
+        scope = "sweep" if building_ids is None else "transition"
+        logger.info(
+            f"Scheduler {scope} ({SCHEDULER_EXECUTION_MODE}) finished in {elapsed_ms:.1f} ms: "
+            f"{len(all_buildings)} buildings, {stats['armed']}/{len(plan['arm'])} armed, "
+            f"{stats['disarmed']}/{len(plan['disarm'])} disarmed, "
+            f"{len(plan['skipped'])} skipped, {stats['failed']} failed, "
+            f"{stats['overdue']} overdue; {stats['rows_changed']} rows changed, "
+            f"{stats['rows_skipped']} rows already in state, "
+            f"{stats['buildings_skipped']} buildings unchanged since last apply; "
+            f"{stats['round_trips']} MSSQL round trips."
+        )
+        _tick_seconds.labels(scope, SCHEDULER_EXECUTION_MODE).observe(elapsed_ms / 1000)
+        for outcome, count in (("evaluated", len(all_buildings)), ("armed", stats["armed"]),
+                               ("disarmed", stats["disarmed"]), ("skipped", len(plan["skipped"])),
+                               ("failed", stats["failed"]), ("overdue", stats["overdue"])):
+            _tick_buildings.labels(outcome).inc(count)
+        _tick_rows_changed.inc(stats["rows_changed"])
+        _tick_round_trips.inc(stats["round_trips"])
 
     except Exception as e:
+        _tick_errors.inc()
         tb_str = traceback.format_exc()
-        logger.error(f"Critical error in scheduled job: {e}\n{tb_str}")
\ No newline at end of file
+        logger.error(f"Critical error in scheduled job: {e}\n{tb_str}")
@@ -1,26 +1,287 @@
 import socket
+import select
 import os
+import queue
+import threading
+import time
 from logger import get_logger
+import metrics
+import profiling
 
 logger = get_logger(__name__)
 
 PROSERVER_IP = os.getenv("PROSERVER_IP", "10.192.0.173")
 PROSERVER_PORT = int(os.getenv("PROSERVER_PORT", 7777))
 
-def send_proserver_notification(building_name: str, device_id: int):
+# --- Dispatcher Settings ---
+PROSERVER_CONNECT_TIMEOUT_SECONDS = float(os.getenv("PROSERVER_CONNECT_TIMEOUT_SECONDS", 5))
+PROSERVER_QUEUE_SIZE = int(os.getenv("PROSERVER_QUEUE_SIZE", 1000))
+PROSERVER_MAX_BATCH = 50               # Messages coalesced into one write
+PROSERVER_DEDUPE_WINDOW_SECONDS = 30   # Identical messages within this window are sent once
+PROSERVER_BACKOFF_INITIAL_SECONDS = 1
+PROSERVER_BACKOFF_MAX_SECONDS = 60
+
+_send_seconds = metrics.histogram(
+    "proserver_send_duration_seconds",
+    "Time to write one batch to ProServer, including reconnecting."
+)
+_send_failures = metrics.counter("proserver_send_failures_total", "Batch writes to ProServer that failed.")
+_messages_sent = metrics.counter("proserver_messages_sent_total", "Notifications delivered to ProServer.")
+
+
+class NotificationDispatcher:
+    """
+    Delivers ProServer messages from a background thread over one persistent
+    TCP connection.
+
+    Callers only put messages on a bounded queue and never wait for the
+    network. The sender thread takes every message that is waiting (up to
+    max_batch), writes them in a single sendall(), and on failure reconnects
+    with exponential backoff and retries the same batch. Identical messages
+    enqueued within dedupe_window seconds are sent once.
     """
-    Sends a unified notification to the ProServer.
+
+    def __init__(self, host: str, port: int,
+                 connect_timeout: float = PROSERVER_CONNECT_TIMEOUT_SECONDS,
+                 queue_size: int = PROSERVER_QUEUE_SIZE,
+                 max_batch: int = PROSERVER_MAX_BATCH,
+                 dedupe_window: float = PROSERVER_DEDUPE_WINDOW_SECONDS,
+                 backoff_initial: float = PROSERVER_BACKOFF_INITIAL_SECONDS,
+                 backoff_max: float = PROSERVER_BACKOFF_MAX_SECONDS):
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.max_batch = max_batch
+        self.dedupe_window = dedupe_window
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._socket = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._recent = {}  # message -> time it was last accepted
+        self._lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "sent_messages": 0,
+            "sent_batches": 0,
+            "deduplicated": 0,
+            "dropped": 0,
+            "send_failures": 0,
+            "connections_opened": 0,
+            "last_send_latency_ms": None,
+            "max_send_latency_ms": 0.0,
+            "total_send_latency_ms": 0.0
+        }
+
+    # --- Caller Side ---
+
+    def enqueue(self, message: str) -> bool:
+        """
+        Queues a message without blocking. Returns False if it was dropped
+        as a duplicate or because the queue is full.
+        """
+        now = time.monotonic()
+        with self._lock:
+            last_sent = self._recent.get(message)
+            if last_sent is not None and (now - last_sent) < self.dedupe_window:
+                self._stats["deduplicated"] += 1
+                return False
+            try:
+                self._queue.put_nowait(message)
+            except queue.Full:
+                self._stats["dropped"] += 1
+                logger.error(f"ProServer queue full; dropped message: {message}")
+                return False
+            self._recent[message] = now
+            self._stats["enqueued"] += 1
+            # Forget old entries so the dedupe map stays small.
+            if len(self._recent) > self._queue.maxsize:
+                self._recent = {m: t for m, t in self._recent.items()
+                                if (now - t) < self.dedupe_window}
+        return True
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="proserver-dispatcher", daemon=True)
+        self._thread.start()
+        logger.info(f"ProServer dispatcher started for {self.host}:{self.port}")
+
+    def stop(self, drain_timeout: float = 5.0):
+        """
+        Stops the sender thread, giving it up to drain_timeout seconds to
+        deliver what is already queued. Anything left is counted as dropped.
+        """
+        deadline = time.monotonic() + drain_timeout
+        while not self._queue.empty() and time.monotonic() < deadline and self._thread and self._thread.is_alive():
+            time.sleep(0.05)
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=self.connect_timeout + 1)
+        left = self._queue.qsize()
+        if left:
+            with self._lock:
+                self._stats["dropped"] += left
+            logger.warning(f"ProServer dispatcher stopped with {left} undelivered messages.")
+        self._close()
+        logger.info("ProServer dispatcher stopped.")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        total_latency_ms = stats.pop("total_send_latency_ms")
+        stats["avg_send_latency_ms"] = round(total_latency_ms / stats["sent_batches"], 3) if stats["sent_batches"] else None
+        stats["queue_depth"] = self._queue.qsize()
+        stats["connected"] = self._socket is not None
+        return stats
+
+    # --- Sender Thread ---
+
+    def _connect(self):
+        self._socket = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        with self._lock:
+            self._stats["connections_opened"] += 1
+        logger.info(f"Connected to ProServer at {self.host}:{self.port}")
+
+    def _close(self):
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+            self._socket = None
+
+    def _peer_closed(self) -> bool:
+        """
+        Detects a connection the server has closed while idle. Without this,
+        the first write after the close would appear to succeed and be lost.
+        """
+        readable, _, _ = select.select([self._socket], [], [], 0)
+        if not readable:
+            return False
+        try:
+            return self._socket.recv(1, socket.MSG_PEEK) == b""
+        except OSError:
+            return True
+
+    def _send_batch(self, payload: bytes):
+        if self._socket is not None and self._peer_closed():
+            self._close()
+        if self._socket is None:
+            self._connect()
+        self._socket.sendall(payload)
+
+    def _run(self):
+        backoff = self.backoff_initial
+        while not self._stop_event.is_set():
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            payload = "".join(batch).encode()
+            while not self._stop_event.is_set():
+                started = time.perf_counter()
+                try:
+                    self._send_batch(payload)
+                except OSError as e:
+                    _send_failures.inc()
+                    self._close()
+                    with self._lock:
+                        self._stats["send_failures"] += 1
+                    logger.error(f"Failed to send {len(batch)} messages to ProServer: {e}. Retrying in {backoff}s")
+                    self._stop_event.wait(backoff)
+                    backoff = min(backoff * 2, self.backoff_max)
+                    continue
+
+                elapsed = time.perf_counter() - started
+                _send_seconds.observe(elapsed)
+                _messages_sent.inc(len(batch))
+                latency_ms = elapsed * 1000
+                backoff = self.backoff_initial
+                with self._lock:
+                    self._stats["sent_messages"] += len(batch)
+                    self._stats["sent_batches"] += 1
+                    self._stats["last_send_latency_ms"] = round(latency_ms, 3)
+                    self._stats["max_send_latency_ms"] = max(self._stats["max_send_latency_ms"], round(latency_ms, 3))
+                    self._stats["total_send_latency_ms"] += latency_ms
+                logger.info(f"Sent {len(batch)} notifications to ProServer in {latency_ms:.1f} ms")
+                break
+            else:
+                # Stopped while retrying: the batch was never delivered.
+                with self._lock:
+                    self._stats["dropped"] += len(batch)
+
+
+# --- Module-Level Dispatcher ---
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+# What get_dispatcher_stats() reports while no dispatcher is running.
+_IDLE_DISPATCHER_STATS = {
+    "enqueued": 0,
+    "sent_messages": 0,
+    "sent_batches": 0,
+    "deduplicated": 0,
+    "dropped": 0,
+    "send_failures": 0,
+    "connections_opened": 0,
+    "last_send_latency_ms": None,
+    "max_send_latency_ms": 0.0,
+    "avg_send_latency_ms": None,
+    "queue_depth": 0,
+    "connected": False,
+    "running": False
+}
+
+
+def get_dispatcher() -> NotificationDispatcher:
+    """Returns the process-wide dispatcher, starting it on first use."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = NotificationDispatcher(PROSERVER_IP, PROSERVER_PORT)
+            _dispatcher.start()
+        return _dispatcher
+
+def start_dispatcher():
+    get_dispatcher()
+
+def stop_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is not None:
+            _dispatcher.stop()
+            _dispatcher = None
+
+def get_dispatcher_stats() -> dict:
+    """
+    The running dispatcher's stats, or zeros if there is none (before startup
+    or after shutdown). Never starts one, since /metrics calls this.
+    """
+    dispatcher = _dispatcher
+    if dispatcher is None:
+        return dict(_IDLE_DISPATCHER_STATS)
+    return {**dispatcher.get_stats(), "running": True}
+
+def send_proserver_notification(building_name: str, device_id: int) -> bool:
+    """
+    Queues a unified notification for the ProServer. Never blocks on the network.
     Format: Axe,{building_name}_{device_id}@
     """
     message = f"Axe,{building_name}_{device_id}@"
-    logger.info(f"Attempting to send notification to ProServer: {message}")
-    
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((PROSERVER_IP, PROSERVER_PORT))
-            s.sendall(message.encode())
-            logger.info(f"Sent notification to ProServer for device {device_id} in {building_name}")
-    except Exception as e:
-        logger.error(f"Failed to send notification to ProServer: {e}")
-
-# Removed send_not_armed_alert as it is no longer needed
\ No newline at end of file
+    logger.info(f"Queueing notification for ProServer: {message}")
+    # The socket write happens later on the dispatcher thread (see the
+    # proserver_send_duration_seconds metric); only the enqueue is in the profile.
+    with profiling.span("proserver.enqueue", building=building_name):
+        return get_dispatcher().enqueue(message)
+
+# Removed send_not_armed_alert as it is no longer needed
@@ -0,0 +1,155 @@
+# backend/services/schedule_table.py
+
+import threading
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+from sqlite_config import get_all_schedule_windows, minute_of_day, format_minute  # noqa: F401 (re-exported)
+from shared_state import NAMESPACE_SCHEDULES, register_listener
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+MINUTES_PER_DAY = 1440
+EVERY_DAY = -1  # Stored weekday for windows that apply every day
+
+
+class ScheduleTable:
+    """
+    Every building's schedule windows, parsed once into parallel arrays.
+
+    A window is (building, weekday or every day, start minute, end minute);
+    a window whose end is before its start runs past midnight into the next
+    day, and one whose start equals its end is empty.
+
+    For each weekday the table also holds the minutes at which any window
+    opens or closes, and for each interval between them a bitmask of the
+    buildings in-window (bit i = building_ids[i]). "Which buildings are
+    in-window at t" is then one bisect, independent of the number of
+    buildings. Tables are immutable; a schedule change builds a new one.
+    """
+
+    def __init__(self, windows):
+        windows = [(b, EVERY_DAY if w is None else w, s, e) for b, w, s, e in windows]
+        self.building_ids = array("q", sorted({w[0] for w in windows}))
+        self._index = {building_id: i for i, building_id in enumerate(self.building_ids)}
+
+        self.window_building = array("q", (w[0] for w in windows))
+        self.window_weekday = array("b", (w[1] for w in windows))
+        self.window_start = array("H", (w[2] for w in windows))
+        self.window_end = array("H", (w[3] for w in windows))
+
+        self._boundaries = []  # per weekday: array of minutes where the active set changes
+        self._masks = []       # per weekday: active-building bitmask from each boundary on
+        pieces = self._day_pieces()
+        for weekday in range(7):
+            boundaries, masks = self._build_day(pieces[weekday])
+            self._boundaries.append(boundaries)
+            self._masks.append(masks)
+
+    def _day_pieces(self) -> list[list[tuple]]:
+        """Splits every window into same-day (start, end, bit) pieces per weekday."""
+        pieces = [[] for _ in range(7)]
+        for building_id, weekday, start, end in zip(self.window_building, self.window_weekday,
+                                                    self.window_start, self.window_end):
+            bit = self._index[building_id]
+            for day in (range(7) if weekday == EVERY_DAY else (weekday,)):
+                if start < end:
+                    pieces[day].append((start, end, bit))
+                elif start > end:
+                    pieces[day].append((start, MINUTES_PER_DAY, bit))
+                    if end > 0:
+                        pieces[(day + 1) % 7].append((0, end, bit))
+        return pieces
+
+    @staticmethod
+    def _build_day(pieces: list[tuple]) -> tuple:
+        # Sweep the opening and closing minutes in order, counting open pieces
+        # per building so overlapping windows of one building are handled.
+        events = {}
+        for start, end, bit in pieces:
+            events.setdefault(start, []).append((bit, 1))
+            events.setdefault(end, []).append((bit, -1))
+        events.setdefault(0, [])
+
+        boundaries = array("H")
+        masks = []
+        open_counts = {}
+        mask = 0
+        for minute in sorted(events):
+            if minute >= MINUTES_PER_DAY:
+                break
+            for bit, delta in events[minute]:
+                count = open_counts.get(bit, 0) + delta
+                open_counts[bit] = count
+                if count:
+                    mask |= 1 << bit
+                else:
+                    mask &= ~(1 << bit)
+            boundaries.append(minute)
+            masks.append(mask)
+        return boundaries, masks
+
+    def active_mask(self, at: datetime) -> int:
+        """Bitmask over building_ids of the buildings in-window at `at`."""
+        weekday = at.weekday()
+        position = bisect_right(self._boundaries[weekday], at.hour * 60 + at.minute) - 1
+        return self._masks[weekday][position]
+
+    def is_active(self, building_id: int, at: datetime, mask: int | None = None) -> bool:
+        """True if the building is in-window at `at`. Pass a precomputed active_mask to skip the lookup."""
+        index = self._index.get(building_id)
+        if index is None:
+            return False
+        if mask is None:
+            mask = self.active_mask(at)
+        return bool(mask >> index & 1)
+
+    def active_buildings(self, at: datetime) -> list[int]:
+        """IDs of every building in-window at `at`."""
+        mask = self.active_mask(at)
+        result = []
+        while mask:
+            low_bit = mask & -mask
+            result.append(self.building_ids[low_bit.bit_length() - 1])
+            mask ^= low_bit
+        return result
+
+    def has_schedule(self, building_id: int) -> bool:
+        return building_id in self._index
+
+    def windows(self, building_id: int | None = None) -> list[tuple]:
+        """(building_id, weekday or None, start_minute, end_minute) for one or all buildings."""
+        return [
+            (b, None if w == EVERY_DAY else w, s, e)
+            for b, w, s, e in zip(self.window_building, self.window_weekday,
+                                  self.window_start, self.window_end)
+            if building_id is None or b == building_id
+        ]
+
+    def __len__(self) -> int:
+        return len(self.window_building)
+
+
+# --- Process-Wide Table ---
+# Loaded from SQLite on first use and dropped whenever any process changes a
+# schedule, so the next caller loads the new one.
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_schedule_table() -> ScheduleTable:
+    global _table
+    with _table_lock:
+        if _table is None:
+            _table = ScheduleTable(get_all_schedule_windows())
+            logger.info(f"Schedule table loaded: {len(_table)} windows for "
+                        f"{len(_table.building_ids)} buildings.")
+        return _table
+
+def invalidate_schedule_table() -> None:
+    global _table
+    with _table_lock:
+        _table = None
+
+register_listener(NAMESPACE_SCHEDULES, invalidate_schedule_table)
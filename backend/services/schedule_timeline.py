@@ -0,0 +1,92 @@
+# backend/services/schedule_timeline.py
+
+import heapq
+import itertools
+import threading
+from datetime import datetime, time as dt_time, timedelta
+from typing import NamedTuple
+
+
+# --- Transition Timeline ---
+
+class Transition(NamedTuple):
+    when: datetime
+    building_id: int
+    kind: str              # "start" or "end"
+    minute: int            # minute of day
+    weekday: int | None    # 0 = Monday; None recurs every day
+
+
+def _next_occurrence(minute: int, weekday: int | None, after: datetime) -> datetime:
+    """The first datetime strictly after `after` at `minute` on `weekday` (or any day)."""
+    candidate = datetime.combine(after.date(), dt_time(minute // 60, minute % 60))
+    if weekday is not None:
+        candidate += timedelta(days=(weekday - candidate.weekday()) % 7)
+        if candidate <= after:
+            candidate += timedelta(days=7)
+    elif candidate <= after:
+        candidate += timedelta(days=1)
+    return candidate
+
+
+class ScheduleTimeline:
+    """
+    The upcoming start and end transitions of every building's schedule,
+    kept in a heap so the next one is always at the front.
+
+    Every schedule window has one pending 'start' and one pending 'end'.
+    When a transition is popped, its next occurrence (the following day, or
+    the following week for a weekday window) takes its place, so the
+    timeline never needs a full rebuild unless a schedule changes.
+
+    Heap entries are (when, seq, transition): two windows of one building
+    can start at the same minute with weekday None and an int, which don't
+    compare, so ties on `when` are broken by insertion order instead.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def rebuild(self, schedules, after: datetime) -> None:
+        """
+        Recomputes the timeline from a ScheduleTable's windows. Transitions
+        later than `after` are included, so any between `after` and now are
+        due immediately (this is how missed ones are caught up).
+        """
+        heap = []
+        for building_id, weekday, start, end in schedules.windows():
+            if start == end:
+                continue
+            # An overnight window of a single weekday ends on the next one.
+            end_weekday = weekday if weekday is None or end > start else (weekday + 1) % 7
+            for kind, minute, day in (("start", start, weekday), ("end", end, end_weekday)):
+                when = _next_occurrence(minute, day, after)
+                heap.append((when, next(self._seq), Transition(when, building_id, kind, minute, day)))
+        heapq.heapify(heap)
+        with self._lock:
+            self._heap = heap
+
+    def next_time(self) -> datetime | None:
+        """When the next transition is due, or None if there are none."""
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime) -> list[Transition]:
+        """
+        Removes and returns every transition due at or before `now`, oldest
+        first, and schedules each one's next occurrence.
+        """
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap)[2])
+            for transition in due:
+                when = _next_occurrence(transition.minute, transition.weekday, now)
+                heapq.heappush(self._heap, (when, next(self._seq), transition._replace(when=when)))
+        return due
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._heap)
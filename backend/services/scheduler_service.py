@@ -1,41 +1,383 @@
 # backend/services/scheduler_service.py
 
-import schedule
 import time
 import threading
+import os
+import socket
+import uuid
+from contextlib import nullcontext
+from datetime import datetime, timedelta
 from logger import get_logger
-from services import proevent_service
+from services import proevent_service, cache_service
+from services.schedule_table import get_schedule_table
+from services.schedule_timeline import ScheduleTimeline
+from sqlite_config import get_sqlite_connection
+from shared_state import NAMESPACE_SCHEDULES, register_listener
+import profiling
 import traceback  # Import the traceback module
 
 logger = get_logger(__name__)
 
+# --- Leader Election ---
+# Every worker process starts the scheduler thread, but only the process that
+# holds the lease row in scheduler_lease runs the job. The leader renews the
+# lease every LEASE_HEARTBEAT_SECONDS from a separate thread, so a long tick
+# does not lose it. If the leader dies, another process takes over within
+# LEASE_TTL_SECONDS + LEASE_HEARTBEAT_SECONDS.
+LEASE_NAME = "scheduler"
+LEASE_TTL_SECONDS = 30
+LEASE_HEARTBEAT_SECONDS = 10
+
+HOLDER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_lease_state = {
+    "is_leader": False,
+    "renewed_at": 0.0
+}
+_lease_lock = threading.Lock()
+_stop_event = threading.Event()
+_threads = []  # the heartbeat and scheduler threads, joined on stop
+# How long stop_scheduler() waits for a running tick to finish.
+SCHEDULER_STOP_TIMEOUT_SECONDS = float(os.getenv("SCHEDULER_STOP_TIMEOUT_SECONDS", 30))
+
+# --- Schedule Engine ---
+# Instead of polling, the scheduler thread sleeps until the next start/end
+# transition on the timeline and then evaluates only the buildings involved.
+# A full sweep of all buildings still runs every SCHEDULER_SWEEP_INTERVAL_SECONDS
+# to pick up panel status changes, repeat 'not-armed' alerts and correct
+# changes made outside this service.
+SCHEDULER_SWEEP_INTERVAL_SECONDS = float(os.getenv("SCHEDULER_SWEEP_INTERVAL_SECONDS", 60))
+# Transitions missed by up to this long (a stalled thread, a leader failover)
+# are still acted on, start alerts included. Older ones are only reconciled
+# by the sweep.
+SCHEDULER_CATCHUP_SECONDS = float(os.getenv("SCHEDULER_CATCHUP_SECONDS", 900))
+# The last transition the leader acted on is kept on the lease row
+# (last_transition_at), so a new leader can catch up. Not in the app cache:
+# every cache write makes every worker reload the whole cache.
+# Ticks still to profile regardless of PROFILE_SAMPLE_RATE; shared, since
+# any worker may take the request but only the leader runs ticks.
+PROFILE_TICKS_CACHE_KEY = "scheduler_profile_ticks"
+
+_timeline = ScheduleTimeline()
+_wake_event = threading.Event()
+_rebuild_requested = threading.Event()
+# Set when this process becomes the leader: the next rebuild starts from the
+# shared watermark, so transitions in the failover gap are still handled.
+_catch_up_requested = threading.Event()
+_engine_stats = {
+    "transitions_processed": 0,
+    "transitions_caught_up": 0,
+    "transitions_expired": 0,
+    "timeline_rebuilds": 0,
+    "sweeps": 0
+}
+
+
+def try_acquire_lease() -> bool:
+    """
+    Acquires or renews the scheduler lease in a single atomic statement.
+    The lease is taken over only if it is held by this process or its
+    holder has stopped renewing it. Returns True if this process holds it.
+    """
+    now = time.time()
+    try:
+        with get_sqlite_connection() as conn:
+            conn.execute("""
+                INSERT INTO scheduler_lease (name, holder, acquired_at, renewed_at, failovers)
+                VALUES (:name, :holder, :now, :now, 0)
+                ON CONFLICT(name) DO UPDATE SET
+                    holder = excluded.holder,
+                    acquired_at = CASE WHEN scheduler_lease.holder = excluded.holder
+                                       THEN scheduler_lease.acquired_at ELSE excluded.acquired_at END,
+                    renewed_at = excluded.renewed_at,
+                    failovers = scheduler_lease.failovers
+                                + CASE WHEN scheduler_lease.holder = excluded.holder THEN 0 ELSE 1 END
+                WHERE scheduler_lease.holder = excluded.holder
+                   OR scheduler_lease.renewed_at < :expired_before
+            """, {
+                "name": LEASE_NAME,
+                "holder": HOLDER_ID,
+                "now": now,
+                "expired_before": now - LEASE_TTL_SECONDS
+            })
+            row = conn.execute(
+                "SELECT holder FROM scheduler_lease WHERE name = ?", (LEASE_NAME,)
+            ).fetchone()
+        is_leader = row is not None and row["holder"] == HOLDER_ID
+    except Exception as e:
+        logger.error(f"Error renewing scheduler lease: {e}")
+        is_leader = False
+
+    with _lease_lock:
+        became_leader = is_leader and not _lease_state["is_leader"]
+        if became_leader:
+            logger.info(f"This process ({HOLDER_ID}) is now the scheduler leader.")
+        elif not is_leader and _lease_state["is_leader"]:
+            logger.warning(f"This process ({HOLDER_ID}) lost the scheduler lease.")
+        _lease_state["is_leader"] = is_leader
+        if is_leader:
+            _lease_state["renewed_at"] = now
+    if became_leader:
+        _catch_up_requested.set()
+        request_timeline_rebuild()
+    return is_leader
+
+def release_lease() -> None:
+    """Expires the lease immediately if held, so a standby can take over at once."""
+    try:
+        with get_sqlite_connection() as conn:
+            conn.execute(
+                "UPDATE scheduler_lease SET renewed_at = 0 WHERE name = ? AND holder = ?",
+                (LEASE_NAME, HOLDER_ID)
+            )
+    except Exception as e:
+        logger.error(f"Error releasing scheduler lease: {e}")
+    with _lease_lock:
+        _lease_state["is_leader"] = False
+    logger.info("Scheduler lease released.")
+
+def is_leader() -> bool:
+    """
+    True if this process holds the lease and renewed it recently enough that
+    no other process can have taken it over.
+    """
+    with _lease_lock:
+        return (_lease_state["is_leader"]
+                and (time.time() - _lease_state["renewed_at"]) < LEASE_TTL_SECONDS)
+
+def get_scheduler_status() -> dict:
+    """Returns the current lease holder, lease age and failover count."""
+    now = time.time()
+    with get_sqlite_connection() as conn:
+        row = conn.execute(
+            "SELECT holder, acquired_at, renewed_at, failovers FROM scheduler_lease WHERE name = ?",
+            (LEASE_NAME,)
+        ).fetchone()
+    return {
+        "this_process": HOLDER_ID,
+        "is_leader": is_leader(),
+        "holder": row["holder"] if row else None,
+        "lease_age_seconds": round(now - row["acquired_at"], 1) if row else None,
+        "seconds_since_renewal": round(now - row["renewed_at"], 1) if row else None,
+        "lease_expired": (now - row["renewed_at"]) >= LEASE_TTL_SECONDS if row else True,
+        "failovers": row["failovers"] if row else 0,
+        "lease_ttl_seconds": LEASE_TTL_SECONDS,
+        "engine": get_engine_status()
+    }
+
+def run_lease_heartbeat():
+    """
+    Acquires/renews the lease until the scheduler is stopped.
+    """
+    while True:
+        try_acquire_lease()
+        if _stop_event.wait(LEASE_HEARTBEAT_SECONDS):
+            break
+
+def request_tick_profiles(ticks: int) -> None:
+    """Profiles the next `ticks` scheduler runs (sweeps or transitions)."""
+    cache_service.set_cache_value(PROFILE_TICKS_CACHE_KEY, ticks)
+
+def _tick_profile(name: str, **attrs):
+    """A profiling context for one tick if it is sampled or was requested, else a no-op."""
+    if not profiling.PROFILING_ENABLED:
+        return nullcontext()
+    requested = cache_service.get_cache_value(PROFILE_TICKS_CACHE_KEY) or 0
+    if requested > 0:
+        cache_service.set_cache_value(PROFILE_TICKS_CACHE_KEY, requested - 1)
+    elif not profiling.sampled():
+        return nullcontext()
+    return profiling.profile(name, "scheduler", **attrs)
+
 def scheduled_job():
     """
     Job function for the scheduler to manage proevent states based on time.
+    Only runs in the process that holds the scheduler lease.
     """
+    if not is_leader():
+        logger.debug("Not the scheduler leader; skipping scheduled job.")
+        return
     logger.info("Scheduler running: Managing scheduled states...")
     try:
-        proevent_service.check_and_manage_scheduled_states()
+        with _tick_profile("sweep"):
+            proevent_service.check_and_manage_scheduled_states()
     except Exception as e:
         # Log the full traceback to pinpoint the exact line of the error
         tb_str = traceback.format_exc()
         logger.error(f"Error in scheduled proevent check: {e}\n{tb_str}")
 
+def request_timeline_rebuild() -> None:
+    """Asks the scheduler thread to rebuild the timeline (a schedule changed)."""
+    _rebuild_requested.set()
+    _wake_event.set()
+
+register_listener(NAMESPACE_SCHEDULES, request_timeline_rebuild)
+
+def _load_watermark(now: datetime) -> datetime:
+    """
+    Returns the point the timeline should be rebuilt from: the last
+    transition the leader handled, but no further back than the catch-up
+    window. Without a recorded watermark, nothing before now is replayed.
+    """
+    try:
+        with get_sqlite_connection() as conn:
+            row = conn.execute(
+                "SELECT last_transition_at FROM scheduler_lease WHERE name = ?", (LEASE_NAME,)
+            ).fetchone()
+    except Exception as e:
+        logger.error(f"Error reading the scheduler watermark: {e}")
+        row = None
+    value = row["last_transition_at"] if row else None
+    if value is None:
+        return now
+    return max(datetime.fromtimestamp(value), now - timedelta(seconds=SCHEDULER_CATCHUP_SECONDS))
+
+def _save_watermark(when: datetime) -> None:
+    """Records the last handled transition on the lease row, if this process still holds it."""
+    try:
+        with get_sqlite_connection() as conn:
+            conn.execute(
+                "UPDATE scheduler_lease SET last_transition_at = ? WHERE name = ? AND holder = ?",
+                (when.timestamp(), LEASE_NAME, HOLDER_ID)
+            )
+    except Exception as e:
+        logger.error(f"Error saving the scheduler watermark: {e}")
+
+def rebuild_timeline(catch_up: bool = False) -> None:
+    """
+    Rebuilds the timeline from the current schedules. With catch_up (at
+    startup and on taking over the lease) transitions since the leader's
+    watermark are due at once; otherwise only those after now are included.
+    """
+    now = datetime.now()
+    _timeline.rebuild(get_schedule_table(), after=_load_watermark(now) if catch_up else now)
+    _engine_stats["timeline_rebuilds"] += 1
+    logger.info(f"Schedule timeline rebuilt with {len(_timeline)} transitions; next at {_timeline.next_time()}.")
+
+def process_due_transitions(now: datetime) -> int:
+    """
+    Acts on every transition due by `now`: the affected buildings are
+    re-evaluated, and buildings whose window just started get the start
+    alert. Returns the number of transitions handled.
+    """
+    if not is_leader():
+        # Left on the timeline; a process that takes over the lease rebuilds
+        # from the watermark and handles whatever the old leader missed.
+        return 0
+    due = _timeline.pop_due(now)
+    if not due:
+        return 0
+
+    current = []
+    for transition in due:
+        lateness = (now - transition.when).total_seconds()
+        if lateness > SCHEDULER_CATCHUP_SECONDS:
+            _engine_stats["transitions_expired"] += 1
+            logger.warning(f"Skipping {transition.kind} transition for building {transition.building_id} "
+                           f"at {transition.when:%Y-%m-%d %H:%M}: missed by {lateness:.0f}s.")
+            continue
+        if lateness > 60:
+            _engine_stats["transitions_caught_up"] += 1
+            logger.info(f"Catching up {transition.kind} transition for building {transition.building_id} "
+                        f"at {transition.when:%Y-%m-%d %H:%M} ({lateness:.0f}s late).")
+        current.append(transition)
+
+    if current:
+        logger.info(f"Processing {len(current)} schedule transitions.")
+        with _tick_profile("transition", transitions=len(current)):
+            proevent_service.check_and_manage_scheduled_states(
+                building_ids=sorted({t.building_id for t in current}),
+                start_alert_ids=frozenset(t.building_id for t in current if t.kind == "start")
+            )
+        _engine_stats["transitions_processed"] += len(current)
+    _save_watermark(due[-1].when)
+    return len(current)
+
 def run_scheduler():
     """
-    Runs the scheduler in a separate thread.
+    Runs the schedule engine until stop_scheduler() is called: sleeps until
+    the next transition or sweep, whichever comes first, and wakes early
+    when a schedule change asks for a timeline rebuild.
     """
-    schedule.every(1).minutes.do(scheduled_job)
+    rebuild_timeline(catch_up=True)
+    next_sweep = time.monotonic() + SCHEDULER_SWEEP_INTERVAL_SECONDS
 
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    while not _stop_event.is_set():
+        # Cleared before looking at the work, so a wake-up that arrives
+        # while we are busy is not lost.
+        _wake_event.clear()
+        if _rebuild_requested.is_set():
+            _rebuild_requested.clear()
+            catch_up = _catch_up_requested.is_set()
+            _catch_up_requested.clear()
+            try:
+                rebuild_timeline(catch_up=catch_up)
+            except Exception as e:
+                logger.error(f"Error rebuilding schedule timeline: {e}")
+
+        try:
+            process_due_transitions(datetime.now())
+        except Exception as e:
+            tb_str = traceback.format_exc()
+            logger.error(f"Error processing schedule transitions: {e}\n{tb_str}")
+
+        if time.monotonic() >= next_sweep:
+            scheduled_job()
+            _engine_stats["sweeps"] += 1
+            next_sweep = max(next_sweep + SCHEDULER_SWEEP_INTERVAL_SECONDS,
+                             time.monotonic() + 1)
+
+        sleep_seconds = next_sweep - time.monotonic()
+        next_transition = _timeline.next_time()
+        # Standbys don't act on transitions, so they only wake for the sweep
+        # check, a schedule change or taking over the lease.
+        if next_transition is not None and is_leader():
+            sleep_seconds = min(sleep_seconds, (next_transition - datetime.now()).total_seconds())
+        _wake_event.wait(max(0.0, sleep_seconds))
+
+def get_engine_status() -> dict:
+    """Counters for the schedule engine and the time of the next transition."""
+    next_transition = _timeline.next_time()
+    return {
+        **_engine_stats,
+        "pending_transitions": len(_timeline),
+        "next_transition_at": next_transition.isoformat() if next_transition else None,
+        "sweep_interval_seconds": SCHEDULER_SWEEP_INTERVAL_SECONDS
+    }
 
 def start_scheduler():
     """
-    Starts the scheduler in a background thread.
+    Starts the scheduler and the lease heartbeat in background threads.
     """
-    scheduler_thread = threading.Thread(target=run_scheduler)
+    _stop_event.clear()
+    heartbeat_thread = threading.Thread(target=run_lease_heartbeat, name="scheduler-lease")
+    heartbeat_thread.daemon = True
+    heartbeat_thread.start()
+
+    scheduler_thread = threading.Thread(target=run_scheduler, name="scheduler")
     scheduler_thread.daemon = True
     scheduler_thread.start()
-    logger.info("Scheduler started.")
\ No newline at end of file
+    _threads[:] = [heartbeat_thread, scheduler_thread]
+    logger.info(f"Scheduler started (holder id {HOLDER_ID}).")
+
+def stop_scheduler():
+    """
+    Stops the scheduler threads and hands the lease over to a standby process.
+    A tick still running is waited for first, so the standby can't start one
+    alongside it. If it doesn't finish in time the lease is kept and left to
+    expire instead.
+    """
+    _stop_event.set()
+    _wake_event.set()
+    deadline = time.monotonic() + SCHEDULER_STOP_TIMEOUT_SECONDS
+    for thread in _threads:
+        thread.join(timeout=max(0.0, deadline - time.monotonic()))
+    still_running = [thread.name for thread in _threads if thread.is_alive()]
+    if still_running:
+        logger.warning(f"Scheduler threads still running after {SCHEDULER_STOP_TIMEOUT_SECONDS:.0f}s: "
+                       f"{still_running}; leaving the lease to expire.")
+        return
+    _threads.clear()
+    if is_leader():
+        release_lease()
+    logger.info("Scheduler stopped.")
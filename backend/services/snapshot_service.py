@@ -0,0 +1,266 @@
+# backend/services/snapshot_service.py
+
+import bisect
+import os
+import threading
+import time
+from services import device_service
+import profiling
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# --- Per-Building ProEvent Snapshots ---
+# An in-process copy of (ProEvent_PRK, alias, reactive state) for every
+# building that has been read, so /api/devices and the scheduler don't
+# re-read ProEvent_TBL on every call. Snapshots are refreshed incrementally:
+# one cheap query returns a version (row count plus checksum, or a
+# rowversion column if configured) per building, and only buildings whose
+# version changed are fetched again. A background thread re-verifies every
+# snapshot well within the staleness bound, so reads rarely wait on MSSQL.
+SNAPSHOT_ENABLED = os.getenv("SNAPSHOT_ENABLED", "true").lower() in ("1", "true", "yes")
+SNAPSHOT_MAX_STALENESS_SECONDS = float(os.getenv("SNAPSHOT_MAX_STALENESS_SECONDS", 30))
+SNAPSHOT_REFRESH_INTERVAL_SECONDS = float(os.getenv("SNAPSHOT_REFRESH_INTERVAL_SECONDS", 10))
+# Checksums can collide, so every snapshot is refetched at least this often.
+SNAPSHOT_FULL_RELOAD_SECONDS = float(os.getenv("SNAPSHOT_FULL_RELOAD_SECONDS", 900))
+# Name of a rowversion column on ProEvent_TBL, if the database has one.
+SNAPSHOT_ROWVERSION_COLUMN = os.getenv("SNAPSHOT_ROWVERSION_COLUMN") or None
+
+# building_id -> {"rows": [row, ...] ordered by ID, "ids": [ID, ...],
+#                 "version": (row_count, version) or None,
+#                 "loaded_at": ..., "verified_at": ...}   (time.monotonic())
+# Entries are replaced whole, never mutated, so readers can use them
+# without holding the lock.
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+# Serializes refreshes so concurrent stale reads don't query MSSQL twice.
+_refresh_lock = threading.Lock()
+
+_refresher_thread = None
+_refresher_stop = threading.Event()
+
+_stats = {
+    "reads": 0,
+    "stale_reads": 0,
+    "refreshes": 0,
+    "buildings_verified": 0,
+    "buildings_refetched": 0,
+    "rows_fetched": 0,
+    "refresh_errors": 0,
+    "last_refresh_ms": None,
+    "max_refresh_ms": 0.0,
+    "total_refresh_ms": 0.0
+}
+
+
+def _needs_refresh(entry, now: float) -> bool:
+    return (entry is None
+            or now - entry["verified_at"] > SNAPSHOT_MAX_STALENESS_SECONDS
+            or now - entry["loaded_at"] > SNAPSHOT_FULL_RELOAD_SECONDS)
+
+def refresh(building_ids=None) -> int:
+    """
+    Re-verifies the snapshots of the given buildings (default: every building
+    with a snapshot) and refetches those whose version changed or that are
+    due a full reload. Returns the number of buildings refetched.
+    """
+    with _refresh_lock, profiling.span("snapshot.refresh"):
+        with _snapshots_lock:
+            ids = list(building_ids) if building_ids is not None else list(_snapshots)
+        if not ids:
+            return 0
+
+        started = time.perf_counter()
+        try:
+            versions = device_service.get_proevent_versions_for_buildings(ids, SNAPSHOT_ROWVERSION_COLUMN)
+            now = time.monotonic()
+            with _snapshots_lock:
+                changed = []
+                for building_id in ids:
+                    entry = _snapshots.get(building_id)
+                    if (entry is None or entry["version"] != versions.get(building_id)
+                            or now - entry["loaded_at"] > SNAPSHOT_FULL_RELOAD_SECONDS):
+                        changed.append(building_id)
+                    else:
+                        _snapshots[building_id] = {**entry, "verified_at": now}
+
+            rows_fetched = 0
+            if changed:
+                rows_by_building = device_service.get_proevents_for_buildings(changed)
+                now = time.monotonic()
+                with _snapshots_lock:
+                    for building_id in changed:
+                        rows = rows_by_building.get(building_id, [])
+                        rows_fetched += len(rows)
+                        _snapshots[building_id] = {
+                            "rows": rows,
+                            "ids": [row["id"] for row in rows],
+                            "version": versions.get(building_id),
+                            "loaded_at": now,
+                            "verified_at": now
+                        }
+        except Exception:
+            with _snapshots_lock:
+                _stats["refresh_errors"] += 1
+            raise
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with _snapshots_lock:
+            _stats["refreshes"] += 1
+            _stats["buildings_verified"] += len(ids)
+            _stats["buildings_refetched"] += len(changed)
+            _stats["rows_fetched"] += rows_fetched
+            _stats["last_refresh_ms"] = round(elapsed_ms, 3)
+            _stats["max_refresh_ms"] = max(_stats["max_refresh_ms"], round(elapsed_ms, 3))
+            _stats["total_refresh_ms"] += elapsed_ms
+
+    if changed:
+        logger.debug(f"Snapshot refresh: {len(ids)} buildings verified, {len(changed)} refetched "
+                     f"({rows_fetched} rows) in {elapsed_ms:.1f} ms")
+    return len(changed)
+
+def _get_fresh(building_ids: list[int]) -> dict:
+    """Returns {building_id: entry}, refreshing any that are missing or too stale first."""
+    now = time.monotonic()
+    with _snapshots_lock:
+        _stats["reads"] += 1
+        stale = [b for b in building_ids if _needs_refresh(_snapshots.get(b), now)]
+        if stale:
+            _stats["stale_reads"] += 1
+    if stale:
+        refresh(stale)
+    with _snapshots_lock:
+        return {b: _snapshots[b] for b in building_ids if b in _snapshots}
+
+def mark_stale(building_ids: list[int]) -> None:
+    """
+    Forces the next read of these buildings to re-verify against MSSQL.
+    Call after writing to their proevents.
+    """
+    with _snapshots_lock:
+        for building_id in building_ids:
+            entry = _snapshots.get(building_id)
+            if entry is not None:
+                _snapshots[building_id] = {**entry, "verified_at": float("-inf")}
+
+# --- Reads ---
+
+def get_building_proevents(building_id: int) -> list[dict]:
+    """Returns a building's proevents ordered by ID (the snapshot's own list; do not modify)."""
+    entry = _get_fresh([building_id]).get(building_id)
+    return entry["rows"] if entry else []
+
+def get_data_version(building_id: int):
+    """
+    A token that changes whenever the building's snapshot is refetched, or
+    None if there is no fresh snapshot. Never touches a database.
+    """
+    with _snapshots_lock:
+        entry = _snapshots.get(building_id)
+    if entry is None or _needs_refresh(entry, time.monotonic()):
+        return None
+    return entry["loaded_at"], entry["version"]
+
+def _matches(name, search: str, prefix: bool) -> bool:
+    name = (name or "").casefold()
+    return name.startswith(search) if prefix else search in name
+
+def search_proevents(building_id: int, search: str | None = None,
+                     limit: int = 100, offset: int = 0) -> list[dict]:
+    """Snapshot equivalent of device_service.get_devices()."""
+    rows = get_building_proevents(building_id)
+    if search:
+        term = search.casefold()
+        rows = [row for row in rows if _matches(row["name"], term, prefix=False)]
+    return [dict(row) for row in rows[offset:offset + limit]]
+
+def get_proevents_page(building_id: int, after_id: int | None = None, limit: int = 100,
+                       search: str | None = None, search_mode: str = "contains") -> dict:
+    """Snapshot equivalent of device_service.get_devices_page()."""
+    entry = _get_fresh([building_id]).get(building_id)
+    if not entry:
+        return {"items": [], "next_cursor": None}
+
+    start = bisect.bisect_right(entry["ids"], after_id) if after_id is not None else 0
+    term = search.casefold() if search else None
+    items = []
+    more = False
+    for row in entry["rows"][start:]:
+        if term and not _matches(row["name"], term, prefix=(search_mode == "prefix")):
+            continue
+        if len(items) == limit:
+            more = True
+            break
+        items.append(dict(row))
+    return {"items": items, "next_cursor": items[-1]["id"] if more else None}
+
+def get_proevent_counts(building_ids: list[int], reactive: int,
+                        ignored_by_building: dict) -> dict[int, dict]:
+    """
+    Snapshot equivalent of device_service.get_proevent_counts_for_buildings(),
+    with the IDs to leave out given per building.
+    """
+    entries = _get_fresh(building_ids)
+    counts = {}
+    for building_id, entry in entries.items():
+        ignored = ignored_by_building.get(building_id, ())
+        total = pending = 0
+        for row in entry["rows"]:
+            if row["id"] in ignored:
+                continue
+            total += 1
+            if row["reactive_state"] != reactive:
+                pending += 1
+        if total:
+            counts[building_id] = {"total": total, "pending": pending}
+    return counts
+
+# --- Background Refresh ---
+
+def _refresh_loop():
+    try:
+        # Fill snapshots for every building up front.
+        refresh([b["id"] for b in device_service.get_distinct_buildings()])
+    except Exception as e:
+        logger.error(f"Initial proevent snapshot load failed: {e}")
+    while not _refresher_stop.wait(SNAPSHOT_REFRESH_INTERVAL_SECONDS):
+        try:
+            refresh()
+        except Exception as e:
+            logger.error(f"Proevent snapshot refresh failed: {e}")
+
+def start_refresher() -> None:
+    """Starts the thread that loads and then keeps re-verifying the snapshots."""
+    global _refresher_thread
+    if not SNAPSHOT_ENABLED or (_refresher_thread and _refresher_thread.is_alive()):
+        return
+    _refresher_stop.clear()
+    _refresher_thread = threading.Thread(target=_refresh_loop, name="snapshot-refresher", daemon=True)
+    _refresher_thread.start()
+    logger.info("Proevent snapshot refresher started.")
+
+def stop_refresher() -> None:
+    _refresher_stop.set()
+    if _refresher_thread:
+        _refresher_thread.join(timeout=5)
+    logger.info("Proevent snapshot refresher stopped.")
+
+def get_snapshot_stats() -> dict:
+    """Returns snapshot sizes and ages plus cumulative refresh costs."""
+    now = time.monotonic()
+    with _snapshots_lock:
+        stats = dict(_stats)
+        entries = list(_snapshots.values())
+    total_refresh_ms = stats.pop("total_refresh_ms")
+    stats["avg_refresh_ms"] = round(total_refresh_ms / stats["refreshes"], 3) if stats["refreshes"] else None
+    verified_ages = [now - e["verified_at"] for e in entries if e["verified_at"] != float("-inf")]
+    stats.update({
+        "enabled": SNAPSHOT_ENABLED,
+        "max_staleness_seconds": SNAPSHOT_MAX_STALENESS_SECONDS,
+        "change_detection": "rowversion" if SNAPSHOT_ROWVERSION_COLUMN else "checksum",
+        "buildings": len(entries),
+        "rows": sum(len(e["rows"]) for e in entries),
+        "oldest_verified_age_seconds": round(max(verified_ages), 1) if verified_ages else None,
+        "oldest_load_age_seconds": round(max(now - e["loaded_at"] for e in entries), 1) if entries else None
+    })
+    return stats
@@ -0,0 +1,130 @@
+# backend/shared_state.py
+
+import threading
+import time
+from sqlite_config import get_sqlite_connection
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# --- Cross-Process State Versions ---
+# Every piece of state that workers cache locally (the app cache, ignore
+# rules, building schedules) has a version counter in the state_versions
+# table of the shared SQLite database. Writers bump the counter in the same
+# transaction as their change; a watcher thread in every process notices the
+# new version and calls the listeners registered for that namespace, which
+# drop or reload their local copy.
+STATE_POLL_INTERVAL_SECONDS = 1.0
+
+NAMESPACE_CACHE = "cache"
+NAMESPACE_IGNORE_RULES = "ignore_rules"
+NAMESPACE_SCHEDULES = "schedules"
+NAMESPACE_EVENTS = "events"  # New rows in live_events (see event_service)
+NAMESPACE_APPLIED_STATES = "applied_states"  # Forced reactive-state writes (see device_service)
+
+_listeners = {}          # namespace -> [callback, ...]
+_seen_versions = {}      # namespace -> last version this process acted on
+_baseline_taken = False
+_state_lock = threading.Lock()
+_watcher_thread = None
+_watcher_stop = threading.Event()
+# PRAGMA data_version is only comparable on the same connection, and
+# connections are per thread, so the last value is tracked per thread.
+_last_data_versions = {}
+
+
+def register_listener(namespace: str, callback) -> None:
+    """
+    Registers a callback to run (with no arguments) whenever another writer
+    changes the given namespace.
+    """
+    with _state_lock:
+        _listeners.setdefault(namespace, []).append(callback)
+
+def bump_version(namespace: str, conn=None) -> None:
+    """
+    Increments a namespace's version. Pass the connection of an open
+    transaction to make the bump part of it, so readers never see the new
+    version without the change it describes.
+    """
+    sql = """
+        INSERT INTO state_versions (namespace, version, updated_at)
+        VALUES (?, 1, ?)
+        ON CONFLICT(namespace) DO UPDATE SET
+            version = version + 1,
+            updated_at = excluded.updated_at
+    """
+    if conn is not None:
+        conn.execute(sql, (namespace, time.time()))
+        return
+    with get_sqlite_connection() as own_conn:
+        own_conn.execute(sql, (namespace, time.time()))
+
+def get_versions() -> dict:
+    """Returns {namespace: version} for every namespace that has been written."""
+    with get_sqlite_connection() as conn:
+        rows = conn.execute("SELECT namespace, version FROM state_versions").fetchall()
+    return {row["namespace"]: row["version"] for row in rows}
+
+def check_for_changes() -> list[str]:
+    """
+    Compares the stored versions with the ones this process last saw and runs
+    the listeners of every namespace that changed. Returns those namespaces.
+
+    Cheap enough to call at the start of every scheduler tick: unless some
+    connection has committed since the last check, it costs one PRAGMA.
+    """
+    global _baseline_taken
+    thread_id = threading.get_ident()
+    with get_sqlite_connection() as conn:
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if _last_data_versions.get(thread_id) == data_version:
+        return []
+    _last_data_versions[thread_id] = data_version
+
+    versions = get_versions()
+    changed = []
+    with _state_lock:
+        for namespace, version in versions.items():
+            previous = _seen_versions.get(namespace)
+            _seen_versions[namespace] = version
+            # The first check only establishes a baseline.
+            if _baseline_taken and previous != version:
+                changed.append(namespace)
+        _baseline_taken = True
+        callbacks = [(ns, cb) for ns in changed for cb in _listeners.get(ns, [])]
+
+    for namespace, callback in callbacks:
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Shared state listener for '{namespace}' failed: {e}")
+
+    if changed:
+        logger.info(f"Shared state changed: {changed}")
+    return changed
+
+def _watch():
+    while not _watcher_stop.wait(STATE_POLL_INTERVAL_SECONDS):
+        try:
+            check_for_changes()
+        except Exception as e:
+            logger.error(f"Error checking shared state versions: {e}")
+
+def start_watcher() -> None:
+    """Starts the background thread that polls for changes from other processes."""
+    global _watcher_thread
+    if _watcher_thread and _watcher_thread.is_alive():
+        return
+    check_for_changes()  # Establish the baseline before serving requests
+    _watcher_stop.clear()
+    _watcher_thread = threading.Thread(target=_watch, name="shared-state-watcher", daemon=True)
+    _watcher_thread.start()
+    logger.info("Shared state watcher started.")
+
+def stop_watcher() -> None:
+    """Stops the watcher thread."""
+    _watcher_stop.set()
+    if _watcher_thread:
+        _watcher_thread.join(timeout=STATE_POLL_INTERVAL_SECONDS * 2)
+    logger.info("Shared state watcher stopped.")
@@ -1,28 +1,135 @@
 # backend/sqlite_config.py
 
 import sqlite3
+import sys
+import threading
+import time
 from contextlib import contextmanager
 from logger import get_logger
+import metrics
+import profiling
 
 logger = get_logger(__name__)
 
 SQLITE_DB_PATH = "building_schedules.db"
 
+# --- Connection Pool Settings ---
+SQLITE_BUSY_TIMEOUT_SECONDS = 30
+SQLITE_CACHE_SIZE_KIB = 8192      # Page cache per connection (negative PRAGMA value = KiB)
+SQLITE_CACHED_STATEMENTS = 256    # Prepared statements kept per connection
+
+# One long-lived connection per thread. Each connection keeps its own cache of
+# prepared statements, so the constant SQL strings below are compiled once
+# per thread instead of once per call.
+_thread_local = threading.local()
+_connections = []  # (thread, connection) pairs, so they can be closed on shutdown
+_connections_lock = threading.Lock()
+
+# Outermost get_sqlite_connection() blocks are timed, commit included, and
+# labelled with the function that opened them.
+_transaction_seconds = metrics.histogram(
+    "sqlite_transaction_duration_seconds",
+    "SQLite transaction latency, including the commit.",
+    ("site",)
+)
+
+
+def _create_connection() -> sqlite3.Connection:
+    """Opens a new connection with WAL journaling and tuned pragmas."""
+    # check_same_thread is disabled only so close_sqlite_connections() can
+    # close every connection at shutdown; each one is otherwise used only
+    # by the thread that created it.
+    conn = sqlite3.connect(
+        SQLITE_DB_PATH,
+        timeout=SQLITE_BUSY_TIMEOUT_SECONDS,
+        cached_statements=SQLITE_CACHED_STATEMENTS,
+        check_same_thread=False
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+def _get_thread_connection() -> sqlite3.Connection:
+    """Returns this thread's pooled connection, creating it on first use."""
+    conn = getattr(_thread_local, "conn", None)
+    if conn is not None:
+        return conn
+
+    conn = _create_connection()
+    _thread_local.conn = conn
+    _thread_local.depth = 0
+
+    with _connections_lock:
+        # Close connections left behind by threads that have exited.
+        for thread, old_conn in [c for c in _connections if not c[0].is_alive()]:
+            try:
+                old_conn.close()
+            except sqlite3.Error:
+                pass
+            _connections.remove((thread, old_conn))
+        _connections.append((threading.current_thread(), conn))
+
+    logger.debug(f"Opened pooled SQLite connection for thread {threading.current_thread().name}")
+    return conn
+
+def close_sqlite_connections():
+    """
+    Closes the pooled connections of the calling thread and of threads that
+    have exited. Called once on application shutdown, after the background
+    threads were stopped; a thread that is still running keeps its
+    connection, since closing it could break a transaction in progress.
+    """
+    current = threading.current_thread()
+    with _connections_lock:
+        closable = [c for c in _connections if c[0] is current or not c[0].is_alive()]
+        for entry in closable:
+            try:
+                entry[1].close()
+            except sqlite3.Error as e:
+                logger.error(f"Error closing SQLite connection: {e}")
+            _connections.remove(entry)
+        still_open = [thread.name for thread, _ in _connections]
+    _thread_local.__dict__.clear()
+    logger.info(f"Closed {len(closable)} pooled SQLite connections.")
+    if still_open:
+        logger.info(f"Left {len(still_open)} SQLite connections open for running threads: {still_open}")
+
 @contextmanager
 def get_sqlite_connection():
-    """Context manager for SQLite database connections."""
-    conn = sqlite3.connect(SQLITE_DB_PATH)
-    conn.row_factory = sqlite3.Row
+    """
+    Context manager for SQLite database connections.
+
+    Yields the calling thread's pooled connection. The outermost block
+    commits on success and rolls back on error; nested blocks share the
+    same transaction.
+    """
+    conn = _get_thread_connection()
+    _thread_local.depth += 1
+    outermost = _thread_local.depth == 1
+    if outermost:
+        # Frame 1 is contextlib's __enter__; frame 2 is the with statement.
+        site = sys._getframe(2).f_code.co_name
+        started = time.perf_counter()
+        profile_span = profiling.span("sqlite", site=site)
+        profile_span.__enter__()
     try:
         yield conn
     except Exception as e:
-        conn.rollback()
+        if outermost:
+            conn.rollback()
         logger.error(f"SQLite transaction error: {e}")
         raise
     else:
-        conn.commit()
+        if outermost:
+            conn.commit()
     finally:
-        conn.close()
+        _thread_local.depth -= 1
+        if outermost:
+            profile_span.__exit__(None, None, None)
+            _transaction_seconds.labels(site).observe(time.perf_counter() - started)
 
 # --- Building Schedule Functions ---
 
@@ -35,9 +142,31 @@ def get_building_time(building_id: int) -> dict | None:
         row = cursor.fetchone()
         return dict(row) if row else None
 
+def minute_of_day(text: str | None) -> int | None:
+    """'HH:MM' -> minutes since midnight, or None if it isn't a valid time."""
+    try:
+        hours, minutes = (int(part) for part in text.split(":"))
+    except (AttributeError, ValueError):
+        return None
+    if 0 <= hours < 24 and 0 <= minutes < 60:
+        return hours * 60 + minutes
+    return None
+
+def format_minute(minute: int) -> str:
+    """Minutes since midnight -> 'HH:MM'."""
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+def _replace_building_windows(conn, building_id: int, windows: list[tuple]) -> None:
+    conn.execute("DELETE FROM building_schedule_windows WHERE building_id = ?", (building_id,))
+    conn.executemany("""
+        INSERT INTO building_schedule_windows (building_id, weekday, start_minute, end_minute)
+        VALUES (?, ?, ?, ?)
+    """, [(building_id, weekday, start, end) for weekday, start, end in windows])
+
 def set_building_time(building_id: int, start_time: str, end_time: str | None) -> bool:
     """
     UPDATED: Ensures start and end times are correctly inserted or updated.
+    The building's schedule windows are replaced by one everyday window.
     """
     try:
         with get_sqlite_connection() as conn:
@@ -60,11 +189,48 @@ def set_building_time(building_id: int, start_time: str, end_time: str | None) -
                     VALUES (?, ?, ?)
                 """, (building_id, start_time, end_time))
                 logger.info(f"Inserted new schedule for building {building_id}: {start_time} - {end_time}")
+
+            start_minute, end_minute = minute_of_day(start_time), minute_of_day(end_time)
+            windows = [(None, start_minute, end_minute)] if None not in (start_minute, end_minute) else []
+            _replace_building_windows(conn, building_id, windows)
         return True
     except Exception as e:
         logger.error(f"Error setting building time for ID {building_id}: {e}")
         return False
 
+def set_building_windows(building_id: int, windows: list[tuple]) -> bool:
+    """
+    Replaces a building's schedule with (weekday or None, start_minute,
+    end_minute) windows. building_times keeps the first window as the
+    building's "HH:MM" schedule for callers that only know one window.
+    """
+    try:
+        with get_sqlite_connection() as conn:
+            _replace_building_windows(conn, building_id, windows)
+            if windows:
+                _, start, end = windows[0]
+                conn.execute("""
+                    INSERT INTO building_times (building_id, start_time, end_time) VALUES (?, ?, ?)
+                    ON CONFLICT(building_id) DO UPDATE SET
+                        start_time = excluded.start_time, end_time = excluded.end_time
+                """, (building_id, format_minute(start), format_minute(end)))
+            else:
+                conn.execute("DELETE FROM building_times WHERE building_id = ?", (building_id,))
+        logger.info(f"Set {len(windows)} schedule windows for building {building_id}")
+        return True
+    except Exception as e:
+        logger.error(f"Error setting schedule windows for building {building_id}: {e}")
+        return False
+
+def get_all_schedule_windows() -> list[tuple]:
+    """Returns every schedule window as (building_id, weekday or None, start_minute, end_minute)."""
+    with get_sqlite_connection() as conn:
+        rows = conn.execute("""
+            SELECT building_id, weekday, start_minute, end_minute
+            FROM building_schedule_windows
+            ORDER BY building_id, id
+        """).fetchall()
+    return [tuple(row) for row in rows]
 
 def get_all_building_times() -> dict:
     """
@@ -78,21 +244,18 @@ def get_all_building_times() -> dict:
 
 # --- Ignored ProEvent Functions ---
 
-# --- THIS IS THE FIX ---
 def get_ignored_proevents() -> dict:
     """
-    UPDATED: Fetches all required columns, including 'building_frk',
+    Fetches all required columns, including 'building_frk',
     so the logic in the services layer can correctly filter by building.
+    Prefer the per-building functions below when only one building is needed.
     """
     with get_sqlite_connection() as conn:
-        # 1. MODIFIED: Added 'building_frk' to the SELECT statement
         cursor = conn.execute("""
             SELECT proevent_id, building_frk, ignore_on_arm, ignore_on_disarm 
             FROM ignored_proevents
         """)
         rows = cursor.fetchall()
-        print(rows)
-        # 2. MODIFIED: Added 'building_frk' to the returned dictionary
         if not rows:
             return {}
             
@@ -103,9 +266,7 @@ def get_ignored_proevents() -> dict:
                 "ignore_on_disarm": bool(row["ignore_on_disarm"])
             } 
             for row in rows
-
         }
-# --- END OF FIX ---
 
 def set_proevent_ignore_status(proevent_id: int, building_frk: int, device_prk: int, ignore_on_arm: bool, ignore_on_disarm: bool) -> bool:
     """Set the ignore status for a specific proevent."""
@@ -126,6 +287,31 @@ def set_proevent_ignore_status(proevent_id: int, building_frk: int, device_prk:
         logger.error(f"Error setting ignore status for ProEvent ID {proevent_id}: {e}")
         return False
 
+def set_proevent_ignore_status_bulk(items: list[dict]) -> int:
+    """
+    Sets the ignore status for many proevents in a single transaction.
+    Each item needs 'proevent_id', 'building_frk', 'device_prk',
+    'ignore_on_arm' and 'ignore_on_disarm'. Returns the number of items written.
+    """
+    if not items:
+        return 0
+    try:
+        with get_sqlite_connection() as conn:
+            conn.executemany("""
+                INSERT INTO ignored_proevents (proevent_id, building_frk, device_prk, ignore_on_arm, ignore_on_disarm)
+                VALUES (:proevent_id, :building_frk, :device_prk, :ignore_on_arm, :ignore_on_disarm)
+                ON CONFLICT(proevent_id) DO UPDATE SET
+                    building_frk = excluded.building_frk,
+                    device_prk = excluded.device_prk,
+                    ignore_on_arm = excluded.ignore_on_arm,
+                    ignore_on_disarm = excluded.ignore_on_disarm
+            """, items)
+        logger.info(f"Updated ignore status for {len(items)} ProEvents in one transaction")
+        return len(items)
+    except Exception as e:
+        logger.error(f"Error setting ignore status for {len(items)} ProEvents: {e}")
+        raise
+
 # --- ProEvent History Logging ---
 
 def log_proevent_state(proevent_id: int, building_frk: int, state: str) -> bool:
@@ -140,4 +326,40 @@ def log_proevent_state(proevent_id: int, building_frk: int, state: str) -> bool:
         return True
     except Exception as e:
         logger.error(f"Error logging ProEvent state for ID {proevent_id}: {e}")
-        return False
\ No newline at end of file
+        return False
+
+def log_proevent_states(records: list[tuple]) -> int:
+    """
+    Logs many ProEvent state changes in a single transaction.
+    Each record is a (proevent_id, building_frk, state, timestamp) tuple,
+    with the timestamp as UTC 'YYYY-MM-DD HH:MM:SS' like CURRENT_TIMESTAMP.
+    Returns the number of rows inserted.
+    """
+    if not records:
+        return 0
+    try:
+        with get_sqlite_connection() as conn:
+            conn.executemany(
+                "INSERT INTO proevent_state_history (proevent_id, building_frk, state, timestamp) VALUES (?, ?, ?, ?)",
+                records
+            )
+        logger.debug(f"Logged {len(records)} ProEvent state changes")
+        return len(records)
+    except Exception as e:
+        logger.error(f"Error logging {len(records)} ProEvent states: {e}")
+        raise
+
+def get_proevent_state_history(building_id: int, limit: int = 100) -> list[dict]:
+    """
+    Returns the most recent state changes for a building, newest first.
+    Uses the idx_proevent_state_history_building index.
+    """
+    with get_sqlite_connection() as conn:
+        cursor = conn.execute("""
+            SELECT proevent_id, building_frk, state, timestamp
+            FROM proevent_state_history
+            WHERE building_frk = ?
+            ORDER BY timestamp DESC
+            LIMIT ?
+        """, (building_id, limit))
+        return [dict(row) for row in cursor.fetchall()]
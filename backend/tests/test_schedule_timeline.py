@@ -0,0 +1,76 @@
+from datetime import datetime
+
+from services.schedule_timeline import ScheduleTimeline
+
+
+class _Schedules:
+    """Stands in for a ScheduleTable: only windows() is used by the timeline."""
+
+    def __init__(self, windows):
+        self._windows = windows
+
+    def windows(self):
+        return list(self._windows)
+
+
+MONDAY = datetime(2026, 10, 12)  # a Monday
+
+
+def _timeline(windows, after):
+    timeline = ScheduleTimeline()
+    timeline.rebuild(_Schedules(windows), after=after)
+    return timeline
+
+
+def test_every_day_and_weekday_windows_starting_at_the_same_minute():
+    # Every day 09:00-17:00 plus Monday 09:00-10:00: the two start
+    # transitions tie on everything but the weekday (None vs 0).
+    timeline = _timeline([(1, None, 9 * 60, 17 * 60), (1, 0, 9 * 60, 10 * 60)],
+                         after=MONDAY.replace(hour=8))
+    assert len(timeline) == 4
+
+    due = timeline.pop_due(MONDAY.replace(hour=9))
+    assert [t.kind for t in due] == ["start", "start"]
+    assert {t.weekday for t in due} == {None, 0}
+    # Both were rescheduled rather than lost.
+    assert len(timeline) == 4
+
+    due = timeline.pop_due(MONDAY.replace(hour=17))
+    assert [(t.kind, t.minute) for t in due] == [("end", 10 * 60), ("end", 17 * 60)]
+    assert len(timeline) == 4
+    # The every-day start comes back tomorrow, the Monday one next week.
+    assert timeline.next_time() == datetime(2026, 10, 13, 9, 0)
+
+
+def test_identical_ends_at_the_same_minute():
+    timeline = _timeline([(1, None, 8 * 60, 17 * 60), (1, 2, 12 * 60, 17 * 60)],
+                         after=datetime(2026, 10, 14, 16))  # Wednesday
+    due = timeline.pop_due(datetime(2026, 10, 14, 17))
+    assert [t.kind for t in due] == ["end", "end"]
+    assert len(timeline) == 4
+
+
+def test_overnight_every_day_window():
+    timeline = _timeline([(1, None, 22 * 60, 6 * 60)], after=MONDAY.replace(hour=12))
+    assert timeline.next_time() == MONDAY.replace(hour=22)
+
+    assert [t.kind for t in timeline.pop_due(MONDAY.replace(hour=22))] == ["start"]
+    assert timeline.next_time() == datetime(2026, 10, 13, 6, 0)
+    assert [t.kind for t in timeline.pop_due(datetime(2026, 10, 13, 6, 0))] == ["end"]
+    assert timeline.next_time() == datetime(2026, 10, 13, 22, 0)
+
+
+def test_overnight_weekday_window_ends_on_the_next_day():
+    # Sunday 22:00 - 06:00 ends on Monday morning.
+    timeline = _timeline([(1, 6, 22 * 60, 6 * 60)], after=MONDAY.replace(hour=12))
+    due = timeline.pop_due(datetime(2026, 10, 18, 22, 0))
+    assert [(t.kind, t.weekday) for t in due] == [("start", 6)]
+    due = timeline.pop_due(datetime(2026, 10, 19, 6, 0))
+    assert [(t.kind, t.weekday) for t in due] == [("end", 0)]
+    assert timeline.next_time() == datetime(2026, 10, 25, 22, 0)
+
+
+def test_missed_transitions_after_the_rebuild_point_are_due():
+    timeline = _timeline([(1, None, 9 * 60, 17 * 60)], after=MONDAY.replace(hour=8, minute=55))
+    due = timeline.pop_due(MONDAY.replace(hour=9, minute=5))
+    assert [(t.kind, t.when) for t in due] == [("start", MONDAY.replace(hour=9))]
@@ -35,6 +35,7 @@ const App = {
         // Setup event listeners and load initial data
         this.setupBuildingSelector();
         this.loadAllBuildings();
+        this.connectLiveUpdates();
     },
 
     // 4. Utility Methods (Child Functions)
@@ -189,6 +190,7 @@ const App = {
                 </div>
                 <ul class="items-list"></ul>
                 <div class="building-loader" style="display:none;">Loading...</div>
+                <div class="items-sentinel"></div>
             </div>
         `;
         this.setupBuildingCardEvents(card);
@@ -260,28 +262,75 @@ const App = {
             e.stopPropagation();
             this.showIgnoreSelectionModal(card.dataset.buildingId, 'disarm');
         });
+
+        // Infinite scroll: fetch the next page when the end of the list comes into view
+        const sentinel = card.querySelector('.items-sentinel');
+        const observer = new IntersectionObserver((entries) => {
+            if (entries[0].isIntersecting && itemsList.children.length > 0) {
+                this.loadItemsForBuilding(card);
+            }
+        }, { rootMargin: '200px' });
+        observer.observe(sentinel);
     },
 
     // 7. Item/Device Logic
     
+    // Loads the next page of a building's proevents. Pages are fetched with a
+    // cursor, so earlier pages are never re-fetched while scrolling. With
+    // reset (or an empty list) it starts again from the first page.
     async loadItemsForBuilding(card, reset = false, search = '') {
         const buildingId = card.dataset.buildingId;
         const itemsList = card.querySelector('.items-list');
         const loader = card.querySelector('.building-loader');
 
-        if (reset) itemsList.innerHTML = '';
+        if (reset || itemsList.children.length === 0) {
+            itemsList.innerHTML = '';
+            card.dataset.search = search;
+            card.dataset.nextCursor = '';
+            card.dataset.hasMore = 'true';
+        } else if (card.dataset.loading === 'true' || card.dataset.hasMore !== 'true') {
+            return;
+        }
+
+        // A newer load (e.g. a changed search) makes this one's result stale
+        const requestId = String(Number(card.dataset.requestId || 0) + 1);
+        card.dataset.requestId = requestId;
+        card.dataset.loading = 'true';
         loader.style.display = 'block';
 
+        let query = `devices/page?building=${buildingId}&limit=${this.BUILD_PAGE_SIZE}`
+            + `&search=${encodeURIComponent(card.dataset.search)}`;
+        if (card.dataset.nextCursor) query += `&cursor=${encodeURIComponent(card.dataset.nextCursor)}`;
+
         try {
-            const items = await this.apiRequest(`devices?building=${buildingId}&limit=${this.BUILD_PAGE_SIZE}&search=${encodeURIComponent(search)}`);
-            if (items.length === 0 && reset) {
+            const page = await this.apiRequest(query);
+            if (card.dataset.requestId !== requestId) return;
+
+            card.dataset.nextCursor = page.next_cursor || '';
+            card.dataset.hasMore = page.next_cursor ? 'true' : 'false';
+            if (page.items.length === 0 && itemsList.children.length === 0) {
                 itemsList.innerHTML = '<li class="muted">No proevents found.</li>';
             } else {
-                items.forEach(item => itemsList.appendChild(this.createItem(item)));
+                const fragment = document.createDocumentFragment();
+                page.items.forEach(item => fragment.appendChild(this.createItem(item)));
+                itemsList.appendChild(fragment);
             }
+        } catch (error) {
+            // apiRequest has already notified the user; stop paging until the next reset
+            if (card.dataset.requestId === requestId) card.dataset.hasMore = 'false';
         } finally {
-            loader.style.display = 'none';
-            this.updateBuildingStatus(card);
+            if (card.dataset.requestId === requestId) {
+                card.dataset.loading = 'false';
+                loader.style.display = 'none';
+                this.updateBuildingStatus(card);
+                // The observer only fires on changes, so keep filling while the end is still on screen
+                const sentinel = card.querySelector('.items-sentinel');
+                const endVisible = sentinel.offsetParent !== null
+                    && sentinel.getBoundingClientRect().top < window.innerHeight + 200;
+                if (card.dataset.hasMore === 'true' && endVisible) {
+                    this.loadItemsForBuilding(card);
+                }
+            }
         }
     },
 
@@ -325,7 +374,69 @@ const App = {
         }
     },
 
-    // 8. Modal Logic
+    // 8. Live Updates
+    
+    // Subscribes to the server's event stream and patches only the cards an
+    // event is about. EventSource reconnects by itself; events sent while
+    // disconnected are lost, so a reconnect (or a 'resync') reloads the
+    // cards that are open.
+    connectLiveUpdates() {
+        const source = new EventSource(`${this.API_BASE_URL}/events`);
+        let disconnected = false;
+
+        source.onerror = () => { disconnected = true; };
+        source.onopen = () => {
+            if (disconnected) {
+                disconnected = false;
+                this.refreshOpenCards();
+            }
+        };
+
+        source.addEventListener('building_state', (e) => {
+            const { building_ids } = JSON.parse(e.data);
+            building_ids.forEach(id => this.refreshCard(id));
+        });
+
+        source.addEventListener('schedule', (e) => {
+            const { building_id, start_time, end_time } = JSON.parse(e.data);
+            const building = this.allBuildings.find(b => b.id === building_id);
+            if (building) Object.assign(building, { start_time, end_time });
+            const card = this.findCard(building_id);
+            if (!card) return;
+            const startInput = card.querySelector('.start-time-input');
+            const endInput = card.querySelector('.end-time-input');
+            // Don't overwrite times the operator is editing
+            if (start_time && document.activeElement !== startInput) startInput.value = start_time;
+            if (end_time && document.activeElement !== endInput) endInput.value = end_time;
+        });
+
+        // Events from other server processes can arrive a moment after local
+        // ones, so read the current status rather than trusting the payload.
+        source.addEventListener('panel_status', async () => {
+            const { armed } = await this.apiRequest('panel_status');
+            this.showNotification(`Panel is now ${armed ? 'armed' : 'disarmed'}.`);
+        });
+
+        source.addEventListener('resync', () => this.refreshOpenCards());
+    },
+
+    findCard(buildingId) {
+        return document.querySelector(`.building-card[data-building-id='${buildingId}']`);
+    },
+
+    // Reloads a card's proevents if they have been loaded; collapsed cards
+    // that were never opened have nothing to patch.
+    refreshCard(buildingId) {
+        const card = this.findCard(buildingId);
+        if (!card || card.querySelector('.items-list').children.length === 0) return;
+        this.loadItemsForBuilding(card, true, card.dataset.search || '');
+    },
+
+    refreshOpenCards() {
+        document.querySelectorAll('.building-card').forEach(card => this.refreshCard(card.dataset.buildingId));
+    },
+
+    // 9. Modal Logic
     
     async showIgnoreSelectionModal(buildingId, action) {
         const { 
@@ -346,6 +457,7 @@ const App = {
             const div = document.createElement('div');
             div.className = 'device-item';
             div.dataset.itemId = item.id;
+            div.dataset.ignored = item.is_ignored ? 'true' : 'false';
             
             div.innerHTML = `
                 <div class="device-name">${this.escapeHtml(item.name)}</div>
@@ -381,14 +493,16 @@ const App = {
 
         // --- **** THIS IS THE MODIFIED FUNCTION **** ---
         modalConfirmBtn.onclick = async () => {
-            const selectedItems = [];
+            // Send only the items whose checkbox changed.
+            const changedItems = [];
             const itemElements = modalItemList.querySelectorAll('.device-item');
             
             itemElements.forEach(itemEl => {
                 const checkbox = itemEl.querySelector('.ignore-item-checkbox');
+                if (checkbox.checked === (itemEl.dataset.ignored === 'true')) return;
                 const itemId = parseInt(itemEl.dataset.itemId, 10);
                 
-                selectedItems.push({
+                changedItems.push({
                     item_id: itemId,
                     building_frk: parseInt(buildingId),
                     device_prk: itemId, 
@@ -396,24 +510,22 @@ const App = {
                 });
             });
 
+            if (changedItems.length === 0) {
+                closeModal();
+                return;
+            }
+
             try {
-                // 1. Save the new ignore settings
+                // 1. Save the changes and re-evaluate the building in one request
                 await this.apiRequest('proevents/ignore/bulk', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ items: selectedItems })
-                });
-                this.showNotification('Ignore settings saved. Applying changes...');
-                
-                // 2. Call the new endpoint to re-evaluate the building state
-                // This runs the backend logic using the new rules.
-                await this.apiRequest(`buildings/${buildingId}/reevaluate`, {
-                    method: 'POST'
+                    body: JSON.stringify({ items: changedItems, reevaluate: true })
                 });
                 this.showNotification('Changes applied successfully.');
 
-                // 3. Refresh the building view
-                const card = document.querySelector(`.building-card[data-building-id='${buildingId}']`);
+                // 2. Refresh the building view
+                const card = this.findCard(buildingId);
                 if (card) {
                     const itemSearch = card.querySelector('.item-search');
                     this.loadItemsForBuilding(card, true, itemSearch.value.trim());